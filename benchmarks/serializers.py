@@ -0,0 +1,151 @@
+"""
+Compare the size and speed of the serializers for stored panel data.
+
+The payloads mimic the data recorded by the SQL, templates and profiling
+panels for a busy request. Run from the repository root with::
+
+    python -m benchmarks.serializers
+"""
+
+import argparse
+import functools
+import random
+import timeit
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(INSTALLED_APPS=["debug_toolbar"], STATIC_URL="static/")
+    django.setup()
+
+from debug_toolbar import store
+
+SERIALIZERS = [store.JSONSerializer, store.ZlibJSONSerializer]
+
+TABLES = ["auth_user", "blog_post", "blog_comment", "blog_tag", "django_session"]
+
+
+def stacktrace(depth):
+    return [
+        (
+            f"/srv/app/{module}.py",
+            random.randint(1, 500),
+            f"func_{module}",
+            f"result = {module}.objects.filter(pk=pk).first()",
+            None,
+        )
+        for module in random.choices(["views", "models", "forms", "utils"], k=depth)
+    ]
+
+
+def sql_payload(count):
+    queries = []
+    for i in range(count):
+        table = random.choice(TABLES)
+        raw_sql = (
+            f'SELECT "{table}"."id", "{table}"."name" FROM "{table}" '
+            f'WHERE "{table}"."id" = %s'
+        )
+        queries.append(
+            {
+                "vendor": "postgresql",
+                "alias": "default",
+                "sql": raw_sql.replace("%s", str(i)),
+                "duration": random.random() * 10,
+                "raw_sql": raw_sql,
+                "params": f"[{i}]",
+                "stacktrace": stacktrace(12),
+                "template_info": None,
+                "djdt_query_id": f"{random.getrandbits(128):032x}",
+                "start_time": random.random(),
+                "end_time": random.random(),
+                "is_select": True,
+                "rgb_color": [random.randint(0, 255) for _ in range(3)],
+            }
+        )
+    return {"queries": queries, "sql_time": 123.4, "databases": [["default", {}]]}
+
+
+def templates_payload(count):
+    return {
+        "templates": [
+            {
+                "template": {
+                    "name": f"blog/post_{i}.html",
+                    "origin_name": f"/srv/app/templates/blog/post_{i}.html",
+                    "origin_hash": f"{random.getrandbits(256):064x}",
+                },
+                "context": "\n".join(
+                    f"{{'post': <Post: {j}>, 'user': <User: admin>, 'csrf_token': "
+                    f"'{random.getrandbits(128):032x}'}}"
+                    for j in range(5)
+                ),
+            }
+            for i in range(count)
+        ],
+        "template_dirs": ["/srv/app/templates"],
+        "context_processors": {
+            "django.template.context_processors.request": "{'request': <WSGIRequest>}"
+        },
+    }
+
+
+def profiling_payload(count):
+    return {
+        "func_list": [
+            {
+                "has_subfuncs": True,
+                "id": i,
+                "parent_ids": list(range(i % 10)),
+                "is_project_func": i % 3 == 0,
+                "indent": (i % 10) * 16,
+                "func_std_string": f"/srv/app/views.py:{i}(view_{i})",
+                "cumtime": random.random(),
+                "cumtime_per_call": random.random(),
+                "tottime": random.random(),
+                "tottime_per_call": random.random(),
+                "count": random.randint(1, 100),
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def run(payloads, number):
+    print(f"{'payload':<12}{'serializer':<22}{'size':>12}{'encode':>12}{'decode':>12}")
+    for name, payload in payloads.items():
+        for serializer in SERIALIZERS:
+            data = serializer.dumps(payload)
+            encode = timeit.timeit(
+                functools.partial(serializer.dumps, payload), number=number
+            )
+            decode = timeit.timeit(
+                functools.partial(serializer.loads, data), number=number
+            )
+            print(
+                f"{name:<12}{serializer.__name__:<22}{len(data):>12,}"
+                f"{encode / number * 1000:>10.2f}ms{decode / number * 1000:>10.2f}ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--templates", type=int, default=100)
+    parser.add_argument("--functions", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=10)
+    args = parser.parse_args()
+    random.seed(0)
+    run(
+        {
+            "sql": sql_payload(args.queries),
+            "templates": templates_payload(args.templates),
+            "profiling": profiling_payload(args.functions),
+        },
+        args.number,
+    )
+
+
+if __name__ == "__main__":
+    main()
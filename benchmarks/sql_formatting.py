@@ -0,0 +1,112 @@
+"""
+Measure how long the SQL panel takes to format the queries of a request.
+
+Each panel holds a mix of repeated queries that only differ in their
+parameters, as made by an N+1 loop, and occasional long queries with large
+``IN`` lists. The queries are formatted with the format cache disabled, with
+a cold cache and with a warm one, as on the next request. Run from the
+repository root with::
+
+    python -m benchmarks.sql_formatting
+"""
+
+import argparse
+import time
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(INSTALLED_APPS=["debug_toolbar"], STATIC_URL="static/")
+    django.setup()
+
+from django.test.utils import override_settings
+
+from debug_toolbar.panels.sql.utils import _format_cache, reformat_query_sql
+
+SHAPES = [
+    (
+        'SELECT "auth_user"."id", "auth_user"."username", "auth_user"."email", '
+        '"auth_user"."is_staff" FROM "auth_user" WHERE "auth_user"."id" = %s '
+        "LIMIT 21"
+    ),
+    (
+        'SELECT "blog_post"."id", "blog_post"."title", "blog_post"."author_id", '
+        '"blog_post"."created" FROM "blog_post" INNER JOIN "auth_user" ON '
+        '("blog_post"."author_id" = "auth_user"."id") WHERE '
+        '("blog_post"."author_id" = %s AND "blog_post"."created" > %s) '
+        'ORDER BY "blog_post"."created" DESC'
+    ),
+    (
+        'SELECT COUNT(*) AS "__count" FROM "blog_comment" WHERE '
+        '"blog_comment"."post_id" = %s'
+    ),
+    (
+        'UPDATE "blog_post" SET "views" = ("blog_post"."views" + %s) WHERE '
+        '"blog_post"."id" = %s'
+    ),
+]
+
+
+def make_queries(count, in_size):
+    queries = []
+    for i in range(count):
+        if i % 50 == 49:
+            placeholders = ", ".join(["%s"] * in_size)
+            raw_sql = (
+                'SELECT "blog_tag"."id", "blog_tag"."name" FROM "blog_tag" '
+                f'WHERE "blog_tag"."post_id" IN ({placeholders})'
+            )
+            params = list(range(i, i + in_size))
+        else:
+            raw_sql = SHAPES[i % len(SHAPES)]
+            params = [i, "2024-01-01 00:00:00"][: raw_sql.count("%s")]
+        queries.append({"raw_sql": raw_sql, "params": params})
+    return queries
+
+
+def format_queries(queries):
+    start = time.perf_counter()
+    for query in queries:
+        reformat_query_sql(query, with_toggle=True)
+    return time.perf_counter() - start
+
+
+def run(sizes, in_size, cache_size):
+    print(f"{'queries':>10}{'uncached':>12}{'cold':>12}{'warm':>12}")
+    for count in sizes:
+        queries = make_queries(count, in_size)
+        with override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_FORMAT_CACHE_SIZE": 0}):
+            _format_cache.clear()
+            uncached = format_queries(queries)
+        config = {"SQL_FORMAT_CACHE_SIZE": cache_size}
+        with override_settings(DEBUG_TOOLBAR_CONFIG=config):
+            _format_cache.clear()
+            cold = format_queries(queries)
+            warm = format_queries(queries)
+        _format_cache.clear()
+        print(f"{count:>10,}{uncached:>11.2f}s{cold:>11.2f}s{warm:>11.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--queries",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 50000],
+        help="number of queries in each measured panel",
+    )
+    parser.add_argument(
+        "--in-size",
+        type=int,
+        default=200,
+        help="number of parameters in the IN lists of the long queries",
+    )
+    parser.add_argument("--cache-size", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.queries, args.in_size, args.cache_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure the per-query overhead of the SQL panel's cursor instrumentation.
+
+Queries run against an in-memory SQLite database, once through Django's own
+cursor and once with the SQL panel recording them. Run from the repository
+root with::
+
+    python -m benchmarks.sql_recording
+"""
+
+import argparse
+import functools
+import timeit
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=["debug_toolbar"],
+        STATIC_URL="static/",
+        DATABASES={
+            "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        },
+    )
+    django.setup()
+
+from django.db import connection
+from django.test.utils import override_settings
+
+from debug_toolbar.panels.sql import SQLPanel
+
+
+def run_queries(count):
+    for i in range(count):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT %s, %s", [i, "value"])
+            cursor.fetchone()
+
+
+def nested(depth, func, *args):
+    # Deepen the call stack to resemble a query made from a view.
+    if depth <= 0:
+        return func(*args)
+    return nested(depth - 1, func, *args)
+
+
+def measure(count, number, depth):
+    return min(
+        timeit.repeat(
+            functools.partial(nested, depth, run_queries, count),
+            number=1,
+            repeat=number,
+        )
+    )
+
+
+def run(count, number, stacktraces, depth):
+    baseline = measure(count, number, depth)
+    panel = SQLPanel(None, None)
+    # Record every query rather than summarizing those past SQL_MAX_QUERIES.
+    config = {"ENABLE_STACKTRACES": stacktraces, "SQL_MAX_QUERIES": None}
+    with override_settings(DEBUG_TOOLBAR_CONFIG=config):
+        panel.enable_instrumentation()
+        try:
+            recorded = measure(count, number, depth)
+        finally:
+            panel.disable_instrumentation()
+    overhead = (recorded - baseline) / count * 1_000_000
+    print(f"{'queries':<14}{count:>12,}")
+    print(f"{'baseline':<14}{baseline / count * 1_000_000:>10.1f}us")
+    print(f"{'instrumented':<14}{recorded / count * 1_000_000:>10.1f}us")
+    print(f"{'overhead':<14}{overhead:>10.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--number", type=int, default=5)
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=40,
+        help="number of extra frames on the stack when the queries run",
+    )
+    parser.add_argument(
+        "--no-stacktraces",
+        dest="stacktraces",
+        action="store_false",
+        help="measure the recording path without capturing stack traces",
+    )
+    parser.add_argument(
+        "--adaptive-stacktraces",
+        dest="stacktraces",
+        action="store_const",
+        const="adaptive",
+        help="capture stack traces in the adaptive mode",
+    )
+    args = parser.parse_args()
+    run(args.queries, args.number, args.stacktraces, args.depth)
+
+
+if __name__ == "__main__":
+    main()
@@ -304,4 +304,14 @@ def check_settings(app_configs, **kwargs):
                 id="debug_toolbar.W008",
             )
         )
+    page_size = dt_settings.get_config()["SQL_QUERIES_PAGE_SIZE"]
+    if page_size is not None and page_size < 1:
+        errors.append(
+            Warning(
+                "The SQL_QUERIES_PAGE_SIZE setting must be None or at least 1.",
+                hint="The SQL panel lists every query at once when it's "
+                "smaller than 1, as if it were None.",
+                id="debug_toolbar.W009",
+            )
+        )
     return errors
@@ -39,10 +39,19 @@ def require_show_toolbar(view):
 def render_with_toolbar_language(view):
     """Force any rendering within the view to use the toolbar's language."""
 
-    @functools.wraps(view)
-    def inner(request, *args, **kwargs):
-        lang = dt_settings.get_config()["TOOLBAR_LANGUAGE"] or get_language()
-        with language_override(lang):
-            return view(request, *args, **kwargs)
+    if iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def inner(request, *args, **kwargs):
+            lang = dt_settings.get_config()["TOOLBAR_LANGUAGE"] or get_language()
+            with language_override(lang):
+                return await view(request, *args, **kwargs)
+    else:
+
+        @functools.wraps(view)
+        def inner(request, *args, **kwargs):
+            lang = dt_settings.get_config()["TOOLBAR_LANGUAGE"] or get_language()
+            with language_override(lang):
+                return view(request, *args, **kwargs)
 
     return inner
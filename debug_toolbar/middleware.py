@@ -4,7 +4,9 @@ Debug Toolbar middleware
 
 import re
 import socket
+import uuid
 from collections.abc import Callable
+from contextvars import ContextVar
 from functools import cache
 
 from asgiref.sync import (
@@ -14,6 +16,8 @@ from asgiref.sync import (
     sync_to_async,
 )
 from django.conf import settings
+from django.core.signals import request_finished
+from django.dispatch import receiver
 from django.http import HttpRequest, HttpResponse
 from django.utils.module_loading import import_string
 
@@ -25,6 +29,12 @@ from debug_toolbar.utils import clear_stack_trace_caches, is_processable_html_re
 
 _HTML_TYPES = ("text/html", "application/xhtml+xml")
 
+# The toolbar of the request being handled, once its stats are stored. Its
+# panels are told when the response has been sent, see _stats_saved().
+_saved_toolbar: ContextVar[DebugToolbar | None] = ContextVar(
+    "djdt_saved_toolbar", default=None
+)
+
 
 def show_toolbar(request: HttpRequest) -> bool:
     """
@@ -105,6 +115,20 @@ def get_show_toolbar(async_mode) -> Callable:
     return show_toolbar
 
 
+@receiver(request_finished)
+def _stats_saved(**kwargs):
+    """
+    Let the panels act on their stored stats once the response is closed,
+    which happens after it has been sent to the client.
+    """
+    toolbar = _saved_toolbar.get()
+    if toolbar is None:
+        return
+    _saved_toolbar.set(None)
+    for panel in reversed(toolbar.enabled_panels):
+        panel.stats_saved()
+
+
 class DebugToolbarMiddleware:
     """
     Middleware to set up Debug Toolbar on incoming request and render toolbar
@@ -158,7 +182,10 @@ class DebugToolbarMiddleware:
             response = await self.get_response(request)
             return response
 
-        toolbar = DebugToolbar(request, self.get_response)
+        # Give the toolbar its request id up front, so that adding it to the
+        # store doesn't block the event loop.
+        toolbar = DebugToolbar(request, self.get_response, request_id=uuid.uuid4().hex)
+        await toolbar.store.aset(toolbar.request_id)
 
         # Activate instrumentation ie. monkey-patch.
         for panel in toolbar.enabled_panels:
@@ -176,7 +203,10 @@ class DebugToolbarMiddleware:
             for panel in reversed(toolbar.enabled_panels):
                 panel.disable_instrumentation()
 
-        return self._postprocess(request, response, toolbar)
+        self._generate_stats(request, response, toolbar)
+        await toolbar.asave_stats()
+        _saved_toolbar.set(toolbar)
+        return self._insert_toolbar(request, response, toolbar)
 
     def _postprocess(
         self, request: HttpRequest, response: HttpResponse, toolbar: DebugToolbar
@@ -184,12 +214,32 @@ class DebugToolbarMiddleware:
         """
         Post-process the response.
         """
-        # Generate the stats for all requests when the toolbar is being shown,
-        # but not necessarily inserted.
+        self._generate_stats(request, response, toolbar)
+        toolbar.save_stats()
+        _saved_toolbar.set(toolbar)
+        return self._insert_toolbar(request, response, toolbar)
+
+    @staticmethod
+    def _generate_stats(
+        request: HttpRequest, response: HttpResponse, toolbar: DebugToolbar
+    ):
+        """
+        Generate the stats for all requests when the toolbar is being shown,
+        but not necessarily inserted.
+
+        The stats of every panel must then be written to the store at once,
+        before rendering since panels may alter their stats for display.
+        """
         for panel in reversed(toolbar.enabled_panels):
             panel.generate_stats(request, response)
             panel.generate_server_timing(request, response)
 
+    def _insert_toolbar(
+        self, request: HttpRequest, response: HttpResponse, toolbar: DebugToolbar
+    ) -> HttpResponse:
+        """
+        Render the toolbar and insert it in the response.
+        """
         # Always render the toolbar for the history panel, even if it is not
         # included in the response.
         rendered = toolbar.render_toolbar()
@@ -0,0 +1,102 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_panel_data(apps, schema_editor):
+    HistoryEntry = apps.get_model("debug_toolbar", "HistoryEntry")
+    HistoryEntryBlob = apps.get_model("debug_toolbar", "HistoryEntryBlob")
+    HistoryEntryPanel = apps.get_model("debug_toolbar", "HistoryEntryPanel")
+    blobs = {}
+    panels = []
+    for entry in HistoryEntry.objects.iterator():
+        for panel_id, data in entry.data.items():
+            digest = hashlib.sha256(data.encode()).hexdigest()
+            blob = blobs.setdefault(
+                digest, HistoryEntryBlob(digest=digest, data=data, refs=0)
+            )
+            blob.refs += 1
+            panels.append(
+                HistoryEntryPanel(entry=entry, panel_id=panel_id, blob_id=digest)
+            )
+    HistoryEntryBlob.objects.bulk_create(blobs.values())
+    HistoryEntryPanel.objects.bulk_create(panels)
+
+
+def merge_panel_data(apps, schema_editor):
+    HistoryEntry = apps.get_model("debug_toolbar", "HistoryEntry")
+    HistoryEntryPanel = apps.get_model("debug_toolbar", "HistoryEntryPanel")
+    for entry in HistoryEntry.objects.iterator():
+        entry.data = dict(
+            HistoryEntryPanel.objects.filter(entry=entry).values_list(
+                "panel_id", "blob__data"
+            )
+        )
+        entry.save(update_fields=["data"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("debug_toolbar", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="historyentry",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name="HistoryEntryBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.TextField()),
+                ("refs", models.IntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "history entry blob",
+                "verbose_name_plural": "history entry blobs",
+            },
+        ),
+        migrations.CreateModel(
+            name="HistoryEntryPanel",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("panel_id", models.CharField(max_length=255)),
+                (
+                    "blob",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="panels",
+                        to="debug_toolbar.historyentryblob",
+                    ),
+                ),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="panels",
+                        to="debug_toolbar.historyentry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "history entry panel",
+                "verbose_name_plural": "history entry panels",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("entry", "panel_id"), name="djdt_unique_entry_panel"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(split_panel_data, merge_panel_data),
+        migrations.RemoveField(
+            model_name="historyentry",
+            name="data",
+        ),
+    ]
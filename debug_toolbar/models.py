@@ -4,8 +4,7 @@ from django.utils.translation import gettext_lazy as _
 
 class HistoryEntry(models.Model):
     request_id = models.UUIDField(primary_key=True)
-    data = models.JSONField(default=dict)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = _("history entry")
@@ -14,3 +13,44 @@ class HistoryEntry(models.Model):
 
     def __str__(self):
         return str(self.request_id)
+
+
+class HistoryEntryBlob(models.Model):
+    # The SHA-256 hex digest of the serialized panel data.
+    digest = models.CharField(max_length=64, primary_key=True)
+    # The serialized panel data, stored as is to avoid encoding it twice.
+    data = models.TextField()
+    # The number of panels referencing the data. It's deleted once unused.
+    refs = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("history entry blob")
+        verbose_name_plural = _("history entry blobs")
+
+    def __str__(self):
+        return self.digest
+
+
+class HistoryEntryPanel(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    entry = models.ForeignKey(
+        HistoryEntry, on_delete=models.CASCADE, related_name="panels"
+    )
+    panel_id = models.CharField(max_length=255)
+    # Panels with identical data, such as the settings panel of most requests,
+    # share a blob. Blobs are only deleted once no panel references them.
+    blob = models.ForeignKey(
+        HistoryEntryBlob, on_delete=models.DO_NOTHING, related_name="panels"
+    )
+
+    class Meta:
+        verbose_name = _("history entry panel")
+        verbose_name_plural = _("history entry panels")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entry", "panel_id"], name="djdt_unique_entry_panel"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id} {self.panel_id}"
@@ -185,16 +185,11 @@ class Panel:
         """
         Store data gathered by the panel. ``stats`` is a :class:`dict`.
 
-        Each call to ``record_stats`` updates the store's data for
-        the panel.
-
-        To support backwards compatibility, it will also update the
-        panel's statistics dictionary.
+        Each call to ``record_stats`` updates the panel's statistics
+        dictionary. The statistics of all panels are written to the store
+        together once the toolbar has finished processing the request.
         """
         self.toolbar.stats.setdefault(self.panel_id, {}).update(stats)
-        self.toolbar.store.save_panel(
-            self.toolbar.request_id, self.panel_id, self.toolbar.stats[self.panel_id]
-        )
 
     def get_stats(self):
         """
@@ -278,6 +273,16 @@ class Panel:
         Does not return a value.
         """
 
+    def stats_saved(self):
+        """
+        Start work on the panel's stored data, such as background processing.
+
+        Called once the stats of every panel have been written to the store
+        and the response has been sent, when Django closes it.
+
+        Does not return a value.
+        """
+
     def load_stats_from_store(self, data):
         """
         Instantiate the panel from serialized data.
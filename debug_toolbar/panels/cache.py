@@ -6,8 +6,18 @@ from django.conf import settings
 from django.core.cache import CacheHandler, caches
 from django.utils.translation import gettext_lazy as _, ngettext
 
+from debug_toolbar import settings as dt_settings
 from debug_toolbar.panels import Panel
-from debug_toolbar.utils import get_stack_trace, get_template_info, render_stacktrace
+from debug_toolbar.utils import (
+    AdaptiveStackTraces,
+    capture_stack_trace,
+    capture_template_info,
+    disable_template_tracking,
+    enable_template_tracking,
+    render_stacktrace,
+    resolve_stack_trace,
+    resolve_template_info,
+)
 
 # The order of the methods in this list determines the order in which they are listed in
 # the Commands table in the panel content.
@@ -73,6 +83,7 @@ class CachePanel(Panel):
         self.misses = 0
         self.calls = []
         self.counts = dict.fromkeys(WRAPPED_CACHE_METHODS, 0)
+        self._stack_traces = AdaptiveStackTraces()
 
     @classmethod
     def current_instance(cls):
@@ -135,7 +146,7 @@ class CachePanel(Panel):
                 "name": name,
                 "args": args,
                 "kwargs": kwargs,
-                "trace": render_stacktrace(trace),
+                "trace": trace,
                 "template_info": template_info,
                 "backend": backend,
             }
@@ -156,14 +167,19 @@ class CachePanel(Panel):
         finally:
             cache._djdt_panel = self
 
+        if dt_settings.get_config()["ENABLE_STACKTRACES"] == "adaptive":
+            # Only calls repeated from the same caller get a full stack trace.
+            trace = self._stack_traces.capture((alias, name), skip=2)
+        else:
+            trace = capture_stack_trace(skip=2)
         self._store_call_info(
             name=name,
             time_taken=t,
             return_value=value,
             args=args,
             kwargs=kwargs,
-            trace=get_stack_trace(skip=2),
-            template_info=get_template_info(),
+            trace=trace,
+            template_info=capture_template_info(),
             backend=f"{alias} ({type(cache).__name__})",
         )
         return value
@@ -203,12 +219,14 @@ class CachePanel(Panel):
         # context.  This will be used by the CacheHander.create_connection() monkey
         # patch.
         self._context_locals.current_instance = self
+        enable_template_tracking(self)
 
     def disable_instrumentation(self):
         if hasattr(self._context_locals, "current_instance"):
             del self._context_locals.current_instance
         for cache in caches.all(initialized_only=True):
             cache._djdt_panel = None
+        disable_template_tracking(self)
 
     def initialized_caches(self):
         """
@@ -222,6 +240,11 @@ class CachePanel(Panel):
                 yield caches[alias], alias
 
     def generate_stats(self, request, response):
+        # The stack traces and template information are captured cheaply while
+        # recording and only resolved once the response is done.
+        for call in self.calls:
+            call["trace"] = render_stacktrace(resolve_stack_trace(call["trace"]))
+            call["template_info"] = resolve_template_info(call["template_info"])
         self.record_stats(
             {
                 "total_calls": len(self.calls),
@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.http import HttpRequest, HttpResponseBadRequest, JsonResponse
 from django.template.loader import render_to_string
 
@@ -11,7 +12,7 @@ from debug_toolbar.toolbar import DebugToolbar
 @login_not_required
 @require_show_toolbar
 @render_with_toolbar_language
-def history_sidebar(
+async def history_sidebar(
     request: HttpRequest,
 ) -> HttpResponseBadRequest | JsonResponse:
     """Returns the selected debug toolbar history snapshot."""
@@ -19,33 +20,46 @@ def history_sidebar(
 
     if form.is_valid():
         request_id: str = form.cleaned_data["request_id"]
-        toolbar: DebugToolbar | None = DebugToolbar.fetch(request_id)
+        toolbar: DebugToolbar | None = await DebugToolbar.afetch(request_id)
         exclude_history = form.cleaned_data["exclude_history"]
         context: dict[str, dict[str, str]] = {}
         if toolbar is None:
             # When the request_id has been popped already due to
             # RESULTS_CACHE_SIZE
             return JsonResponse(context)
-        for panel in toolbar.panels:
-            if exclude_history and not panel.is_historical:
-                continue
-            panel_context = {"panel": panel}
-            context[panel.panel_id] = {
-                "button": render_to_string(
-                    "debug_toolbar/includes/panel_button.html", panel_context
-                ),
-                "content": render_to_string(
-                    "debug_toolbar/includes/panel_content.html", panel_context
-                ),
-            }
+        # Rendering the panels may run synchronous code, such as database
+        # queries.
+        await sync_to_async(_render_history_panels)(
+            toolbar, context, exclude_history=exclude_history
+        )
         return JsonResponse(context)
     return HttpResponseBadRequest(f"Form errors: {form.errors}")
 
 
+def _render_history_panels(
+    toolbar: DebugToolbar,
+    context: dict[str, dict[str, str]],
+    *,
+    exclude_history: bool,
+):
+    for panel in toolbar.panels:
+        if exclude_history and not panel.is_historical:
+            continue
+        panel_context = {"panel": panel}
+        context[panel.panel_id] = {
+            "button": render_to_string(
+                "debug_toolbar/includes/panel_button.html", panel_context
+            ),
+            "content": render_to_string(
+                "debug_toolbar/includes/panel_content.html", panel_context
+            ),
+        }
+
+
 @login_not_required
 @require_show_toolbar
 @render_with_toolbar_language
-def history_refresh(
+async def history_refresh(
     request: HttpRequest,
 ) -> HttpResponseBadRequest | JsonResponse:
     """Returns the refreshed list of table rows for the History Panel."""
@@ -53,9 +67,11 @@ def history_refresh(
 
     if form.is_valid():
         requests: list[dict[str, str]] = []
+        store = get_store()
         # Convert to list to handle mutations happening in parallel
-        for request_id in get_store().request_ids():
-            toolbar = DebugToolbar.fetch(request_id)
+        for request_id in await store.arequest_ids():
+            # Only the history panel's data is needed to render the row, so
+            # read it directly rather than loading every panel of the toolbar.
             requests.append(
                 {
                     "id": request_id,
@@ -64,7 +80,7 @@ def history_refresh(
                         {
                             "request_id": request_id,
                             "history_context": {
-                                "history_stats": toolbar.store.panel(
+                                "history_stats": await store.apanel(
                                     request_id, "HistoryPanel"
                                 ),
                                 "form": HistoryStoreForm(
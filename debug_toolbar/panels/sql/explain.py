@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DatabaseError, connections, transaction
+
+from debug_toolbar.store import get_store
+
+# The id under which the plans are stored next to the SQL panel's data. The
+# panel's data isn't rewritten, so a concurrent save of it can't be lost.
+PLANS_ID = "SQLPanel.plans"
+
+
+def get_explain_sql(vendor, sql, *, analyze=True):
+    """Return the statement explaining ``sql`` on the given database vendor."""
+    if vendor == "sqlite":
+        # SQLite's EXPLAIN dumps the low-level opcodes generated for a query;
+        # EXPLAIN QUERY PLAN dumps a more human-readable summary
+        # See https://www.sqlite.org/lang_explain.html for details
+        return f"EXPLAIN QUERY PLAN {sql}"
+    if vendor == "postgresql" and analyze:
+        return f"EXPLAIN ANALYZE {sql}"
+    return f"EXPLAIN {sql}"
+
+
+def is_select(sql):
+    return sql.lstrip().upper().startswith("SELECT")
+
+
+def collect_plans(queries):
+    """
+    Explain each of the recorded queries and return their plans, keyed by
+    query id. Queries that can't be explained are left out.
+    """
+    plans = {}
+    for query in queries:
+        alias = query["alias"]
+        vendor = query["vendor"]
+        try:
+            with transaction.atomic(using=alias):
+                with connections[alias].cursor() as cursor:
+                    if vendor == "postgresql":
+                        # EXPLAIN ANALYZE executes the query. A read-only
+                        # transaction that is rolled back keeps it from
+                        # writing anything.
+                        cursor.execute("SET TRANSACTION READ ONLY")
+                    cursor.execute(
+                        get_explain_sql(vendor, query["raw_sql"]), query["params"]
+                    )
+                    headers = [d[0] for d in cursor.description]
+                    result = [list(row) for row in cursor.fetchall()]
+                transaction.set_rollback(True, using=alias)
+        except DatabaseError:
+            continue
+        plans[query["djdt_query_id"]] = {"headers": headers, "result": result}
+    return plans
+
+
+def save_plans(request_id, plans):
+    """
+    Store the plans next to the SQL panel's data for the request. They're
+    dropped if the request has left the store in the meantime.
+    """
+    if plans:
+        get_store().update_panels(request_id, {PLANS_ID: plans})
+
+
+def _explain_queries(request_id, queries):
+    try:
+        save_plans(request_id, collect_plans(queries))
+    finally:
+        # Database connections are per thread and this one is done.
+        connections.close_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_explain_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="djdt-explain"
+            )
+        return _executor
+
+
+def schedule_explain(request_id, queries):
+    """Explain the queries on a worker thread and store their plans."""
+    return get_explain_executor().submit(_explain_queries, request_id, queries)
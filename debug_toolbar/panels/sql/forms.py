@@ -4,8 +4,9 @@ from django.db import connections
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
-from debug_toolbar.panels.sql.utils import reformat_sql
-from debug_toolbar.toolbar import DebugToolbar
+from debug_toolbar.panels.sql.explain import get_explain_sql
+from debug_toolbar.panels.sql.utils import reformat_query_sql
+from debug_toolbar.store import get_store
 
 
 class SQLSelectForm(forms.Form):
@@ -31,21 +32,19 @@ class SQLSelectForm(forms.Form):
         from debug_toolbar.panels.sql import SQLPanel
 
         cleaned_data = super().clean()
-        toolbar = DebugToolbar.fetch(
-            self.cleaned_data["request_id"], panel_id=SQLPanel.panel_id
-        )
-        if toolbar is None:
+        store = get_store()
+        request_id = self.cleaned_data["request_id"]
+        if not store.exists(request_id):
             raise ValidationError(_("Data for this panel isn't available anymore."))
 
-        panel = toolbar.get_panel_by_id(SQLPanel.panel_id)
         # Find the query for this form submission
-        query = None
-        for q in panel.get_stats()["queries"]:
-            if q["djdt_query_id"] != self.cleaned_data["djdt_query_id"]:
-                continue
-            else:
-                query = q
-                break
+        query = store.panel_record(
+            request_id,
+            SQLPanel.panel_id,
+            "queries",
+            self.cleaned_data["djdt_query_id"],
+            id_key="djdt_query_id",
+        )
         if not query:
             raise ValidationError(_("Invalid query id."))
         cleaned_data["query"] = query
@@ -72,15 +71,7 @@ class SQLSelectForm(forms.Form):
         params = query["params"]
         vendor = query["vendor"]
         with self.cursor as cursor:
-            if vendor == "sqlite":
-                # SQLite's EXPLAIN dumps the low-level opcodes generated for a query;
-                # EXPLAIN QUERY PLAN dumps a more human-readable summary
-                # See https://www.sqlite.org/lang_explain.html for details
-                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
-            elif vendor == "postgresql":
-                cursor.execute(f"EXPLAIN ANALYZE {sql}", params)
-            else:
-                cursor.execute(f"EXPLAIN {sql}", params)
+            cursor.execute(get_explain_sql(vendor, sql), params)
             headers = [d[0] for d in cursor.description]
             result = cursor.fetchall()
             return result, headers
@@ -112,7 +103,7 @@ class SQLSelectForm(forms.Form):
             return result, headers
 
     def reformat_sql(self):
-        return reformat_sql(self.cleaned_data["query"]["sql"], with_toggle=False)
+        return reformat_query_sql(self.cleaned_data["query"])
 
     @property
     def connection(self):
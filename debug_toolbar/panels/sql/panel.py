@@ -1,3 +1,8 @@
+import bisect
+import heapq
+import itertools
+import statistics
+import threading
 import uuid
 from collections import defaultdict
 
@@ -12,13 +17,24 @@ from debug_toolbar import settings as dt_settings
 from debug_toolbar.forms import SignedDataForm
 from debug_toolbar.panels import Panel
 from debug_toolbar.panels.sql import views
-from debug_toolbar.panels.sql.forms import SQLSelectForm
-from debug_toolbar.panels.sql.tracking import wrap_cursor
+from debug_toolbar.panels.sql.explain import PLANS_ID, is_select, schedule_explain
+from debug_toolbar.panels.sql.tracking import decode_param, wrap_cursor
 from debug_toolbar.panels.sql.utils import (
+    QueryColumns,
     contrasting_color_generator,
-    reformat_sql,
+    fingerprint_sql,
+    reformat_query_sql,
+)
+from debug_toolbar.utils import (
+    AdaptiveStackTraces,
+    StackTraceTree,
+    capture_stack_trace,
+    disable_template_tracking,
+    enable_template_tracking,
+    render_stacktrace,
+    resolve_stack_trace,
+    resolve_template_info,
 )
-from debug_toolbar.utils import render_stacktrace
 
 
 def get_isolation_level_display(vendor, level):
@@ -81,8 +97,15 @@ def get_transaction_status_display(vendor, level):
     return choices.get(level)
 
 
+def _decode_params(params):
+    try:
+        return decode_param(params)
+    except TypeError:
+        return None
+
+
 def _similar_query_key(query):
-    return query["raw_sql"]
+    return fingerprint_sql(query["raw_sql"])
 
 
 def _duplicate_query_key(query):
@@ -108,6 +131,345 @@ def _process_query_groups(query_groups, databases, colors, name):
         db_info[f"{name}_count"] = counts[alias]
 
 
+def _call_site(query):
+    """Return the innermost recorded stack frame as (file name, line number)."""
+    if not query["stacktrace"]:
+        return None
+    filename, line_no, *_ = query["stacktrace"][-1]
+    return (filename, line_no)
+
+
+def _process_fingerprints(query_groups, databases, n_plus_one_threshold):
+    """
+    Summarize each group of queries sharing a fingerprint and flag N+1 patterns:
+    the same fingerprint executed repeatedly from the same call site.
+    """
+    fingerprints = []
+    n_plus_one_counts = defaultdict(int)
+    for (alias, fingerprint), query_group in query_groups.items():
+        by_call_site = defaultdict(list)
+        for query in query_group:
+            by_call_site[_call_site(query)].append(query)
+        n_plus_one = []
+        for call_site, site_queries in by_call_site.items():
+            if call_site is None or len(site_queries) < n_plus_one_threshold:
+                continue
+            n_plus_one.append(
+                {
+                    "filename": call_site[0],
+                    "line": call_site[1],
+                    "count": len(site_queries),
+                }
+            )
+            for query in site_queries:
+                query["n_plus_one"] = True
+            n_plus_one_counts[alias] += len(site_queries)
+        durations = [query["duration"] for query in query_group]
+        fingerprints.append(
+            {
+                "alias": alias,
+                "fingerprint": fingerprint,
+                "count": len(query_group),
+                "total_time": sum(durations),
+                "p50_time": statistics.median(durations),
+                "max_time": max(durations),
+                "call_sites": len(by_call_site.keys() - {None}),
+                "n_plus_one": n_plus_one,
+            }
+        )
+    for alias, db_info in databases.items():
+        db_info["n_plus_one_count"] = n_plus_one_counts[alias]
+    fingerprints.sort(key=lambda fingerprint: -fingerprint["total_time"])
+    return fingerprints
+
+
+def _width_ratio(duration, sql_time):
+    try:
+        return (duration / sql_time) * 100
+    except ZeroDivisionError:
+        return 0
+
+
+def _annotate_queries(queries, databases, sql_time):
+    """
+    Compute the fields that depend on the other queries: their groups, their
+    offset in the timeline, transaction markers and N+1 warnings. The queries
+    and the databases' info are updated in place and the summary of the
+    queries' fingerprints is returned.
+    """
+    similar_query_groups = defaultdict(list)
+    duplicate_query_groups = defaultdict(list)
+    width_ratio_tally = 0
+    # the last query recorded for each DB alias
+    last_by_alias = {}
+    for query in queries:
+        alias = query["alias"]
+
+        similar_query_groups[(alias, _similar_query_key(query))].append(query)
+        duplicate_query_groups[(alias, _duplicate_query_key(query))].append(query)
+
+        trans_id = query.get("trans_id")
+        prev_query = last_by_alias.get(alias, {})
+        prev_trans_id = prev_query.get("trans_id")
+
+        # If two consecutive queries for a given DB alias have different
+        # transaction ID values, a transaction started, finished, or both, so
+        # annotate the queries as appropriate.
+        if trans_id != prev_trans_id:
+            if prev_trans_id is not None:
+                prev_query["ends_trans"] = True
+            if trans_id is not None:
+                query["starts_trans"] = True
+        if trans_id is not None:
+            query["in_trans"] = True
+
+        query["start_offset"] = width_ratio_tally
+        width_ratio_tally += _width_ratio(query["duration"], sql_time)
+
+        last_by_alias[alias] = query
+
+    # Close out any transactions that were in progress, since there is no
+    # explicit way to know when a transaction finishes.
+    for final_query in last_by_alias.values():
+        if final_query.get("trans_id") is not None:
+            final_query["ends_trans"] = True
+
+    group_colors = contrasting_color_generator()
+    _process_query_groups(similar_query_groups, databases, group_colors, "similar")
+    _process_query_groups(duplicate_query_groups, databases, group_colors, "duplicate")
+    return _process_fingerprints(
+        similar_query_groups,
+        databases,
+        dt_settings.get_config()["SQL_N_PLUS_ONE_THRESHOLD"],
+    )
+
+
+def _annotate_row(query, databases, sql_time):
+    """
+    Compute the fields used to render a query that only depend on the query
+    itself. The query is updated in place.
+    """
+    if query.get("iso_level") is not None:
+        query["iso_level"] = get_isolation_level_display(
+            query["vendor"], query["iso_level"]
+        )
+    if query.get("trans_status") is not None:
+        query["trans_status"] = get_transaction_status_display(
+            query["vendor"], query["trans_status"]
+        )
+    # The rows of collapsed duplicates are slow if any of their occurrences is.
+    query["is_slow"] = bool(query.get("is_slow")) or (
+        query["duration"] > dt_settings.get_config()["SQL_WARNING_THRESHOLD"]
+    )
+    query["rgb_color"] = databases[query["alias"]]["rgb_color"]
+    query["width_ratio"] = _width_ratio(query["duration"], sql_time)
+    query["end_offset"] = query["width_ratio"] + query["start_offset"]
+
+
+# The fields kept for each occurrence of a duplicated query when
+# SQL_COLLAPSE_DUPLICATES collapses it into its first occurrence. The other
+# fields are the same for every occurrence, or only kept for the first one.
+OCCURRENCE_FIELDS = (
+    "djdt_query_id",
+    "duration",
+    "stacktrace",
+    "trans_id",
+    "trans_status",
+)
+
+
+def _collapse_duplicates(queries):
+    """
+    Split the duplicated queries off the first occurrence of their SQL and
+    params.
+
+    Return the queries that remain and, for each first occurrence, the
+    ``OCCURRENCE_FIELDS`` of its duplicates, keyed by its query id.
+    """
+    remaining = QueryColumns()
+    duplicates = {}
+    first_ids = {}
+    for query in queries:
+        key = (query["alias"], _duplicate_query_key(query))
+        first_id = first_ids.get(key)
+        if first_id is None:
+            first_ids[key] = query["djdt_query_id"]
+            remaining.append(query)
+            continue
+        occurrences = duplicates.get(first_id)
+        if occurrences is None:
+            occurrences = duplicates[first_id] = {
+                field: [] for field in OCCURRENCE_FIELDS
+            }
+        for field in OCCURRENCE_FIELDS:
+            occurrences[field].append(query.get(field))
+    return remaining, duplicates
+
+
+def _expand_duplicates(queries, duplicates):
+    """
+    Return the queries with their collapsed duplicates restored, in the order
+    they were executed. Duplicates are marked with the id of their first
+    occurrence in ``duplicate_of``.
+    """
+    expanded = []
+    for query in queries:
+        expanded.append(query)
+        occurrences = duplicates.get(query["djdt_query_id"])
+        if occurrences is None:
+            continue
+        for values in zip(*occurrences.values(), strict=True):
+            expanded.append(
+                {
+                    **query,
+                    **dict(zip(occurrences.keys(), values, strict=True)),
+                    "template_info": None,
+                    "duplicate_of": query["djdt_query_id"],
+                }
+            )
+    expanded.sort(key=lambda query: int(query["djdt_query_id"]))
+    return expanded
+
+
+def _group_duplicates(queries):
+    """
+    Return one row per query, with the duplicates of a query collapsed into
+    its first occurrence along with their count and timings.
+    """
+    threshold = dt_settings.get_config()["SQL_WARNING_THRESHOLD"]
+    rows = []
+    occurrences = {}
+    for query in queries:
+        first_id = query.get("duplicate_of")
+        if first_id is None:
+            rows.append(query)
+            occurrences[query["djdt_query_id"]] = [query]
+        else:
+            occurrences[first_id].append(query)
+    for row in rows:
+        row_occurrences = occurrences[row["djdt_query_id"]]
+        if len(row_occurrences) == 1:
+            continue
+        total_time = sum(query["duration"] for query in row_occurrences)
+        row.update(
+            {
+                "occurrence_count": len(row_occurrences),
+                "total_time": total_time,
+                "avg_time": total_time / len(row_occurrences),
+                "is_slow": any(
+                    query["duration"] > threshold for query in row_occurrences
+                ),
+            }
+        )
+    return rows
+
+
+def _call_sites(queries):
+    """
+    Return the call sites of the occurrences of a query with the number of
+    occurrences and the time spent at each of them.
+    """
+    call_sites = defaultdict(list)
+    for query in queries:
+        call_sites[_call_site(query)].append(query["duration"])
+    return [
+        {
+            "filename": call_site[0] if call_site else None,
+            "line": call_site[1] if call_site else None,
+            "count": len(durations),
+            "total_time": sum(durations),
+        }
+        for call_site, durations in call_sites.items()
+    ]
+
+
+def _query_count(stats):
+    """
+    Return the number of queries in the stats, including the collapsed and
+    summarized ones.
+    """
+    return (
+        len(stats.get("queries", []))
+        + sum(
+            len(occurrences["djdt_query_id"])
+            for occurrences in stats.get("duplicates", {}).values()
+        )
+        + stats.get("overflow_count", 0)
+    )
+
+
+# The fields computed by _query_annotations(), stored along with the queries.
+ANNOTATION_FIELDS = (
+    "similar_count",
+    "similar_color",
+    "duplicate_count",
+    "duplicate_color",
+    "n_plus_one",
+    "starts_trans",
+    "ends_trans",
+    "in_trans",
+    "start_offset",
+    "trace_color",
+    "occurrence_count",
+    "total_time",
+    "avg_time",
+    "is_slow",
+)
+
+
+def _trace_id(stacktraces, trace):
+    if isinstance(trace, list):
+        # Stored before stack traces were interned.
+        return stacktraces.add(trace)
+    return trace
+
+
+def _query_annotations(queries, duplicates, databases, sql_time, stacktraces):
+    """
+    Return the ``ANNOTATION_FIELDS`` of the queries, as one list per field
+    aligned with ``queries``, and the summary of their fingerprints. The
+    databases' info is updated in place.
+
+    These fields depend on the other queries, including the ``duplicates``
+    collapsed into ``queries``, so they are computed once for all the queries
+    rather than for each page of them that is rendered.
+    """
+    queries = [dict(query) for query in queries]
+    if duplicates:
+        queries = _expand_duplicates(queries, duplicates)
+    for query in queries:
+        query["stacktrace_id"] = _trace_id(stacktraces, query["stacktrace"])
+        query["stacktrace"] = stacktraces.get(query["stacktrace_id"])
+    fingerprints = _annotate_queries(queries, databases, sql_time)
+    if duplicates:
+        queries = _group_duplicates(queries)
+    colors = contrasting_color_generator()
+    trace_colors = defaultdict(lambda: next(colors))
+    for query in queries:
+        query["trace_color"] = trace_colors[query["stacktrace_id"]]
+    annotations = {
+        field: [query.get(field) for query in queries] for field in ANNOTATION_FIELDS
+    }
+    return annotations, fingerprints
+
+
+# The fields of a query that SQL_AUTO_EXPLAIN needs to explain it.
+EXPLAIN_FIELDS = ("djdt_query_id", "alias", "vendor", "raw_sql", "params")
+
+
+# Upper bounds, in milliseconds, of the timing histogram buckets kept for the
+# queries summarized past SQL_MAX_QUERIES. The last bucket has no upper bound.
+OVERFLOW_HISTOGRAM_BOUNDS = (1, 10, 100, 1000)
+
+
+def _histogram_labels(bounds):
+    return [
+        f"< {bounds[0]} ms",
+        *(f"{low}–{high} ms" for low, high in itertools.pairwise(bounds)),
+        f"≥ {bounds[-1]} ms",
+    ]
+
+
 class SQLPanel(Panel):
     """
     Panel that displays information about the SQL queries run while processing
@@ -119,8 +481,16 @@ class SQLPanel(Panel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._sql_time = 0
-        self._queries = []
+        self._queries = QueryColumns()
         self._databases = {}
+        # Query IDs only need to be unique within the request's panel data.
+        self._query_ids = itertools.count()
+        # Summaries of the queries past SQL_MAX_QUERIES, keyed by DB alias and
+        # fingerprint.
+        self._overflow = {}
+        self._overflow_lock = threading.Lock()
+        self._stack_traces = AdaptiveStackTraces()
+        self._to_explain = []
         # synthetic transaction IDs, keyed by DB alias
         self._transaction_ids = {}
 
@@ -145,19 +515,73 @@ class SQLPanel(Panel):
             trans_id = self.new_transaction_id(alias)
         return trans_id
 
+    def has_capacity(self):
+        """
+        Return whether the next query should be recorded in full rather than
+        summarized because ``SQL_MAX_QUERIES`` queries have been recorded.
+        """
+        max_queries = dt_settings.get_config()["SQL_MAX_QUERIES"]
+        return max_queries is None or len(self._queries) < max_queries
+
+    def capture_stack_trace(self, alias, sql, duration, *, skip=0):
+        """
+        Return the stack trace to record for a query according to the
+        ``ENABLE_STACKTRACES`` setting.
+        """
+        skip += 1  # Skip the frame for this method.
+        config = dt_settings.get_config()
+        if config["ENABLE_STACKTRACES"] != "adaptive":
+            return capture_stack_trace(skip=skip)
+        # Slow queries always get a full stack trace. Other queries get one once
+        # their caller repeats the same fingerprint, which covers duplicated
+        # queries and N+1 patterns.
+        return self._stack_traces.capture(
+            (alias, fingerprint_sql(sql)),
+            force=duration > config["SQL_WARNING_THRESHOLD"],
+            skip=skip,
+        )
+
     def record(self, **kwargs):
-        kwargs["djdt_query_id"] = uuid.uuid4().hex
+        kwargs["djdt_query_id"] = str(next(self._query_ids))
         self._queries.append(kwargs)
+        self._add_database_time(kwargs["alias"], kwargs["duration"])
+
+    def record_overflow(self, **kwargs):
+        """
+        Count a query in the summary of its fingerprint instead of recording it.
+        """
         alias = kwargs["alias"]
+        duration = kwargs["duration"]
+        fingerprint = fingerprint_sql(kwargs["raw_sql"])
+        with self._overflow_lock:
+            summary = self._overflow.get((alias, fingerprint))
+            if summary is None:
+                summary = self._overflow[(alias, fingerprint)] = {
+                    "alias": alias,
+                    "fingerprint": fingerprint,
+                    "count": 0,
+                    "total_time": 0,
+                    "max_time": 0,
+                    "histogram": [0] * (len(OVERFLOW_HISTOGRAM_BOUNDS) + 1),
+                }
+            summary["count"] += 1
+            summary["total_time"] += duration
+            summary["max_time"] = max(summary["max_time"], duration)
+            summary["histogram"][
+                bisect.bisect_right(OVERFLOW_HISTOGRAM_BOUNDS, duration)
+            ] += 1
+        self._add_database_time(alias, duration)
+
+    def _add_database_time(self, alias, duration):
         if alias not in self._databases:
             self._databases[alias] = {
-                "time_spent": kwargs["duration"],
+                "time_spent": duration,
                 "num_queries": 1,
             }
         else:
-            self._databases[alias]["time_spent"] += kwargs["duration"]
+            self._databases[alias]["time_spent"] += duration
             self._databases[alias]["num_queries"] += 1
-        self._sql_time += kwargs["duration"]
+        self._sql_time += duration
 
     # Implement the Panel API
 
@@ -166,7 +590,7 @@ class SQLPanel(Panel):
     @property
     def nav_subtitle(self):
         stats = self.get_stats()
-        query_count = len(stats.get("queries", []))
+        query_count = _query_count(stats)
         return ngettext(
             "%(query_count)d query in %(sql_time).2fms",
             "%(query_count)d queries in %(sql_time).2fms",
@@ -193,6 +617,7 @@ class SQLPanel(Panel):
             path("sql_select/", views.sql_select, name="sql_select"),
             path("sql_explain/", views.sql_explain, name="sql_explain"),
             path("sql_profile/", views.sql_profile, name="sql_profile"),
+            path("sql_queries/", views.sql_queries, name="sql_queries"),
         ]
 
     async def aenable_instrumentation(self):
@@ -207,19 +632,16 @@ class SQLPanel(Panel):
         for connection in connections.all():
             wrap_cursor(connection)
             connection._djdt_logger = self
+        enable_template_tracking(self)
 
     def disable_instrumentation(self):
         for connection in connections.all():
             connection._djdt_logger = None
+        disable_template_tracking(self)
 
     def generate_stats(self, request, response):
-        similar_query_groups = defaultdict(list)
-        duplicate_query_groups = defaultdict(list)
-
+        stacktraces = StackTraceTree()
         if self._queries:
-            sql_warning_threshold = dt_settings.get_config()["SQL_WARNING_THRESHOLD"]
-
-            width_ratio_tally = 0
             factor = int(256.0 / (len(self._databases) * 2.5))
             for n, db in enumerate(self._databases.values()):
                 rgb = [0, 0, 0]
@@ -236,103 +658,265 @@ class SQLPanel(Panel):
                     rgb[nn] = nc
                 db["rgb_color"] = rgb
 
-            # the last query recorded for each DB alias
-            last_by_alias = {}
-            for query in self._queries:
-                alias = query["alias"]
-
-                similar_query_groups[(alias, _similar_query_key(query))].append(query)
-                duplicate_query_groups[(alias, _duplicate_query_key(query))].append(
-                    query
-                )
-
-                trans_id = query.get("trans_id")
-                prev_query = last_by_alias.get(alias, {})
-                prev_trans_id = prev_query.get("trans_id")
-
-                # If two consecutive queries for a given DB alias have different
-                # transaction ID values, a transaction started, finished, or both, so
-                # annotate the queries as appropriate.
-                if trans_id != prev_trans_id:
-                    if prev_trans_id is not None:
-                        prev_query["ends_trans"] = True
-                    if trans_id is not None:
-                        query["starts_trans"] = True
-                if trans_id is not None:
-                    query["in_trans"] = True
-
-                if "iso_level" in query:
-                    query["iso_level"] = get_isolation_level_display(
-                        query["vendor"], query["iso_level"]
-                    )
-                if "trans_status" in query:
-                    query["trans_status"] = get_transaction_status_display(
-                        query["vendor"], query["trans_status"]
-                    )
-                query["is_slow"] = query["duration"] > sql_warning_threshold
-
-                query["rgb_color"] = self._databases[alias]["rgb_color"]
-                try:
-                    query["width_ratio"] = (query["duration"] / self._sql_time) * 100
-                except ZeroDivisionError:
-                    query["width_ratio"] = 0
-                query["start_offset"] = width_ratio_tally
-                query["end_offset"] = query["width_ratio"] + query["start_offset"]
-                width_ratio_tally += query["width_ratio"]
-
-                last_by_alias[alias] = query
-
-            # Close out any transactions that were in progress, since there is no
-            # explicit way to know when a transaction finishes.
-            for final_query in last_by_alias.values():
-                if final_query.get("trans_id") is not None:
-                    final_query["ends_trans"] = True
-
-        group_colors = contrasting_color_generator()
-        _process_query_groups(
-            similar_query_groups, self._databases, group_colors, "similar"
+            # Params are decoded here rather than while recording so the view
+            # doesn't pay for it. The decoded values are safe to store.
+            columns = self._queries.columns
+            columns["params"] = [_decode_params(params) for params in columns["params"]]
+            # Queries made from the same call site share their stack trace, so
+            # each query only keeps the id of its interned trace.
+            columns["stacktrace"] = [
+                stacktraces.add(resolve_stack_trace(trace))
+                for trace in columns["stacktrace"]
+            ]
+            columns["template_info"] = [
+                resolve_template_info(template_info)
+                for template_info in columns["template_info"]
+            ]
+        queries = self._queries
+        duplicates = {}
+        if queries and dt_settings.get_config()["SQL_COLLAPSE_DUPLICATES"]:
+            queries, duplicates = _collapse_duplicates(queries)
+        # The queries are explained once the stats are in the store.
+        self._to_explain = self._queries_to_explain(queries)
+
+        # The fields that depend on the other queries are stored alongside the
+        # recorded ones, so each page of queries is rendered on its own. The
+        # fields that only depend on a query are computed by _annotate_row()
+        # when its page is rendered.
+        annotations, fingerprints = _query_annotations(
+            queries, duplicates, self._databases, self._sql_time, stacktraces
         )
-        _process_query_groups(
-            duplicate_query_groups, self._databases, group_colors, "duplicate"
-        )
-
         self.record_stats(
             {
                 "databases": sorted(
                     self._databases.items(), key=lambda x: -x[1]["time_spent"]
                 ),
-                "queries": self._queries,
+                "queries": queries.columns,
+                "duplicates": duplicates,
+                "annotations": annotations,
+                "fingerprints": fingerprints,
+                "stacktraces": stacktraces.as_dict(),
+                "overflow": sorted(
+                    self._overflow.values(), key=lambda summary: -summary["total_time"]
+                ),
+                "overflow_count": sum(
+                    summary["count"] for summary in self._overflow.values()
+                ),
                 "sql_time": self._sql_time,
             }
         )
 
+    def _queries_to_explain(self, queries):
+        """
+        Return the queries to explain in the background according to the
+        ``SQL_AUTO_EXPLAIN`` setting.
+        """
+        config = dt_settings.get_config()
+        auto_explain = config["SQL_AUTO_EXPLAIN"]
+        if not auto_explain:
+            return []
+        candidates = [query for query in queries if is_select(query["raw_sql"])]
+        if auto_explain is True:
+            candidates = [
+                query
+                for query in candidates
+                if query["duration"] > config["SQL_WARNING_THRESHOLD"]
+            ]
+        else:
+            candidates = heapq.nlargest(
+                auto_explain, candidates, key=lambda query: query["duration"]
+            )
+        return [
+            {field: query[field] for field in EXPLAIN_FIELDS} for query in candidates
+        ]
+
+    def stats_saved(self):
+        if self._to_explain:
+            schedule_explain(self.toolbar.request_id, self._to_explain)
+
+    @cached_property
+    def _plans(self):
+        """
+        Return the plans captured in the background by SQL_AUTO_EXPLAIN, keyed
+        by query id. They are stored after the panel's data, so they're only
+        available when it's loaded from the store.
+        """
+        if not self.from_store:
+            return {}
+        return self.toolbar.store.panel(self.toolbar.request_id, PLANS_ID) or {}
+
+    def get_stats(self):
+        stats = super().get_stats()
+        if isinstance(stats.get("queries"), dict):
+            stats = {**stats, "queries": QueryColumns(stats["queries"])}
+        return stats
+
     def generate_server_timing(self, request, response):
         stats = self.get_stats()
-        title = "SQL {} queries".format(len(stats.get("queries", [])))
+        query_count = _query_count(stats)
+        title = f"SQL {query_count} queries"
         value = stats.get("sql_time", 0)
         self.record_server_timing("sql_time", title, value)
 
-    # Cache the content property since it manipulates the queries in the stats
-    # This allows the caller to treat content as idempotent
+    @cached_property
+    def _queries_context(self):
+        stats = self.get_stats()
+        # Copy the stored data since it's shared with the store's decoded data
+        # cache.
+        databases = [(alias, dict(info)) for alias, info in stats["databases"]]
+        queries = stats.get("queries", QueryColumns())
+        if "stacktraces" in stats:
+            stacktraces = StackTraceTree.from_dict(stats["stacktraces"])
+        else:
+            stacktraces = StackTraceTree()
+        annotations = stats.get("annotations")
+        fingerprints = stats.get("fingerprints")
+        if annotations is None:
+            # Stored before the queries were annotated along with their stats.
+            annotations, fingerprints = _query_annotations(
+                queries,
+                stats.get("duplicates"),
+                dict(databases),
+                stats.get("sql_time", 0),
+                stacktraces,
+            )
+        return {
+            "stats": stats,
+            "databases": databases,
+            "queries": queries,
+            "annotations": annotations,
+            "stacktraces": stacktraces,
+            "fingerprints": fingerprints,
+        }
+
+    def _page_context(self, offset):
+        """
+        Return the context for the page of query rows starting at ``offset``.
+
+        Only the queries of the page are read from the stored columns and
+        annotated.
+        """
+        context = self._queries_context
+        queries = context["queries"]
+        annotations = context["annotations"]
+        stacktraces = context["stacktraces"]
+        databases = dict(context["databases"])
+        sql_time = context["stats"].get("sql_time", 0)
+        plans = self._plans
+        page_size = dt_settings.get_config()["SQL_QUERIES_PAGE_SIZE"]
+        # Smaller page sizes are reported by the system checks. The page
+        # would be empty, so every query is listed instead.
+        if page_size is None or page_size < 1:
+            stop = len(queries)
+        else:
+            stop = min(offset + page_size, len(queries))
+        page = []
+        for index in range(offset, stop):
+            query = queries[index]
+            for field, values in annotations.items():
+                if values[index] is not None:
+                    query[field] = values[index]
+            query["counter"] = index + 1
+            query["stacktrace_id"] = _trace_id(stacktraces, query["stacktrace"])
+            query["stacktrace"] = stacktraces.get(query["stacktrace_id"])
+            query["explain"] = plans.get(query["djdt_query_id"])
+            _annotate_row(query, databases, sql_time)
+            query["sql"] = reformat_query_sql(query, with_toggle=True)
+            page.append(query)
+        # Each distinct stack trace is rendered once, on the first page with a
+        # query that references it.
+        rendered = {
+            _trace_id(stacktraces, trace)
+            for trace in queries.columns.get("stacktrace", [])[:offset]
+        }
+        return {
+            # A single signed token for the request lets the SELECT, EXPLAIN
+            # and PROFILE views act on any of its queries, picked by id.
+            "signed_token": SignedDataForm.sign(
+                {"request_id": self.toolbar.request_id}
+            ),
+            "queries": page,
+            "stacktraces": [
+                (trace_id, render_stacktrace(stacktraces.get(trace_id)))
+                for trace_id in dict.fromkeys(query["stacktrace_id"] for query in page)
+                if trace_id is not None and trace_id not in rendered
+            ],
+            "next_offset": stop if stop < len(queries) else None,
+            "request_id": self.toolbar.request_id,
+        }
+
+    @cached_property
+    def _render_context(self):
+        stats = self._queries_context["stats"]
+        fingerprints = self._queries_context["fingerprints"]
+        histogram_labels = _histogram_labels(OVERFLOW_HISTOGRAM_BOUNDS)
+        overflow = [
+            {
+                **summary,
+                "histogram": [
+                    (label, count)
+                    for label, count in zip(
+                        histogram_labels, summary["histogram"], strict=True
+                    )
+                    if count
+                ],
+            }
+            for summary in stats.get("overflow", [])
+        ]
+
+        return {
+            **stats,
+            **self._page_context(0),
+            "query_count": len(self._queries_context["queries"]),
+            "overflow": overflow,
+            "databases": self._queries_context["databases"],
+            "fingerprints": fingerprints,
+            "repeated_fingerprints": [
+                fingerprint for fingerprint in fingerprints if fingerprint["count"] > 1
+            ],
+        }
+
+    def render_queries(self, offset):
+        """
+        Render the page of query rows starting at ``offset``.
+
+        Return the HTML of the rows, the HTML of the stack traces they are the
+        first to reference and the offset of the next page, or ``None`` for the
+        last page.
+        """
+        context = self._page_context(offset)
+        return (
+            render_to_string("debug_toolbar/panels/sql_queries.html", context),
+            render_to_string("debug_toolbar/panels/sql_stacktraces.html", context),
+            context["next_offset"],
+        )
+
+    def render_call_sites(self, query_id):
+        """
+        Render the call sites of a query whose duplicates were collapsed, or
+        return ``None`` if it has none.
+
+        The call sites are only computed when they are asked for, since they
+        need the stack traces of all the query's occurrences.
+        """
+        stats = self.get_stats()
+        occurrences = stats.get("duplicates", {}).get(query_id)
+        if occurrences is None:
+            return None
+        queries = stats["queries"]
+        query = queries[queries.columns["djdt_query_id"].index(query_id)]
+        stacktraces = StackTraceTree.from_dict(stats["stacktraces"])
+        durations = [query["duration"], *occurrences["duration"]]
+        trace_ids = [query["stacktrace"], *occurrences["stacktrace"]]
+        call_sites = _call_sites(
+            {"duration": duration, "stacktrace": stacktraces.get(trace_id)}
+            for duration, trace_id in zip(durations, trace_ids, strict=True)
+        )
+        return render_to_string(
+            "debug_toolbar/panels/sql_call_sites.html", {"call_sites": call_sites}
+        )
+
     @cached_property
     def content(self):
         if self.has_content:
-            stats = self.get_stats()
-            colors = contrasting_color_generator()
-            trace_colors = defaultdict(lambda: next(colors))
-
-            for query in stats.get("queries", []):
-                query["sql"] = reformat_sql(query["sql"], with_toggle=True)
-                query["form"] = SignedDataForm(
-                    auto_id=None,
-                    initial=SQLSelectForm(
-                        initial={
-                            "djdt_query_id": query["djdt_query_id"],
-                            "request_id": self.toolbar.request_id,
-                        }
-                    ).initial,
-                )
-                query["stacktrace"] = render_stacktrace(query["stacktrace"])
-                query["trace_color"] = trace_colors[query["stacktrace"]]
-
-            return render_to_string(self.template, stats)
+            return render_to_string(self.template, self._render_context)
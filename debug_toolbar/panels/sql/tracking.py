@@ -1,7 +1,8 @@
 import base64
-import contextlib
 import contextvars
 import datetime
+import functools
+import re
 from time import perf_counter
 
 import django.test.testcases
@@ -10,7 +11,7 @@ from django.core.exceptions import ImproperlyConfigured
 
 from debug_toolbar import settings as dt_settings
 from debug_toolbar.sanitize import force_str
-from debug_toolbar.utils import get_stack_trace, get_template_info
+from debug_toolbar.utils import capture_template_info
 
 Psycopg3Binary = None
 
@@ -51,6 +52,84 @@ DDT_MODELS = {
     m._meta.db_table for m in apps.get_app_config("debug_toolbar").get_models()
 }
 
+# The tables in DDT_MODELS and the compiled pattern matching them. DDT_MODELS can
+# change at runtime (CacheStore adds the cache table), so the pattern is rebuilt
+# whenever it no longer matches the snapshot.
+_ddt_models_pattern = (frozenset(), None)
+
+
+def get_ddt_models_pattern():
+    """
+    Return a compiled pattern matching SQL that references one of the toolbar's
+    tables, or None when there are no such tables.
+    """
+    global _ddt_models_pattern
+    tables, pattern = _ddt_models_pattern
+    if tables != DDT_MODELS:
+        tables = frozenset(DDT_MODELS)
+        pattern = (
+            re.compile("|".join(re.escape(table) for table in sorted(tables)))
+            if tables
+            else None
+        )
+        _ddt_models_pattern = (tables, pattern)
+    return pattern
+
+
+def decode_param(param):
+    """Convert a query parameter into a value that the store can serialize."""
+    if PostgresJson and isinstance(param, PostgresJson):
+        # psycopg3
+        if hasattr(param, "obj"):
+            return param.dumps(param.obj)
+        # psycopg2
+        if hasattr(param, "adapted"):
+            return param.dumps(param.adapted)
+
+    # If a sequence type, decode each element separately
+    if isinstance(param, (tuple, list)):
+        return [decode_param(element) for element in param]
+
+    # If a dictionary type, decode each value separately
+    if isinstance(param, dict):
+        return {key: decode_param(value) for key, value in param.items()}
+
+    # GeoDjango PostGIS geometry parameters: extract EWKB bytes and metadata
+    # so the adapter can be reconstructed on the way back out for SELECT/EXPLAIN.
+    if _PostGISAdapter is not None and isinstance(param, _PostGISAdapter):
+        return {
+            "__djdt_postgis__": base64.b64encode(param.ewkb).decode("ascii"),
+            "is_geometry": param.is_geometry,
+            "geography": param.geography,
+        }
+
+    # Binary data is handled by DebugToolbarJSONEncoder in store.py.
+    # Django's BinaryField calls connection.Database.Binary() which wraps
+    # bytes in a driver-specific adapter: psycopg2 uses .adapted, psycopg3
+    # uses .obj. memoryview: psycopg2/sqlite3 binary column values.
+    if isinstance(param, (bytes, bytearray, memoryview)):
+        return bytes(param)
+    if Psycopg2Binary is not None and isinstance(param, Psycopg2Binary):
+        return bytes(param.adapted)
+    if Psycopg3Binary is not None and isinstance(param, Psycopg3Binary):
+        return bytes(param.obj)
+
+    # make sure datetime, date and time are converted to string by force_str
+    CONVERT_TYPES = (datetime.datetime, datetime.date, datetime.time)
+    return force_str(param, strings_only=not isinstance(param, CONVERT_TYPES))
+
+
+def snapshot_params(params):
+    """
+    Return a shallow copy of the query parameters so later changes to the
+    caller's list or dict don't alter what was recorded.
+    """
+    if isinstance(params, (list, tuple)):
+        return list(params)
+    if isinstance(params, dict):
+        return dict(params)
+    return params
+
 
 class SQLQueryTriggered(Exception):
     """Thrown when template panel triggers a query"""
@@ -104,6 +183,7 @@ def wrap_cursor(connection):
         connection.chunked_cursor = chunked_cursor
 
 
+@functools.cache
 def patch_cursor_wrapper_with_mixin(base_wrapper, mixin):
     class DjDTCursorWrapper(mixin, base_wrapper):
         pass
@@ -133,59 +213,12 @@ class NormalCursorMixin(DjDTCursorWrapperMixin):
     Wraps a cursor and logs queries.
     """
 
-    def _decode(self, param):
-        if PostgresJson and isinstance(param, PostgresJson):
-            # psycopg3
-            if hasattr(param, "obj"):
-                return param.dumps(param.obj)
-            # psycopg2
-            if hasattr(param, "adapted"):
-                return param.dumps(param.adapted)
-
-        # If a sequence type, decode each element separately
-        if isinstance(param, (tuple, list)):
-            return [self._decode(element) for element in param]
-
-        # If a dictionary type, decode each value separately
-        if isinstance(param, dict):
-            return {key: self._decode(value) for key, value in param.items()}
-
-        # GeoDjango PostGIS geometry parameters: extract EWKB bytes and metadata
-        # so the adapter can be reconstructed on the way back out for SELECT/EXPLAIN.
-        if _PostGISAdapter is not None and isinstance(param, _PostGISAdapter):
-            return {
-                "__djdt_postgis__": base64.b64encode(param.ewkb).decode("ascii"),
-                "is_geometry": param.is_geometry,
-                "geography": param.geography,
-            }
-
-        # Binary data is handled by DebugToolbarJSONEncoder in store.py.
-        # Django's BinaryField calls connection.Database.Binary() which wraps
-        # bytes in a driver-specific adapter: psycopg2 uses .adapted, psycopg3
-        # uses .obj. memoryview: psycopg2/sqlite3 binary column values.
-        if isinstance(param, (bytes, bytearray, memoryview)):
-            return bytes(param)
-        if Psycopg2Binary is not None and isinstance(param, Psycopg2Binary):
-            return bytes(param.adapted)
-        if Psycopg3Binary is not None and isinstance(param, Psycopg3Binary):
-            return bytes(param.obj)
-
-        # make sure datetime, date and time are converted to string by force_str
-        CONVERT_TYPES = (datetime.datetime, datetime.date, datetime.time)
-        return force_str(param, strings_only=not isinstance(param, CONVERT_TYPES))
-
-    def _last_executed_query(self, sql, params):
-        """Get the last executed query from the connection."""
-        # Django's psycopg3 backend creates a new cursor in its implementation of the
-        # .last_executed_query() method.  To avoid wrapping that cursor, temporarily set
-        # the DatabaseWrapper's ._djdt_logger attribute to None.  This will cause the
-        # monkey-patched .cursor() and .chunked_cursor() methods to skip the wrapping
-        # process during the .last_executed_query() call.
-        self.db._djdt_logger = None
-        try:
-            return self.db.ops.last_executed_query(self.cursor, sql, params)
-        finally:
-            self.db._djdt_logger = self.logger
+    def _is_toolbar_query(self, sql):
+        """Check whether the query touches one of the toolbar's own tables."""
+        if not dt_settings.get_config()["SKIP_TOOLBAR_QUERIES"]:
+            return False
+        pattern = get_ddt_models_pattern()
+        return pattern is not None and pattern.search(sql) is not None
 
     def _record(self, method, sql, params):
         alias = self.db.alias
@@ -202,13 +235,6 @@ class NormalCursorMixin(DjDTCursorWrapperMixin):
         finally:
             stop_time = perf_counter()
             duration = (stop_time - start_time) * 1000
-            _params = None
-            with contextlib.suppress(TypeError):
-                # Decode params - binary data will be handled by DebugToolbarJSONEncoder
-                # in store.py when the panel data is serialized
-                _params = self._decode(params)
-            template_info = get_template_info()
-
             # Sql might be an object (such as psycopg Composed).
             # For logging purposes, make sure it's str.
             if vendor == "postgresql" and not isinstance(sql, str):
@@ -222,12 +248,8 @@ class NormalCursorMixin(DjDTCursorWrapperMixin):
             kwargs = {
                 "vendor": vendor,
                 "alias": alias,
-                "sql": self._last_executed_query(sql, params),
                 "duration": duration,
                 "raw_sql": sql,
-                "params": _params,
-                "stacktrace": get_stack_trace(skip=2),
-                "template_info": template_info,
             }
 
             if vendor == "postgresql":
@@ -266,13 +288,29 @@ class NormalCursorMixin(DjDTCursorWrapperMixin):
                     }
                 )
 
-            # Skip tracking for toolbar models by default.
+            # Skip tracking for toolbar models by default. This is checked before
+            # the more expensive work below so skipped queries cost next to nothing.
             # This can be overridden by setting SKIP_TOOLBAR_QUERIES = False
-            if not dt_settings.get_config()["SKIP_TOOLBAR_QUERIES"] or not any(
-                table in sql for table in DDT_MODELS
-            ):
-                # We keep `sql` to maintain backwards compatibility
-                self.logger.record(**kwargs)
+            if not self._is_toolbar_query(sql):
+                if self.logger.has_capacity():
+                    kwargs.update(
+                        {
+                            # Decoding the params and interpolating them into the
+                            # SQL are deferred until the panel's stats are
+                            # generated and rendered.
+                            "params": snapshot_params(params),
+                            "stacktrace": self.logger.capture_stack_trace(
+                                alias, sql, duration, skip=2
+                            ),
+                            "template_info": capture_template_info(),
+                        }
+                    )
+                    self.logger.record(**kwargs)
+                else:
+                    # Past SQL_MAX_QUERIES only the query's timing is summarized,
+                    # so the cost of recording stays flat however many queries
+                    # run.
+                    self.logger.record_overflow(**kwargs)
 
     def callproc(self, procname, params=None):
         return self._record(super().callproc, procname, params)
@@ -1,3 +1,5 @@
+import re
+import threading
 from functools import cache, lru_cache
 from html import escape
 from itertools import cycle
@@ -88,19 +90,144 @@ class EscapedStringSerializer:
         return "".join(escaped_value(token) for token in stmt.flatten())
 
 
+def quote_param(param):
+    """Render a decoded query parameter as an SQL literal for display."""
+    if param is None:
+        return "NULL"
+    if isinstance(param, bool):
+        return "TRUE" if param else "FALSE"
+    if isinstance(param, (int, float)):
+        return str(param)
+    if isinstance(param, (bytes, bytearray, memoryview)):
+        return f"X'{bytes(param).hex()}'"
+    if isinstance(param, (list, tuple)):
+        return "({})".format(", ".join(quote_param(element) for element in param))
+    return "'{}'".format(str(param).replace("'", "''"))
+
+
+def interpolate_sql(sql, params):
+    """
+    Return ``sql`` with the decoded ``params`` substituted for display.
+
+    The parameters are quoted by the toolbar rather than the database driver,
+    so the result can differ slightly from what the database received. ``sql``
+    is returned unchanged if the parameters don't fit its placeholders.
+    """
+    if not params:
+        return sql
+    try:
+        if isinstance(params, dict):
+            return sql % {key: quote_param(value) for key, value in params.items()}
+        return sql % tuple(quote_param(param) for param in params)
+    except (TypeError, ValueError, KeyError):
+        return sql
+
+
+def get_query_sql(query):
+    """Return the SQL of a recorded query with its parameters interpolated."""
+    # Queries stored by earlier versions already have their interpolated SQL.
+    if "sql" in query:
+        return query["sql"]
+    return interpolate_sql(query["raw_sql"], query["params"])
+
+
 def reformat_sql(sql, *, with_toggle=False):
     formatted = parse_sql(sql)
     if not with_toggle:
         return formatted
-    simplified = parse_sql(sql, simplify=True)
+    return _with_toggle(formatted, parse_sql(sql, simplify=True))
+
 
+def _with_toggle(formatted, simplified):
     uncollapsed = f'<span class="djDebugUncollapsed">{simplified}</span>'
     collapsed = f'<span class="djDebugCollapsed djdt-hidden">{formatted}</span>'
     return collapsed + uncollapsed
 
 
-@lru_cache(maxsize=128)
+def _format_param(param):
+    value = quote_param(param)
+    if param is None or isinstance(param, bool):
+        # NULL, TRUE and FALSE are keywords.
+        return f"<strong>{value}</strong>"
+    return escape(value, quote=False)
+
+
+def reformat_query_sql(query, *, with_toggle=False):
+    """
+    Return the formatted SQL of a recorded query with its parameters
+    interpolated, as ``reformat_sql(get_query_sql(query))`` would.
+
+    The SQL is formatted before the parameters are interpolated, so queries
+    that only differ in their parameters share their cached formatting.
+    """
+    if "sql" in query or not query["params"]:
+        return reformat_sql(get_query_sql(query), with_toggle=with_toggle)
+    sql, params = query["raw_sql"], query["params"]
+    try:
+        if isinstance(params, dict):
+            formatted_params = {
+                key: _format_param(value) for key, value in params.items()
+            }
+        else:
+            formatted_params = tuple(_format_param(param) for param in params)
+        formatted = parse_sql(sql) % formatted_params
+        if not with_toggle:
+            return formatted
+        return _with_toggle(formatted, parse_sql(sql, simplify=True) % formatted_params)
+    except (TypeError, ValueError, KeyError):
+        return reformat_sql(get_query_sql(query), with_toggle=with_toggle)
+
+
+class _FormatCache:
+    """
+    A process-wide cache of formatted SQL, bounded by the
+    ``SQL_FORMAT_CACHE_SIZE`` setting.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        maxsize = dt_settings.get_config()["SQL_FORMAT_CACHE_SIZE"]
+        if not maxsize:
+            return
+        # Lookups don't take the lock, so the oldest entries are evicted
+        # rather than the least recently used ones.
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > maxsize:
+                del self._entries[next(iter(self._entries))]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_format_cache = _FormatCache()
+
+# Queries longer than this are formatted from their tokens alone, without
+# sqlparse's grouping, whose cost grows quickly with the size of the query.
+GROUPING_MAX_LENGTH = 1000
+
+
 def parse_sql(sql, *, simplify=False):
+    key = (sql, simplify)
+    formatted = _format_cache.get(key)
+    if formatted is None:
+        formatted = _parse_sql(sql, simplify=simplify)
+        _format_cache.set(key, formatted)
+    return formatted
+
+
+def _parse_sql(sql, *, simplify=False):
+    if simplify:
+        return format_tokens(ElideSelectListsFilter().process(tokenize(sql)))
+    if len(sql) > GROUPING_MAX_LENGTH:
+        return format_tokens(tokenize(sql), break_clauses=True)
     stack = get_filter_stack(simplify=simplify)
     try:
         return "".join(stack.run(sql))
@@ -113,6 +240,64 @@ def parse_sql(sql, *, simplify=False):
         return "".join(stack.run(sql))
 
 
+def tokenize(sql):
+    return sqlparse.lexer.tokenize(sql)
+
+
+_CLAUSE_KEYWORDS = frozenset(
+    [
+        "EXCEPT",
+        "FROM",
+        "GROUP BY",
+        "HAVING",
+        "INTERSECT",
+        "LIMIT",
+        "OFFSET",
+        "ORDER BY",
+        "RETURNING",
+        "SET",
+        "UNION",
+        "UNION ALL",
+        "VALUES",
+        "WHERE",
+    ]
+)
+
+
+def format_tokens(stream, *, break_clauses=False):
+    """
+    Return the HTML for a stream of SQL tokens with the keywords in bold.
+
+    This is a faster alternative to the grouping filter stack for large
+    queries. With ``break_clauses``, top-level clauses start on a new line.
+    """
+    parts = []
+    depth = 0
+    for token_type, value in stream:
+        if token_type in T.Keyword:
+            keyword = value.upper()
+            if (
+                break_clauses
+                and depth == 0
+                and parts
+                and (keyword in _CLAUSE_KEYWORDS or keyword.endswith("JOIN"))
+            ):
+                if parts[-1] == " ":
+                    parts.pop()
+                parts.append("<br/>")
+            parts.append(f"<strong>{escape(value, quote=False)}</strong>")
+        elif token_type in (T.Other, T.Whitespace):
+            parts.append(value)
+        else:
+            if token_type in T.Punctuation:
+                if value == "(":
+                    depth += 1
+                elif value == ")":
+                    depth -= 1
+            parts.append(escape(value, quote=False))
+    return "".join(parts)
+
+
 @cache
 def get_filter_stack(*, simplify):
     stack = sqlparse.engine.FilterStack()
@@ -129,13 +314,81 @@ def get_filter_stack(*, simplify):
     return stack
 
 
+_FINGERPRINT_SUBSTITUTIONS = [
+    # String literals, including escaped quotes.
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    # Placeholders: %s, %(name)s, $1 and ?.
+    (re.compile(r"%\([^)]*\)s|%s|\$\d+|\?"), "?"),
+    # Numeric literals that aren't part of an identifier.
+    (re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+    # IN lists of any length.
+    (re.compile(r"\bIN \(\s?\?(?:\s?,\s?\?)*\s?\)", re.IGNORECASE), "IN (...)"),
+    # Multi-row VALUES lists.
+    (
+        re.compile(r"\bVALUES (\(\?(?:, \?)*\))(?:, \1)*", re.IGNORECASE),
+        r"VALUES \1, ...",
+    ),
+]
+
+
+@lru_cache(maxsize=1024)
+def fingerprint_sql(sql):
+    """
+    Return a normalized form of ``sql`` that is shared by queries which only
+    differ in their literals, parameters, IN list lengths or whitespace.
+    """
+    for pattern, replacement in _FINGERPRINT_SUBSTITUTIONS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
 @receiver(setting_changed)
 def clear_caches(*, setting, **kwargs):
     if setting == "DEBUG_TOOLBAR_CONFIG":
-        parse_sql.cache_clear()
+        _format_cache.clear()
         get_filter_stack.cache_clear()
 
 
+class QueryColumns:
+    """
+    Recorded queries kept as one list per field rather than one dict per query.
+
+    Queries are appended and read back as dicts, but only ``columns``, a dict
+    mapping each field to the list of its values, is kept and stored. A field
+    missing from a query is ``None`` in its column.
+    """
+
+    __slots__ = ("_length", "_lock", "columns")
+
+    def __init__(self, columns=None):
+        self.columns = {} if columns is None else columns
+        self._length = len(next(iter(self.columns.values()), ()))
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        # Queries can be recorded from several threads at once, keep the
+        # columns aligned.
+        with self._lock:
+            for key in record.keys() - self.columns.keys():
+                self.columns[key] = [None] * self._length
+            for key, column in self.columns.items():
+                column.append(record.get(key))
+            self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        return {key: column[index] for key, column in self.columns.items()}
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+
 def contrasting_color_generator():
     return cycle(
         [
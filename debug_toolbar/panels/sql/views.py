@@ -1,12 +1,16 @@
 from django.http import HttpResponseBadRequest, JsonResponse
 from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.translation import gettext as _
 from django.views.decorators.csrf import csrf_exempt
 
 from debug_toolbar._compat import login_not_required
 from debug_toolbar.decorators import render_with_toolbar_language, require_show_toolbar
 from debug_toolbar.forms import SignedDataForm
 from debug_toolbar.panels.sql.forms import SQLSelectForm
-from debug_toolbar.panels.sql.utils import reformat_sql
+from debug_toolbar.panels.sql.utils import reformat_query_sql
+from debug_toolbar.toolbar import DebugToolbar
 
 
 def get_signed_data(request):
@@ -14,7 +18,12 @@ def get_signed_data(request):
     data = request.GET if request.method == "GET" else request.POST
     signed_form = SignedDataForm(data)
     if signed_form.is_valid():
-        return signed_form.verified_data()
+        verified_data = signed_form.verified_data()
+        if "djdt_query_id" not in verified_data:
+            # The panel signs a single token per request and sends the id of
+            # the query alongside it.
+            verified_data["djdt_query_id"] = data.get("djdt_query_id")
+        return verified_data
     return None
 
 
@@ -34,7 +43,7 @@ def sql_select(request):
         result, headers = form.select()
         context = {
             "result": result,
-            "sql": reformat_sql(query["sql"], with_toggle=False),
+            "sql": reformat_query_sql(query),
             "duration": query["duration"],
             "headers": headers,
             "alias": query["alias"],
@@ -60,7 +69,7 @@ def sql_explain(request):
         result, headers = form.explain()
         context = {
             "result": result,
-            "sql": reformat_sql(query["sql"], with_toggle=False),
+            "sql": reformat_query_sql(query),
             "duration": query["duration"],
             "headers": headers,
             "alias": query["alias"],
@@ -104,3 +113,46 @@ def sql_profile(request):
         content = render_to_string("debug_toolbar/panels/sql_profile.html", context)
         return JsonResponse({"content": content})
     return HttpResponseBadRequest("Form errors")
+
+
+@login_not_required
+@require_show_toolbar
+@render_with_toolbar_language
+def sql_queries(request):
+    """
+    Returns a page of the SQL panel's query rows, or the call sites of a query
+    whose duplicates were collapsed when ``query_id`` is given
+    """
+    from debug_toolbar.panels.sql import SQLPanel
+
+    request_id = request.GET.get("request_id", "")
+    query_id = request.GET.get("query_id")
+    if query_id is not None:
+        toolbar = DebugToolbar.fetch(request_id, SQLPanel.panel_id)
+        if toolbar is None:
+            return HttpResponseBadRequest(
+                _("Data for this panel isn't available anymore.")
+            )
+        panel = toolbar.get_panel_by_id(SQLPanel.panel_id)
+        content = panel.render_call_sites(query_id)
+        if content is None:
+            return HttpResponseBadRequest("Invalid query id")
+        return JsonResponse({"content": content})
+    try:
+        offset = int(request.GET.get("offset", ""))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid offset")
+    if offset < 0:
+        return HttpResponseBadRequest("Invalid offset")
+    toolbar = DebugToolbar.fetch(request_id, SQLPanel.panel_id)
+    if toolbar is None:
+        return HttpResponseBadRequest(_("Data for this panel isn't available anymore."))
+    panel = toolbar.get_panel_by_id(SQLPanel.panel_id)
+    content, stacktraces, next_offset = panel.render_queries(offset)
+    next_url = None
+    if next_offset is not None:
+        query_string = urlencode({"request_id": request_id, "offset": next_offset})
+        next_url = f"{reverse('djdt:sql_queries')}?{query_string}"
+    return JsonResponse(
+        {"content": content, "stacktraces": stacktraces, "next": next_url}
+    )
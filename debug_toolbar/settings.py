@@ -29,11 +29,14 @@ CONFIG_DEFAULTS = {
     "OBSERVE_REQUEST_CALLBACK": "debug_toolbar.toolbar.observe_request",
     "RENDER_PANELS": None,
     "RESULTS_CACHE_SIZE": 25,
+    "RESULTS_CACHE_MAX_BYTES": None,
     "ROOT_TAG_EXTRA_ATTRS": "",
     "SHOW_COLLAPSED": False,
     "SHOW_TOOLBAR_CALLBACK": "debug_toolbar.middleware.show_toolbar",
+    "SQLITE_STORE_PATH": None,
     "USE_SHADOW_DOM": True,
     "TOOLBAR_LANGUAGE": None,
+    "TOOLBAR_SERIALIZER_CLASS": "debug_toolbar.store.JSONSerializer",
     "TOOLBAR_STORE_CLASS": "debug_toolbar.store.MemoryStore",
     "UPDATE_ON_FETCH": False,
     # Panel options
@@ -59,6 +62,12 @@ CONFIG_DEFAULTS = {
     "SHOW_TEMPLATE_CONTEXT": True,
     "SKIP_TEMPLATE_PREFIXES": ("django/forms/widgets/", "admin/widgets/"),
     "SKIP_TOOLBAR_QUERIES": True,
+    "SQL_AUTO_EXPLAIN": False,
+    "SQL_COLLAPSE_DUPLICATES": False,
+    "SQL_FORMAT_CACHE_SIZE": 1000,
+    "SQL_MAX_QUERIES": None,
+    "SQL_N_PLUS_ONE_THRESHOLD": 5,
+    "SQL_QUERIES_PAGE_SIZE": 100,
     "SQL_WARNING_THRESHOLD": 500,  # milliseconds
 }
 
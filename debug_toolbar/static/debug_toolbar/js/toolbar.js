@@ -122,10 +122,23 @@ const djdt = {
             )) {
                 $$.toggle(el, !openMe);
             }
-            for (const el of this.closest(
-                ".djDebugPanelContent"
-            ).querySelectorAll(`.djToggleDetails_${id}`)) {
+            const panelContent = this.closest(".djDebugPanelContent");
+            for (const el of panelContent.querySelectorAll(
+                `.djToggleDetails_${id}`
+            )) {
                 if (openMe) {
+                    // Stack traces shared by several queries are rendered
+                    // once and copied into place when first shown.
+                    for (const stack of el.querySelectorAll(
+                        "pre[data-djdt-stack]:empty"
+                    )) {
+                        const template = panelContent.querySelector(
+                            `#sqlStack_${stack.dataset.djdtStack}`
+                        );
+                        if (template) {
+                            stack.append(template.content.cloneNode(true));
+                        }
+                    }
                     el.classList.add("djSelected");
                     el.classList.remove("djUnselected");
                     this.textContent = toggleClose;
@@ -141,6 +154,30 @@ const djdt = {
             }
         });
 
+        // Used by the SQL panel, which only renders the first page of its
+        // queries. Further pages are loaded as they are scrolled into view.
+        const moreQueriesObserver = new IntersectionObserver((entries) => {
+            for (const entry of entries) {
+                if (entry.isIntersecting) {
+                    djdt.loadMoreQueries(entry.target, moreQueriesObserver);
+                }
+            }
+        });
+        $$.onPanelRender(djDebug, "SQLPanel", () => {
+            for (const el of djDebug.querySelectorAll(".djdt-sql-more")) {
+                moreQueriesObserver.observe(el);
+            }
+        });
+        $$.on(djDebug, "click", ".djdt-sql-more", function () {
+            djdt.loadMoreQueries(this, moreQueriesObserver);
+        });
+        $$.on(djDebug, "click", ".djdt-sql-call-sites", function () {
+            this.disabled = true;
+            ajax(this.dataset.djdtUrl).then((data) => {
+                this.parentElement.outerHTML = data.content;
+            });
+        });
+
         $$.on(djDebug, "click", "#djHideToolBarButton", (event) => {
             event.preventDefault();
             djdt.hideToolbar();
@@ -236,6 +273,37 @@ const djdt = {
             setTheme(userTheme);
         });
     },
+    loadMoreQueries(button, observer) {
+        if (button.disabled) {
+            return;
+        }
+        button.disabled = true;
+        const panelContent = button.closest(".djDebugPanelContent");
+        const tbody = panelContent.querySelector(
+            "tbody[data-djdt-sql-queries]"
+        );
+        ajax(button.dataset.djdtUrl).then((data) => {
+            const rows = document.createElement("template");
+            rows.innerHTML = data.content;
+            $$.applyStyles(rows.content);
+            tbody.append(rows.content);
+            button.parentElement.insertAdjacentHTML(
+                "beforebegin",
+                data.stacktraces
+            );
+            if (data.next) {
+                button.dataset.djdtUrl = data.next;
+                button.disabled = false;
+                // Observing the button again checks whether it's still in
+                // view once the new rows are in place.
+                observer.unobserve(button);
+                observer.observe(button);
+            } else {
+                observer.unobserve(button);
+                button.parentElement.remove();
+            }
+        });
+    },
     hidePanels() {
         const djDebug = getDebugElement();
         $$.hide(djDebug.querySelector("#djDebugWindow"));
@@ -1,19 +1,25 @@
 import base64
-import contextlib
 import functools
+import hashlib
 import json
-from collections import defaultdict, deque
+import os
+import sqlite3
+import threading
+import zlib
+from collections import Counter, OrderedDict
 from collections.abc import Iterable
 from typing import Any
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import transaction
+from django.db import router, transaction
+from django.db.models import Count, F
 from django.utils.module_loading import import_string
 
 from debug_toolbar import settings as dt_settings
-from debug_toolbar.models import HistoryEntry
+from debug_toolbar.models import HistoryEntry, HistoryEntryBlob, HistoryEntryPanel
 from debug_toolbar.sanitize import force_str
 
 BINARY_SENTINEL = "__djdt_binary__"
@@ -59,15 +65,181 @@ class DebugToolbarJSONDecoder(json.JSONDecoder):
         super().__init__(*args, **kwargs)
 
 
+class JSONSerializer:
+    """
+    Serialize panel data as JSON.
+
+    Serializers other than this one must define a ``header`` identifying their
+    output. The header is stored in front of the serialized data so the data
+    can still be read after the ``TOOLBAR_SERIALIZER_CLASS`` setting changes.
+    Data stored without a header is read as JSON.
+    """
+
+    header = ""
+
+    @classmethod
+    def dumps(cls, data: Any) -> str:
+        # If this starts throwing an exceptions, consider
+        # Subclassing DjangoJSONEncoder and using force_str to
+        # make it JSON serializable.
+        return json.dumps(data, cls=DebugToolbarJSONEncoder, skipkeys=True)
+
+    @classmethod
+    def loads(cls, data: str) -> Any:
+        return json.loads(data, cls=DebugToolbarJSONDecoder)
+
+
+class ZlibJSONSerializer(JSONSerializer):
+    """
+    Serialize panel data as zlib compressed JSON, encoded with base64 so it can
+    be kept by any store.
+    """
+
+    header = "zlib"
+    level = 1
+
+    @classmethod
+    def dumps(cls, data: Any) -> str:
+        encoded = json.dumps(
+            data, cls=DebugToolbarJSONEncoder, skipkeys=True, separators=(",", ":")
+        ).encode()
+        return base64.b64encode(zlib.compress(encoded, cls.level)).decode("ascii")
+
+    @classmethod
+    def loads(cls, data: str) -> Any:
+        return super().loads(zlib.decompress(base64.b64decode(data)))
+
+
+def get_serializer() -> type[JSONSerializer]:
+    return import_string(dt_settings.get_config()["TOOLBAR_SERIALIZER_CLASS"])
+
+
 def serialize(data: Any) -> str:
-    # If this starts throwing an exceptions, consider
-    # Subclassing DjangoJSONEncoder and using force_str to
-    # make it JSON serializable.
-    return json.dumps(data, cls=DebugToolbarJSONEncoder, skipkeys=True)
+    serializer = get_serializer()
+    if serializer.header:
+        return f"{serializer.header}:{serializer.dumps(data)}"
+    return serializer.dumps(data)
 
 
 def deserialize(data: str) -> Any:
-    return json.loads(data, cls=DebugToolbarJSONDecoder)
+    # Headers are short and JSON can't start with a letter, so only look for
+    # the separator at the start of the data.
+    header_end = data.find(":", 0, 32)
+    if header_end > 0:
+        header = data[:header_end]
+        for serializer in (get_serializer(), ZlibJSONSerializer):
+            if serializer.header == header:
+                return serializer.loads(data[header_end + 1 :])
+    return JSONSerializer.loads(data)
+
+
+class _DecodedPanelCache:
+    """
+    A bounded LRU cache of deserialized panel data.
+
+    Entries are keyed by ``(request_id, panel_id)`` and remember the
+    serialized data they were decoded from, so a panel that has been saved
+    again since it was cached is decoded afresh. Callers share the cached
+    objects and must treat them as read-only.
+
+    The cache is bounded by the size of the serialized data as well as by the
+    number of entries, since a decoded panel takes at least as much memory as
+    its serialized form. Panels too large to fit are decoded on every read.
+    """
+
+    maxsize = 128
+    max_bytes = 8 * 1024 * 1024
+
+    def __init__(self):
+        # Each entry is a (serialized, decoded, record indexes) tuple.
+        self._entries: OrderedDict[tuple[str, str], tuple[str, Any, dict]] = (
+            OrderedDict()
+        )
+        # The total length of the cached serialized data.
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, request_id: str, panel_id: str, data: str) -> Any:
+        """Return the deserialized ``data``, decoding it only if needed."""
+        key = (str(request_id), panel_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == data:
+                self._entries.move_to_end(key)
+                return entry[1]
+        decoded = deserialize(data)
+        with self._lock:
+            self._pop(key)
+            if len(data) <= self.max_bytes:
+                self._entries[key] = (data, decoded, {})
+                self._size += len(data)
+                while len(self._entries) > self.maxsize or self._size > self.max_bytes:
+                    self._pop(next(iter(self._entries)))
+        return decoded
+
+    def _pop(self, key: tuple[str, str]):
+        """Drop the entry for the given key, if any. The lock must be held."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def records(
+        self, request_id: str, panel_id: str, decoded: Any, field: str, id_key: str
+    ) -> dict:
+        """
+        Return a mapping of ``id_key`` values to the records listed under
+        ``field`` in the ``decoded`` panel data. The records can be a list of
+        dicts or columns: a dict mapping each key to the list of its values.
+
+        The mapping is cached alongside the decoded data when ``decoded`` is
+        the object currently cached for the panel.
+        """
+        with self._lock:
+            entry = self._entries.get((str(request_id), panel_id))
+        indexes = entry[2] if entry is not None and entry[1] is decoded else {}
+        index = indexes.get((field, id_key))
+        if index is None:
+            records = (decoded.get(field) if isinstance(decoded, dict) else None) or []
+            if isinstance(records, dict):
+                records = [
+                    dict(zip(records.keys(), values, strict=True))
+                    for values in zip(*records.values(), strict=True)
+                ]
+            index = {
+                record[id_key]: record
+                for record in records
+                if isinstance(record, dict) and id_key in record
+            }
+            indexes[(field, id_key)] = index
+        return index
+
+    def discard(self, request_id: str):
+        """Drop every cached panel for the given request_id."""
+        request_id = str(request_id)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == request_id]:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+_decoded_panels = _DecodedPanelCache()
+
+
+def _digest(serialized: str) -> str:
+    """Return the digest identifying a serialized payload in shared stores."""
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def _prune_batch_size() -> int:
+    """
+    The number of surplus requests a shared store may accumulate beyond
+    RESULTS_CACHE_SIZE before the oldest ones are pruned in one go.
+    """
+    return max(1, dt_settings.get_config()["RESULTS_CACHE_SIZE"] // 4)
 
 
 class BaseStore:
@@ -101,59 +273,273 @@ class BaseStore:
         """Save the panel data for the given request_id"""
         raise NotImplementedError
 
+    @classmethod
+    def save_panels(cls, request_id: str, panels: dict[str, Any]):
+        """
+        Save the data of several panels for the given request_id
+
+        Stores should override this to write all the panels in a single
+        operation.
+        """
+        for panel_id, data in panels.items():
+            cls.save_panel(request_id, panel_id, data)
+
+    @classmethod
+    def update_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        """
+        Save the data of several panels for the given request_id if it's still
+        in the store. Returns whether the data was saved.
+
+        Stores should override this to check for the request in the same
+        operation as the write, so a request deleted in the meantime isn't
+        stored again.
+        """
+        if not cls.exists(request_id):
+            return False
+        cls.save_panels(request_id, panels)
+        return True
+
     @classmethod
     def panel(cls, request_id: str, panel_id: str) -> Any:
         """Fetch the panel data for the given request_id"""
         raise NotImplementedError
 
+    @classmethod
+    def panels(cls, request_id: str) -> Any:
+        """Fetch all the panel data for the given request_id"""
+        raise NotImplementedError
+
+    @classmethod
+    def panel_record(
+        cls,
+        request_id: str,
+        panel_id: str,
+        field: str,
+        record_id: Any,
+        *,
+        id_key: str = "id",
+    ) -> Any:
+        """
+        Fetch a single record from a list in the panel data, such as one query
+        of the SQL panel, or ``None`` if it doesn't exist.
+
+        The records listed under ``field`` are indexed by their ``id_key``
+        value the first time the panel is searched.
+        """
+        data = cls.panel(request_id, panel_id)
+        records = _decoded_panels.records(request_id, panel_id, data, field, id_key)
+        return records.get(record_id)
+
+    # Async versions of the methods above. By default they run the synchronous
+    # method in a thread so they don't block the event loop. Stores that can do
+    # I/O asynchronously should override them.
+
+    @classmethod
+    async def arequest_ids(cls) -> Iterable:
+        """Async version of :meth:`request_ids`"""
+        return await sync_to_async(lambda: list(cls.request_ids()))()
+
+    @classmethod
+    async def aexists(cls, request_id: str) -> bool:
+        """Async version of :meth:`exists`"""
+        return await sync_to_async(cls.exists)(request_id)
+
+    @classmethod
+    async def aset(cls, request_id: str):
+        """Async version of :meth:`set`"""
+        await sync_to_async(cls.set)(request_id)
+
+    @classmethod
+    async def asave_panel(cls, request_id: str, panel_id: str, data: Any = None):
+        """Async version of :meth:`save_panel`"""
+        await cls.asave_panels(request_id, {panel_id: data})
+
+    @classmethod
+    async def asave_panels(cls, request_id: str, panels: dict[str, Any]):
+        """Async version of :meth:`save_panels`"""
+        await sync_to_async(cls.save_panels)(request_id, panels)
+
+    @classmethod
+    async def aupdate_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        """Async version of :meth:`update_panels`"""
+        return await sync_to_async(cls.update_panels)(request_id, panels)
+
+    @classmethod
+    async def apanel(cls, request_id: str, panel_id: str) -> Any:
+        """Async version of :meth:`panel`"""
+        return await sync_to_async(cls.panel)(request_id, panel_id)
+
+    @classmethod
+    async def apanels(cls, request_id: str) -> Any:
+        """Async version of :meth:`panels`"""
+        panels = await sync_to_async(lambda: list(cls.panels(request_id)))()
+        for panel_id, data in panels:
+            yield panel_id, data
+
 
 class MemoryStore(BaseStore):
-    # ids is the collection of storage ids that have been used.
-    # Use a dequeue to support O(1) appends and pops
-    # from either direction.
-    _request_ids: deque = deque()
-    _request_store: dict[str, dict] = defaultdict(dict)
+    # The ordered mapping of request ids to their serialized panel data doubles
+    # as the eviction index: the request written least recently is always
+    # first, so lookups, deletes and evictions are all O(1). Reads don't
+    # reorder it, so the history panel keeps listing requests in the order
+    # they were stored.
+    _request_store: OrderedDict[str, dict[str, str]] = OrderedDict()
+    # Many panels, such as the settings and versions panels, produce the same
+    # data on every request. Each distinct serialized payload is kept once,
+    # mapped to the shared string and the number of panels referencing it.
+    _blobs: dict[str, list] = {}
+    # The size of the distinct payloads, used to enforce
+    # RESULTS_CACHE_MAX_BYTES without re-measuring stored data.
+    _total_size: int = 0
+    # Guards the structures above against concurrent requests when running
+    # under a threaded server.
+    _lock = threading.RLock()
 
     @classmethod
     def request_ids(cls) -> Iterable:
         """The stored request ids"""
-        return cls._request_ids
+        with cls._lock:
+            return list(cls._request_store)
 
     @classmethod
     def exists(cls, request_id: str) -> bool:
         """Does the given request_id exist in the request store"""
-        return request_id in cls._request_ids
+        return request_id in cls._request_store
 
     @classmethod
     def set(cls, request_id: str):
         """Set a request_id in the request store"""
-        if request_id not in cls._request_ids:
-            cls._request_ids.append(request_id)
-        for _ in range(
-            len(cls._request_ids) - dt_settings.get_config()["RESULTS_CACHE_SIZE"]
+        with cls._lock:
+            if request_id not in cls._request_store:
+                cls._request_store[request_id] = {}
+            cls._evict(keep=request_id)
+
+    @classmethod
+    def _evict(cls, keep: str):
+        """
+        Drop the least recently written requests until the store fits within
+        RESULTS_CACHE_SIZE and RESULTS_CACHE_MAX_BYTES.
+
+        The request identified by ``keep`` is never evicted here.
+        """
+        config = dt_settings.get_config()
+        max_size = config["RESULTS_CACHE_SIZE"]
+        max_bytes = config["RESULTS_CACHE_MAX_BYTES"]
+        while len(cls._request_store) > max(max_size, 1) or (
+            max_bytes is not None
+            and cls._total_size > max_bytes
+            and len(cls._request_store) > 1
         ):
-            removed_id = cls._request_ids.popleft()
-            cls._request_store.pop(removed_id, None)
+            oldest_id = next(iter(cls._request_store))
+            if oldest_id == keep:
+                cls._request_store.move_to_end(keep)
+                oldest_id = next(iter(cls._request_store))
+            cls._remove(oldest_id)
+
+    @classmethod
+    def _intern(cls, serialized: str) -> str:
+        """
+        Return the stored copy of the serialized payload, adding it if it
+        isn't stored yet, and count the new reference to it.
+        """
+        blob = cls._blobs.get(serialized)
+        if blob is None:
+            blob = cls._blobs[serialized] = [serialized, 0]
+            # The JSON encoder escapes non-ASCII characters, so the length of
+            # the serialized string is its size in bytes.
+            cls._total_size += len(serialized)
+        blob[1] += 1
+        return blob[0]
+
+    @classmethod
+    def _release(cls, serialized: str):
+        """Drop a reference to the payload, freeing it once it's unused."""
+        blob = cls._blobs[serialized]
+        blob[1] -= 1
+        if not blob[1]:
+            del cls._blobs[serialized]
+            cls._total_size -= len(serialized)
+
+    @classmethod
+    def _remove(cls, request_id: str):
+        """Remove the request's data and release its payloads."""
+        for serialized in cls._request_store.pop(request_id, {}).values():
+            cls._release(serialized)
+        _decoded_panels.discard(request_id)
 
     @classmethod
     def clear(cls):
         """Remove all requests from the request store"""
-        cls._request_ids.clear()
-        cls._request_store.clear()
+        with cls._lock:
+            cls._request_store.clear()
+            cls._blobs.clear()
+            cls._total_size = 0
+        _decoded_panels.clear()
 
     @classmethod
     def delete(cls, request_id: str):
         """Delete the stored request for the given request_id"""
-        cls._request_store.pop(request_id, None)
-        # Suppress when request_id doesn't exist in the collection of ids.
-        with contextlib.suppress(ValueError):
-            cls._request_ids.remove(request_id)
+        with cls._lock:
+            cls._remove(request_id)
+        _decoded_panels.discard(request_id)
 
     @classmethod
     def save_panel(cls, request_id: str, panel_id: str, data: Any = None):
         """Save the panel data for the given request_id"""
-        cls.set(request_id)
-        cls._request_store[request_id][panel_id] = serialize(data)
+        cls.save_panels(request_id, {panel_id: data})
+
+    @classmethod
+    def save_panels(cls, request_id: str, panels: dict[str, Any]):
+        """Save the data of several panels for the given request_id"""
+        cls._save_panels(request_id, panels, create=True)
+
+    @classmethod
+    def update_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        """
+        Save the data of several panels for the given request_id if it's still
+        in the store
+        """
+        return cls._save_panels(request_id, panels, create=False)
+
+    @classmethod
+    def _save_panels(
+        cls, request_id: str, panels: dict[str, Any], *, create: bool
+    ) -> bool:
+        """
+        Save the panels' data, adding the request to the store when ``create``
+        is set. Returns whether the data was saved.
+        """
+        serialized_panels = {
+            panel_id: serialize(data) for panel_id, data in panels.items()
+        }
+        with cls._lock:
+            if create:
+                cls.set(request_id)
+            elif request_id not in cls._request_store:
+                return False
+            stored_panels = cls._request_store[request_id]
+            for panel_id, serialized in serialized_panels.items():
+                previous = stored_panels.get(panel_id)
+                stored_panels[panel_id] = cls._intern(serialized)
+                if previous is not None:
+                    cls._release(previous)
+            cls._request_store.move_to_end(request_id)
+            cls._evict(keep=request_id)
+
+            max_bytes = dt_settings.get_config()["RESULTS_CACHE_MAX_BYTES"]
+            if max_bytes is None:
+                return True
+            # This request alone exceeds the budget. Drop the largest of the
+            # panels just saved rather than letting the store grow past the
+            # limit.
+            for panel_id in sorted(
+                serialized_panels,
+                key=lambda panel_id: -len(serialized_panels[panel_id]),
+            ):
+                if cls._total_size <= max_bytes:
+                    break
+                cls._release(stored_panels.pop(panel_id))
+        return True
 
     @classmethod
     def panel(cls, request_id: str, panel_id: str) -> Any:
@@ -163,32 +549,155 @@ class MemoryStore(BaseStore):
         except KeyError:
             return {}
         else:
-            return deserialize(data)
+            return _decoded_panels.get(request_id, panel_id, data)
 
     @classmethod
     def panels(cls, request_id: str) -> Any:
         """Fetch all the panel data for the given request_id"""
-        try:
-            panel_mapping = cls._request_store[request_id]
-        except KeyError:
-            return {}
+        with cls._lock:
+            try:
+                panel_mapping = dict(cls._request_store[request_id])
+            except KeyError:
+                return {}
         for panel, data in panel_mapping.items():
-            yield panel, deserialize(data)
+            yield panel, _decoded_panels.get(request_id, panel, data)
+
+    # The store is in memory, so the async methods don't need a thread.
+
+    @classmethod
+    async def arequest_ids(cls) -> Iterable:
+        return cls.request_ids()
+
+    @classmethod
+    async def aexists(cls, request_id: str) -> bool:
+        return cls.exists(request_id)
+
+    @classmethod
+    async def aset(cls, request_id: str):
+        cls.set(request_id)
+
+    @classmethod
+    async def asave_panels(cls, request_id: str, panels: dict[str, Any]):
+        cls.save_panels(request_id, panels)
+
+    @classmethod
+    async def aupdate_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        return cls.update_panels(request_id, panels)
+
+    @classmethod
+    async def apanel(cls, request_id: str, panel_id: str) -> Any:
+        return cls.panel(request_id, panel_id)
+
+    @classmethod
+    async def apanels(cls, request_id: str) -> Any:
+        for panel_id, data in cls.panels(request_id):
+            yield panel_id, data
 
 
 class DatabaseStore(BaseStore):
+    _prune_lock = threading.Lock()
+    _requests_since_prune = 0
+
     @classmethod
     def _cleanup_old_entries(cls):
         """
         Enforce the cache size limit - keeping only the most recently used entries
         up to RESULTS_CACHE_SIZE.
         """
-        # Determine which entries to keep
-        keep_ids = cls.request_ids()
+        # Find the creation time of the oldest entry to keep using the index
+        # on created_at, then delete everything older than it.
+        cache_size = max(dt_settings.get_config()["RESULTS_CACHE_SIZE"], 1)
+        cutoff = list(
+            HistoryEntry.objects.values_list("created_at", flat=True)[
+                cache_size - 1 : cache_size
+            ]
+        )
+        if cutoff:
+            with transaction.atomic():
+                cls._lock_entries(HistoryEntry.objects.filter(created_at__lt=cutoff[0]))
+                cls._delete_panels(
+                    HistoryEntryPanel.objects.filter(entry__created_at__lt=cutoff[0])
+                )
+                HistoryEntry.objects.filter(created_at__lt=cutoff[0]).delete()
+
+    @classmethod
+    def _lock_entries(cls, entries) -> list[str]:
+        """
+        Lock the entries of the given queryset until the end of the
+        transaction and return their request ids. Panels being saved for an
+        entry and its deletion then wait for each other. Must run in a
+        transaction.
+        """
+        return list(entries.select_for_update().values_list("request_id", flat=True))
+
+    @classmethod
+    def _update_refs(cls, refs: Counter, sign: int) -> set[str]:
+        """
+        Add (``sign=1``) or remove (``sign=-1``) the given number of
+        references to each blob, with one query per distinct number. Returns
+        the digests of the blobs that were updated.
+        """
+        by_count: dict[int, list[str]] = {}
+        for digest, count in refs.items():
+            by_count.setdefault(count, []).append(digest)
+        updated = set()
+        for count, digests in by_count.items():
+            blobs = HistoryEntryBlob.objects.filter(digest__in=digests)
+            if blobs.update(refs=F("refs") + sign * count) == len(digests):
+                updated.update(digests)
+            else:
+                updated.update(blobs.values_list("digest", flat=True))
+        return updated
+
+    @classmethod
+    def _reference_blobs(cls, blobs: dict[str, str], refs: Counter):
+        """
+        Count the references to the blobs, a mapping of digests to serialized
+        data, creating the blobs that don't exist yet. Must run in a
+        transaction.
+        """
+        while refs:
+            HistoryEntryBlob.objects.bulk_create(
+                [
+                    HistoryEntryBlob(digest=digest, data=blobs[digest])
+                    for digest in refs
+                ],
+                ignore_conflicts=True,
+            )
+            # A blob that was unused may have been deleted by another request
+            # since it was found to exist. It's created again on the next
+            # iteration.
+            for digest in cls._update_refs(refs, 1):
+                del refs[digest]
 
-        # Delete all entries not in the keep list
-        if keep_ids:
-            HistoryEntry.objects.exclude(request_id__in=keep_ids).delete()
+    @classmethod
+    def _delete_panels(cls, panels):
+        """
+        Delete the panels of the given queryset and release their blobs,
+        deleting the blobs no longer referenced. Must run in a transaction.
+        """
+        refs = Counter(
+            dict(panels.values_list("blob").annotate(count=Count("pk")).order_by())
+        )
+        if not refs:
+            return
+        panels.delete()
+        cls._update_refs(refs, -1)
+        HistoryEntryBlob.objects.filter(digest__in=refs, refs__lte=0).delete()
+
+    @classmethod
+    def _prune_due(cls) -> bool:
+        """
+        Count a new request and return whether old entries should be pruned.
+        Entries are pruned once enough requests have been stored since the last
+        prune, so the cost of eviction is shared between many requests.
+        """
+        with cls._prune_lock:
+            cls._requests_since_prune += 1
+            if cls._requests_since_prune < _prune_batch_size():
+                return False
+            cls._requests_since_prune = 0
+        return True
 
     @classmethod
     def request_ids(cls):
@@ -205,56 +714,165 @@ class DatabaseStore(BaseStore):
 
     @classmethod
     def set(cls, request_id: str):
-        """Set a request_id in the store and clean up old entries"""
-        with transaction.atomic():
-            # Create the entry if it doesn't exist (ignore otherwise)
-            _, created = HistoryEntry.objects.get_or_create(request_id=request_id)
-
-            # Only enforce cache size limit when new entries are created
-            if created:
-                cls._cleanup_old_entries()
+        """Set a request_id in the store and periodically clean up old entries"""
+        # Create the entry if it doesn't exist (ignore otherwise)
+        HistoryEntry.objects.bulk_create(
+            [HistoryEntry(request_id=request_id)], ignore_conflicts=True
+        )
+        if cls._prune_due():
+            cls._cleanup_old_entries()
 
     @classmethod
     def clear(cls):
         """Remove all requests from the store"""
-        HistoryEntry.objects.all().delete()
+        # Delete the panels explicitly rather than relying on the cascade, so
+        # each table is cleared with a single query.
+        with transaction.atomic():
+            HistoryEntryPanel.objects.all().delete()
+            HistoryEntryBlob.objects.all().delete()
+            HistoryEntry.objects.all().delete()
+        _decoded_panels.clear()
 
     @classmethod
     def delete(cls, request_id: str):
         """Delete the stored request for the given request_id"""
-        HistoryEntry.objects.filter(request_id=request_id).delete()
+        with transaction.atomic():
+            entries = HistoryEntry.objects.filter(request_id=request_id)
+            cls._lock_entries(entries)
+            cls._delete_panels(HistoryEntryPanel.objects.filter(entry_id=request_id))
+            entries.delete()
+        _decoded_panels.discard(request_id)
 
     @classmethod
     def save_panel(cls, request_id: str, panel_id: str, data: Any = None):
         """Save the panel data for the given request_id"""
-        with transaction.atomic():
-            obj, _ = HistoryEntry.objects.get_or_create(request_id=request_id)
-            store_data = obj.data
-            store_data[panel_id] = serialize(data)
-            obj.data = store_data
-            obj.save()
+        cls.save_panels(request_id, {panel_id: data})
+
+    @classmethod
+    def save_panels(cls, request_id: str, panels: dict[str, Any]):
+        """
+        Save the data of several panels for the given request_id
+
+        Identical data is stored once in a blob shared by every panel with
+        that data.
+        """
+        cls._save_panels(request_id, panels, create=True)
+
+    @classmethod
+    def update_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        """
+        Save the data of several panels for the given request_id if it's still
+        in the store
+        """
+        return cls._save_panels(request_id, panels, create=False)
+
+    @classmethod
+    def _save_panels(
+        cls, request_id: str, panels: dict[str, Any], *, create: bool
+    ) -> bool:
+        """
+        Save the panels' data, adding the request to the store when ``create``
+        is set. Returns whether the data was saved.
+        """
+        blobs = {}
+        digests = {}
+        for panel_id, data in panels.items():
+            serialized = serialize(data)
+            digests[panel_id] = digest = _digest(serialized)
+            blobs[digest] = serialized
+        with transaction.atomic(using=router.db_for_write(HistoryEntryPanel)):
+            if create:
+                HistoryEntry.objects.bulk_create(
+                    [HistoryEntry(request_id=request_id)], ignore_conflicts=True
+                )
+            elif not cls._lock_entries(
+                HistoryEntry.objects.filter(request_id=request_id)
+            ):
+                return False
+            cls._delete_panels(
+                HistoryEntryPanel.objects.filter(
+                    entry_id=request_id, panel_id__in=panels
+                )
+            )
+            cls._reference_blobs(blobs, Counter(digests.values()))
+            HistoryEntryPanel.objects.bulk_create(
+                [
+                    HistoryEntryPanel(
+                        entry_id=request_id, panel_id=panel_id, blob_id=digest
+                    )
+                    for panel_id, digest in digests.items()
+                ]
+            )
+        return True
 
     @classmethod
     def panel(cls, request_id: str, panel_id: str) -> Any:
         """Fetch the panel data for the given request_id"""
-        try:
-            data = HistoryEntry.objects.get(request_id=request_id).data
-            panel_data = data.get(panel_id)
-            if panel_data is None:
-                return {}
-            return deserialize(panel_data)
-        except HistoryEntry.DoesNotExist:
+        panel_data = (
+            HistoryEntryPanel.objects.filter(entry_id=request_id, panel_id=panel_id)
+            .values_list("blob__data", flat=True)
+            .first()
+        )
+        if panel_data is None:
             return {}
+        return _decoded_panels.get(request_id, panel_id, panel_data)
 
     @classmethod
     def panels(cls, request_id: str) -> Any:
         """Fetch all panel data for the given request_id"""
-        try:
-            data = HistoryEntry.objects.get(request_id=request_id).data
-            for panel_id, panel_data in data.items():
-                yield panel_id, deserialize(panel_data)
-        except HistoryEntry.DoesNotExist:
+        rows = HistoryEntryPanel.objects.filter(entry_id=request_id).values_list(
+            "panel_id", "blob__data"
+        )
+        for panel_id, panel_data in rows:
+            yield panel_id, _decoded_panels.get(request_id, panel_id, panel_data)
+
+    @classmethod
+    async def arequest_ids(cls) -> Iterable:
+        """Async version of :meth:`request_ids`"""
+        cache_size = dt_settings.get_config()["RESULTS_CACHE_SIZE"]
+        return [
+            request_id
+            async for request_id in HistoryEntry.objects.all()[:cache_size].values_list(
+                "request_id", flat=True
+            )
+        ]
+
+    @classmethod
+    async def aexists(cls, request_id: str) -> bool:
+        """Async version of :meth:`exists`"""
+        return await HistoryEntry.objects.filter(request_id=request_id).aexists()
+
+    @classmethod
+    async def aset(cls, request_id: str):
+        """Async version of :meth:`set`"""
+        await HistoryEntry.objects.abulk_create(
+            [HistoryEntry(request_id=request_id)], ignore_conflicts=True
+        )
+        if cls._prune_due():
+            await sync_to_async(cls._cleanup_old_entries)()
+
+    @classmethod
+    async def apanel(cls, request_id: str, panel_id: str) -> Any:
+        """Async version of :meth:`panel`"""
+        panel_data = (
+            await HistoryEntryPanel.objects.filter(
+                entry_id=request_id, panel_id=panel_id
+            )
+            .values_list("blob__data", flat=True)
+            .afirst()
+        )
+        if panel_data is None:
             return {}
+        return _decoded_panels.get(request_id, panel_id, panel_data)
+
+    @classmethod
+    async def apanels(cls, request_id: str) -> Any:
+        """Async version of :meth:`panels`"""
+        rows = HistoryEntryPanel.objects.filter(entry_id=request_id).values_list(
+            "panel_id", "blob__data"
+        )
+        async for panel_id, panel_data in rows:
+            yield panel_id, _decoded_panels.get(request_id, panel_id, panel_data)
 
 
 class _UntrackedCache:
@@ -274,18 +892,36 @@ class _UntrackedCache:
         if not callable(attr):
             return attr
 
-        @functools.wraps(attr)
-        def untracked(*args, **kwargs):
-            panel = getattr(self._cache, "_djdt_panel", None)
-            self._cache._djdt_panel = None
-            try:
-                return attr(*args, **kwargs)
-            finally:
-                self._cache._djdt_panel = panel
+        if iscoroutinefunction(attr):
+
+            @functools.wraps(attr)
+            async def untracked(*args, **kwargs):
+                panel = getattr(self._cache, "_djdt_panel", None)
+                self._cache._djdt_panel = None
+                try:
+                    return await attr(*args, **kwargs)
+                finally:
+                    self._cache._djdt_panel = panel
+
+        else:
+
+            @functools.wraps(attr)
+            def untracked(*args, **kwargs):
+                panel = getattr(self._cache, "_djdt_panel", None)
+                self._cache._djdt_panel = None
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    self._cache._djdt_panel = panel
 
         return untracked
 
 
+def _is_slot(value: Any) -> bool:
+    """Is the value an ``(index, request_id)`` pair stored by CacheStore."""
+    return isinstance(value, (tuple, list)) and len(value) == 2
+
+
 class CacheStore(BaseStore):
     """
     Store that uses Django's cache framework to persist debug toolbar data.
@@ -333,98 +969,632 @@ class CacheStore(BaseStore):
 
     @classmethod
     def _request_ids_key(cls) -> str:
-        """Return the cache key for the request IDs list."""
+        """Return the prefix of the cache keys of the request id slots."""
         return f"{cls._key_prefix()}request_ids"
 
+    @classmethod
+    def _counter_key(cls) -> str:
+        """Return the cache key of the index of the newest request."""
+        return f"{cls._request_ids_key()}:counter"
+
+    @classmethod
+    def _ring_size_key(cls) -> str:
+        """Return the cache key of the number of slots last used."""
+        return f"{cls._request_ids_key()}:size"
+
+    @classmethod
+    def _slot_count(cls) -> int:
+        """
+        Return the number of request id slots, enough to hold the stored
+        requests and a surplus that is yet to be pruned.
+        """
+        return dt_settings.get_config()["RESULTS_CACHE_SIZE"] + 2 * _prune_batch_size()
+
+    @classmethod
+    def _request_id_slot_key(cls, index: int) -> str:
+        """Return the cache key of the slot that holds the index-th request id."""
+        return f"{cls._request_ids_key()}:{index % cls._slot_count()}"
+
+    @classmethod
+    def _slot_keys(cls, start: int = 0, stop: int | None = None) -> list[str]:
+        """Return the cache keys of the slots at the given positions."""
+        if stop is None:
+            stop = cls._slot_count()
+        return [
+            f"{cls._request_ids_key()}:{position}" for position in range(start, stop)
+        ]
+
     @classmethod
     def _request_key(cls, request_id: str) -> str:
-        """Return the cache key for a specific request's data."""
+        """Return the cache key for the list of a request's panel ids."""
         return f"{cls._key_prefix()}req:{request_id}"
 
+    @classmethod
+    def _panel_key(cls, request_id: str, panel_id: str) -> str:
+        """Return the cache key for the data of a request's panel."""
+        return f"{cls._request_key(request_id)}:{panel_id}"
+
+    @classmethod
+    def _add_request(cls, cache, request_id: str, panel_ids: Iterable = ()) -> bool:
+        """
+        Add the request to the store unless it's already there. Returns
+        whether the request was added.
+        """
+        if not cache.add(cls._request_key(request_id), list(panel_ids), None):
+            return False
+        cls._add_to_ring(cache, request_id)
+        return True
+
+    @classmethod
+    def _add_to_ring(cls, cache, request_id: str):
+        """
+        Store the request id in the next slot of the ring.
+
+        The index of the newest request is kept in a counter, so storing a
+        request doesn't depend on the number of slots. Slots are claimed with
+        ``add()``, which is atomic, so concurrent writers never overwrite each
+        other's ids. A slot that is still taken by a request beyond
+        RESULTS_CACHE_SIZE, for instance one stored before the setting
+        changed, is overwritten. If another writer claimed it, the next
+        indexes are tried, and if every slot is taken the oldest one is
+        overwritten.
+        """
+        max_size = dt_settings.get_config()["RESULTS_CACHE_SIZE"]
+        index = cls._next_index(cache)
+        for _ in range(cls._slot_count()):
+            key = cls._request_id_slot_key(index)
+            if cache.add(key, (index, request_id), None):
+                break
+            slot = cache.get(key)
+            if not _is_slot(slot) or slot[0] <= index - max_size:
+                cls._delete_slots(cache, {key: slot})
+                cache.set(key, (index, request_id), None)
+                break
+            index = cls._next_index(cache)
+        else:
+            cls._replace_oldest_slot(cache, index, request_id)
+        if index % _prune_batch_size() == 0:
+            cls._prune(cache, index)
+
+    @classmethod
+    def _next_index(cls, cache) -> int:
+        """Increment the counter and return the index it now holds."""
+        counter_key = cls._counter_key()
+        try:
+            return cache.incr(counter_key)
+        except ValueError:
+            pass
+        # The counter was evicted or never set, so continue after the newest
+        # stored request.
+        slots = cache.get_many(cls._slot_keys()).values()
+        index = max((slot[0] for slot in slots if _is_slot(slot)), default=0) + 1
+        if cache.add(counter_key, index, None):
+            return index
+        return cache.incr(counter_key)
+
+    @classmethod
+    def _replace_oldest_slot(cls, cache, index: int, request_id: str):
+        """Store the request id in the slot of the oldest request."""
+        slots = cache.get_many(cls._slot_keys())
+        if not slots:
+            cache.set(cls._request_id_slot_key(index), (index, request_id), None)
+            return
+        oldest = min(
+            slots, key=lambda key: slots[key][0] if _is_slot(slots[key]) else 0
+        )
+        cls._delete_slots(cache, {oldest: slots[oldest]})
+        cache.set(oldest, (index, request_id), None)
+
+    @classmethod
+    def _prune(cls, cache, index: int):
+        """
+        Delete the requests beyond RESULTS_CACHE_SIZE. This is done once a
+        batch of requests is due, so only the slots of the last two batches
+        are read, rather than every slot.
+
+        Slots outside of the ring, left over from a larger RESULTS_CACHE_SIZE,
+        are deleted too.
+        """
+        slot_count = cls._slot_count()
+        oldest = index - dt_settings.get_config()["RESULTS_CACHE_SIZE"]
+        # The slots that follow the newest request hold the oldest ones.
+        keys = [
+            cls._request_id_slot_key(index + offset)
+            for offset in range(1, 2 * _prune_batch_size() + 1)
+        ]
+        ring_size_key = cls._ring_size_key()
+        slots = cache.get_many([*keys, ring_size_key])
+        ring_size = slots.pop(ring_size_key, None)
+        surplus = {
+            key: slot
+            for key, slot in slots.items()
+            if not _is_slot(slot) or slot[0] <= oldest
+        }
+        if ring_size != slot_count:
+            if isinstance(ring_size, int) and ring_size > slot_count:
+                surplus.update(cache.get_many(cls._slot_keys(slot_count, ring_size)))
+            cache.set(ring_size_key, slot_count, None)
+        if surplus:
+            cls._delete_slots(cache, surplus)
+
+    @classmethod
+    def _delete_slots(cls, cache, slots: dict[str, Any]):
+        """
+        Delete the given request id slots, a mapping of their keys to their
+        values, and the requests stored in them.
+        """
+        request_ids = [slot[1] for slot in slots.values() if _is_slot(slot)]
+        request_keys = [cls._request_key(_id) for _id in request_ids]
+        keys = [*slots, *request_keys]
+        for request_key, panel_ids in cache.get_many(request_keys).items():
+            keys.extend(f"{request_key}:{panel_id}" for panel_id in panel_ids)
+        cache.delete_many(keys)
+        for request_id in request_ids:
+            _decoded_panels.discard(request_id)
+
     @classmethod
     def request_ids(cls) -> Iterable:
         """The stored request ids."""
-        return cls._get_cache().get(cls._request_ids_key(), [])
+        cache = cls._get_cache()
+        slots = dict(
+            slot for slot in cache.get_many(cls._slot_keys()).values() if _is_slot(slot)
+        )
+        max_size = dt_settings.get_config()["RESULTS_CACHE_SIZE"]
+        newest = sorted(slots, reverse=True)[:max_size]
+        request_ids = [slots[index] for index in reversed(newest)]
+        # Skip the requests that have been deleted since they were added.
+        stored = cache.get_many([cls._request_key(_id) for _id in request_ids])
+        return [_id for _id in request_ids if cls._request_key(_id) in stored]
 
     @classmethod
     def exists(cls, request_id: str) -> bool:
         """Does the given request_id exist in the store."""
-        return request_id in cls.request_ids()
+        return cls._get_cache().has_key(cls._request_key(request_id))
 
     @classmethod
     def set(cls, request_id: str):
         """Set a request_id in the store."""
-        cache = cls._get_cache()
-        ids_key = cls._request_ids_key()
-        request_ids = deque(cache.get(ids_key, []))
-
-        if request_id not in request_ids:
-            request_ids.append(request_id)
-
-        # Enforce RESULTS_CACHE_SIZE limit
-        max_size = dt_settings.get_config()["RESULTS_CACHE_SIZE"]
-        while len(request_ids) > max_size:
-            removed_id = request_ids.popleft()
-            cache.delete(cls._request_key(removed_id))
-
-        cache.set(ids_key, list(request_ids), None)
+        cls._add_request(cls._get_cache(), request_id)
 
     @classmethod
     def clear(cls):
         """Remove all requests from the request store."""
         cache = cls._get_cache()
-        ids_key = cls._request_ids_key()
-        request_ids = cache.get(ids_key, [])
-
-        # Delete all request data
-        if request_ids:
-            cache.delete_many([cls._request_key(_id) for _id in request_ids])
-
-        # Clear the request IDs list
-        cache.delete(ids_key)
+        ring_size = max(cache.get(cls._ring_size_key(), 0), cls._slot_count())
+        cls._delete_slots(cache, cache.get_many(cls._slot_keys(stop=ring_size)))
+        cache.delete_many([cls._counter_key(), cls._ring_size_key()])
+        _decoded_panels.clear()
 
     @classmethod
     def delete(cls, request_id: str):
         """Delete the stored request for the given request_id."""
         cache = cls._get_cache()
-        ids_key = cls._request_ids_key()
-        request_ids = list(cache.get(ids_key, []))
-
-        # Remove from the list if present
-        if request_id in request_ids:
-            request_ids.remove(request_id)
-            cache.set(ids_key, request_ids, None)
-
-        # Delete the request data
-        cache.delete(cls._request_key(request_id))
+        request_key = cls._request_key(request_id)
+        panel_ids = cache.get(request_key, [])
+        cache.delete_many(
+            [request_key]
+            + [cls._panel_key(request_id, panel_id) for panel_id in panel_ids]
+        )
+        _decoded_panels.discard(request_id)
 
     @classmethod
     def save_panel(cls, request_id: str, panel_id: str, data: Any = None):
         """Save the panel data for the given request_id."""
-        cls.set(request_id)
+        cls.save_panels(request_id, {panel_id: data})
+
+    @classmethod
+    def save_panels(cls, request_id: str, panels: dict[str, Any]):
+        """Save the data of several panels for the given request_id."""
+        cache = cls._get_cache()
+        request_key = cls._request_key(request_id)
+        data = {
+            cls._panel_key(request_id, panel_id): serialize(panel_data)
+            for panel_id, panel_data in panels.items()
+        }
+        panel_ids = cache.get(request_key)
+        if panel_ids is None:
+            if cls._add_request(cache, request_id, panels):
+                cache.set_many(data, None)
+                return
+            # Another writer added the request in the meantime.
+            panel_ids = cache.get(request_key, [])
+        new_panel_ids = [panel_id for panel_id in panels if panel_id not in panel_ids]
+        if new_panel_ids:
+            data[request_key] = panel_ids + new_panel_ids
+        cache.set_many(data, None)
+
+    @classmethod
+    def update_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        """
+        Save the data of several panels for the given request_id if it's still
+        in the store.
+        """
         cache = cls._get_cache()
         request_key = cls._request_key(request_id)
-        request_data = cache.get(request_key, {})
-        request_data[panel_id] = serialize(data)
-        cache.set(request_key, request_data, None)
+        if not cache.has_key(request_key):
+            return False
+        data = {
+            cls._panel_key(request_id, panel_id): serialize(panel_data)
+            for panel_id, panel_data in panels.items()
+        }
+        cache.set_many(data, None)
+        # A cache can't check for the request and write in a single step, so
+        # check again once the data is written and drop it if the request was
+        # deleted in the meantime.
+        panel_ids = cache.get(request_key)
+        if panel_ids is None:
+            cache.delete_many(list(data))
+            return False
+        new_panel_ids = [panel_id for panel_id in panels if panel_id not in panel_ids]
+        if new_panel_ids:
+            cache.set(request_key, panel_ids + new_panel_ids, None)
+        return True
 
     @classmethod
     def panel(cls, request_id: str, panel_id: str) -> Any:
         """Fetch the panel data for the given request_id."""
-        cache = cls._get_cache()
-        request_data = cache.get(cls._request_key(request_id), {})
-        panel_data = request_data.get(panel_id)
+        panel_data = cls._get_cache().get(cls._panel_key(request_id, panel_id))
         if panel_data is None:
             return {}
-        return deserialize(panel_data)
+        return _decoded_panels.get(request_id, panel_id, panel_data)
 
     @classmethod
     def panels(cls, request_id: str) -> Any:
         """Fetch all the panel data for the given request_id."""
         cache = cls._get_cache()
-        request_data = cache.get(cls._request_key(request_id), {})
-        for panel_id, panel_data in request_data.items():
-            yield panel_id, deserialize(panel_data)
+        panel_keys = {
+            cls._panel_key(request_id, panel_id): panel_id
+            for panel_id in cache.get(cls._request_key(request_id), [])
+        }
+        for key, panel_data in cache.get_many(panel_keys).items():
+            yield (
+                panel_keys[key],
+                _decoded_panels.get(request_id, panel_keys[key], panel_data),
+            )
+
+    @classmethod
+    async def _aadd_request(
+        cls, cache, request_id: str, panel_ids: Iterable = ()
+    ) -> bool:
+        """Async version of :meth:`_add_request`."""
+        if not await cache.aadd(cls._request_key(request_id), list(panel_ids), None):
+            return False
+        await sync_to_async(cls._add_to_ring)(cache, request_id)
+        return True
+
+    @classmethod
+    async def aexists(cls, request_id: str) -> bool:
+        """Async version of :meth:`exists`."""
+        return await cls._get_cache().ahas_key(cls._request_key(request_id))
+
+    @classmethod
+    async def aset(cls, request_id: str):
+        """Async version of :meth:`set`."""
+        await cls._aadd_request(cls._get_cache(), request_id)
+
+    @classmethod
+    async def asave_panels(cls, request_id: str, panels: dict[str, Any]):
+        """Async version of :meth:`save_panels`."""
+        cache = cls._get_cache()
+        request_key = cls._request_key(request_id)
+        data = {
+            cls._panel_key(request_id, panel_id): serialize(panel_data)
+            for panel_id, panel_data in panels.items()
+        }
+        panel_ids = await cache.aget(request_key)
+        if panel_ids is None:
+            if await cls._aadd_request(cache, request_id, panels):
+                await cache.aset_many(data, None)
+                return
+            panel_ids = await cache.aget(request_key, [])
+        new_panel_ids = [panel_id for panel_id in panels if panel_id not in panel_ids]
+        if new_panel_ids:
+            data[request_key] = panel_ids + new_panel_ids
+        await cache.aset_many(data, None)
+
+    @classmethod
+    async def apanel(cls, request_id: str, panel_id: str) -> Any:
+        """Async version of :meth:`panel`."""
+        panel_data = await cls._get_cache().aget(cls._panel_key(request_id, panel_id))
+        if panel_data is None:
+            return {}
+        return _decoded_panels.get(request_id, panel_id, panel_data)
+
+    @classmethod
+    async def apanels(cls, request_id: str) -> Any:
+        """Async version of :meth:`panels`."""
+        cache = cls._get_cache()
+        panel_keys = {
+            cls._panel_key(request_id, panel_id): panel_id
+            for panel_id in await cache.aget(cls._request_key(request_id), [])
+        }
+        for key, panel_data in (await cache.aget_many(panel_keys)).items():
+            yield (
+                panel_keys[key],
+                _decoded_panels.get(request_id, panel_keys[key], panel_data),
+            )
+
+
+class SQLiteStore(BaseStore):
+    """
+    Store that keeps the toolbar's data in a SQLite database file.
+
+    The database is opened in WAL mode, so every process of a multi-process
+    server can share the toolbar's history without writing to the project's
+    database or running another service.
+    """
+
+    _local = threading.local()
+    _prune_lock = threading.Lock()
+    _requests_since_prune = 0
+
+    @classmethod
+    def _path(cls) -> str:
+        """Get the path of the database file from settings."""
+        path = dt_settings.get_config()["SQLITE_STORE_PATH"]
+        if not path:
+            raise ImproperlyConfigured(
+                "SQLiteStore requires the SQLITE_STORE_PATH setting."
+            )
+        return path
+
+    @classmethod
+    def _connection(cls) -> sqlite3.Connection:
+        """
+        Get this thread's connection to the database, creating the tables if
+        needed. Connections aren't shared with forked processes.
+        """
+        path = cls._path()
+        key = (path, os.getpid())
+        if getattr(cls._local, "key", None) != key:
+            # The data includes request headers and SQL parameters, so only
+            # the owner may read the file. SQLite gives its WAL and shared
+            # memory files the same permissions.
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+            connection = sqlite3.connect(path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS djdt_request (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT NOT NULL UNIQUE
+                );
+                CREATE TABLE IF NOT EXISTS djdt_blob (
+                    digest TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    refs INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS djdt_panel (
+                    request_id TEXT NOT NULL,
+                    panel_id TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (request_id, panel_id)
+                ) WITHOUT ROWID;
+                """
+            )
+            cls._local.key = key
+            cls._local.connection = connection
+        return cls._local.connection
+
+    @classmethod
+    def _cleanup_old_entries(cls, connection: sqlite3.Connection):
+        """
+        Enforce the cache size limit - keeping only the most recently added
+        entries up to RESULTS_CACHE_SIZE.
+        """
+        cache_size = max(dt_settings.get_config()["RESULTS_CACHE_SIZE"], 1)
+        row = connection.execute(
+            "SELECT seq FROM djdt_request ORDER BY seq DESC LIMIT 1 OFFSET ?",
+            (cache_size - 1,),
+        ).fetchone()
+        if row:
+            cls._delete_panels(
+                connection,
+                "request_id IN (SELECT request_id FROM djdt_request WHERE seq < ?)",
+                row,
+            )
+            connection.execute("DELETE FROM djdt_request WHERE seq < ?", row)
+
+    @classmethod
+    def _delete_panels(
+        cls, connection: sqlite3.Connection, condition: str, params: Iterable
+    ):
+        """
+        Delete the panels matching the SQL condition and release their blobs,
+        deleting the blobs no longer referenced.
+        """
+        refs = connection.execute(
+            f"SELECT digest, COUNT(*) FROM djdt_panel WHERE {condition} "
+            "GROUP BY digest",
+            params,
+        ).fetchall()
+        if not refs:
+            return
+        connection.execute(f"DELETE FROM djdt_panel WHERE {condition}", params)
+        connection.executemany(
+            "UPDATE djdt_blob SET refs = refs - ? WHERE digest = ?",
+            [(count, digest) for digest, count in refs],
+        )
+        connection.executemany(
+            "DELETE FROM djdt_blob WHERE digest = ? AND refs <= 0",
+            [(digest,) for digest, _ in refs],
+        )
+
+    @classmethod
+    def _prune_if_due(cls, connection: sqlite3.Connection):
+        """
+        Prune old entries once enough requests have been stored since the last
+        prune, so the cost of eviction is shared between many requests.
+        """
+        with cls._prune_lock:
+            cls._requests_since_prune += 1
+            if cls._requests_since_prune < _prune_batch_size():
+                return
+            cls._requests_since_prune = 0
+        cls._cleanup_old_entries(connection)
+
+    @classmethod
+    def _add_request(cls, connection: sqlite3.Connection, request_id: str):
+        """Add the request to the store unless it's already there."""
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO djdt_request (request_id) VALUES (?)",
+            (request_id,),
+        )
+        if cursor.rowcount:
+            cls._prune_if_due(connection)
+
+    @classmethod
+    def request_ids(cls):
+        """The stored request ids."""
+        cache_size = dt_settings.get_config()["RESULTS_CACHE_SIZE"]
+        rows = cls._connection().execute(
+            "SELECT request_id FROM djdt_request ORDER BY seq DESC LIMIT ?",
+            (cache_size,),
+        )
+        return [request_id for (request_id,) in rows][::-1]
+
+    @classmethod
+    def exists(cls, request_id: str) -> bool:
+        """Does the given request_id exist in the store."""
+        row = (
+            cls._connection()
+            .execute("SELECT 1 FROM djdt_request WHERE request_id = ?", (request_id,))
+            .fetchone()
+        )
+        return row is not None
+
+    @classmethod
+    def set(cls, request_id: str):
+        """Set a request_id in the store and periodically clean up old entries"""
+        connection = cls._connection()
+        with connection:
+            cls._add_request(connection, request_id)
+
+    @classmethod
+    def clear(cls):
+        """Remove all requests from the request store."""
+        connection = cls._connection()
+        with connection:
+            connection.execute("DELETE FROM djdt_request")
+            connection.execute("DELETE FROM djdt_panel")
+            connection.execute("DELETE FROM djdt_blob")
+        _decoded_panels.clear()
+
+    @classmethod
+    def delete(cls, request_id: str):
+        """Delete the stored request for the given request_id."""
+        connection = cls._connection()
+        with connection:
+            # Write first, so the transaction holds the write lock before it
+            # reads the panels' blobs.
+            connection.execute(
+                "DELETE FROM djdt_request WHERE request_id = ?", (request_id,)
+            )
+            cls._delete_panels(connection, "request_id = ?", (request_id,))
+        _decoded_panels.discard(request_id)
+
+    @classmethod
+    def save_panel(cls, request_id: str, panel_id: str, data: Any = None):
+        """Save the panel data for the given request_id."""
+        cls.save_panels(request_id, {panel_id: data})
+
+    @classmethod
+    def save_panels(cls, request_id: str, panels: dict[str, Any]):
+        """
+        Save the data of several panels for the given request_id.
+
+        Identical data is stored once in a blob shared by every panel with
+        that data.
+        """
+        cls._save_panels(request_id, panels, create=True)
+
+    @classmethod
+    def update_panels(cls, request_id: str, panels: dict[str, Any]) -> bool:
+        """
+        Save the data of several panels for the given request_id if it's still
+        in the store.
+        """
+        return cls._save_panels(request_id, panels, create=False)
+
+    @classmethod
+    def _save_panels(
+        cls, request_id: str, panels: dict[str, Any], *, create: bool
+    ) -> bool:
+        """
+        Save the panels' data, adding the request to the store when ``create``
+        is set. Returns whether the data was saved.
+        """
+        blobs = []
+        rows = []
+        for panel_id, data in panels.items():
+            serialized = serialize(data)
+            digest = _digest(serialized)
+            blobs.append((digest, serialized))
+            rows.append((request_id, panel_id, digest))
+        connection = cls._connection()
+        with connection:
+            if create:
+                cls._add_request(connection, request_id)
+            else:
+                # A no-op write takes the write lock while checking for the
+                # request, so it can't be deleted before the panels are saved.
+                cursor = connection.execute(
+                    "UPDATE djdt_request SET request_id = request_id "
+                    "WHERE request_id = ?",
+                    (request_id,),
+                )
+                if not cursor.rowcount:
+                    return False
+            if not panels:
+                return True
+            cls._delete_panels(
+                connection,
+                f"request_id = ? AND panel_id IN ({', '.join('?' * len(panels))})",
+                (request_id, *panels),
+            )
+            connection.executemany(
+                "INSERT INTO djdt_blob (digest, data, refs) VALUES (?, ?, 1) "
+                "ON CONFLICT (digest) DO UPDATE SET refs = refs + 1",
+                blobs,
+            )
+            connection.executemany(
+                "INSERT INTO djdt_panel (request_id, panel_id, digest) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+        return True
+
+    @classmethod
+    def panel(cls, request_id: str, panel_id: str) -> Any:
+        """Fetch the panel data for the given request_id."""
+        row = (
+            cls._connection()
+            .execute(
+                "SELECT data FROM djdt_panel JOIN djdt_blob USING (digest) "
+                "WHERE request_id = ? AND panel_id = ?",
+                (request_id, panel_id),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return {}
+        return _decoded_panels.get(request_id, panel_id, row[0])
+
+    @classmethod
+    def panels(cls, request_id: str) -> Any:
+        """Fetch all the panel data for the given request_id."""
+        rows = (
+            cls._connection()
+            .execute(
+                "SELECT panel_id, data FROM djdt_panel JOIN djdt_blob USING (digest) "
+                "WHERE request_id = ?",
+                (request_id,),
+            )
+            .fetchall()
+        )
+        for panel_id, data in rows:
+            yield panel_id, _decoded_panels.get(request_id, panel_id, data)
 
 
 def get_store() -> BaseStore:
@@ -133,6 +133,22 @@ class DebugToolbar:
         self.request_id = uuid.uuid4().hex
         self.store.set(self.request_id)
 
+    def save_stats(self):
+        """
+        Write the statistics recorded by the panels to the store.
+
+        All the panels are saved in a single store operation rather than one
+        operation per call to :meth:`Panel.record_stats
+        <debug_toolbar.panels.Panel.record_stats>`.
+        """
+        if self.stats:
+            self.store.save_panels(self.request_id, self.stats)
+
+    async def asave_stats(self):
+        """Async version of :meth:`save_stats`."""
+        if self.stats:
+            await self.store.asave_panels(self.request_id, self.stats)
+
     @classmethod
     def fetch(
         cls, request_id: str, panel_id: str | None = None
@@ -140,6 +156,14 @@ class DebugToolbar:
         if get_store().exists(request_id):
             return StoredDebugToolbar.from_store(request_id, panel_id=panel_id)
 
+    @classmethod
+    async def afetch(
+        cls, request_id: str, panel_id: str | None = None
+    ) -> StoredDebugToolbar | None:
+        """Async version of :meth:`fetch`."""
+        if await get_store().aexists(request_id):
+            return await StoredDebugToolbar.afrom_store(request_id, panel_id=panel_id)
+
     # Manually implement class-level caching of panel classes and url patterns
     # because it's more obvious than going through an abstraction.
 
@@ -250,6 +274,34 @@ class StoredDebugToolbar(DebugToolbar):
             toolbar._panels[panel.panel_id] = panel
         return toolbar
 
+    @classmethod
+    async def afrom_store(
+        cls, request_id: str, panel_id: str | None = None
+    ) -> StoredDebugToolbar:
+        """
+        Async version of :meth:`from_store`. When every panel is loaded, their
+        data is read from the store at once.
+        """
+        toolbar = StoredDebugToolbar(
+            None, from_store_get_response, request_id=request_id
+        )
+        toolbar._panels = {}
+
+        if panel_id:
+            stored = {panel_id: await toolbar.store.apanel(request_id, panel_id)}
+        else:
+            stored = {
+                stored_id: data
+                async for stored_id, data in toolbar.store.apanels(request_id)
+            }
+        for panel_class in reversed(cls.get_panel_classes()):
+            panel = panel_class(toolbar, from_store_get_response)
+            if panel_id and panel.panel_id != panel_id:
+                continue
+            panel.load_stats_from_store(stored.get(panel.panel_id, {}))
+            toolbar._panels[panel.panel_id] = panel
+        return toolbar
+
 
 def debug_toolbar_urls(prefix: str = "__debug__") -> list[URLPattern | URLResolver]:
     """
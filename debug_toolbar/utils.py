@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import contextvars
 import inspect
 import linecache
 import os.path
 import sys
+import threading
+import types
 import warnings
 from collections.abc import Sequence
 from pprint import PrettyPrinter, pformat
@@ -23,14 +26,18 @@ safe_filter = get_default_exception_reporter_filter()
 
 
 def _is_excluded_frame(frame: Any, excluded_modules: Sequence[str] | None) -> bool:
+    return _is_excluded_module(frame.f_globals.get("__name__"), excluded_modules)
+
+
+def _is_excluded_module(
+    module_name: Any, excluded_modules: Sequence[str] | None
+) -> bool:
     if not excluded_modules:
         return False
-    frame_module = frame.f_globals.get("__name__")
-    if not isinstance(frame_module, str):
+    if not isinstance(module_name, str):
         return False
     return any(
-        frame_module == excluded_module
-        or frame_module.startswith(excluded_module + ".")
+        module_name == excluded_module or module_name.startswith(excluded_module + ".")
         for excluded_module in excluded_modules
     )
 
@@ -104,62 +111,122 @@ def render_stacktrace(trace: stubs.TidyStackTrace) -> SafeString:
     return mark_safe(html)
 
 
-def get_template_info() -> dict[str, Any] | None:
-    template_info = None
-    cur_frame = sys._getframe().f_back
+_template_render_node: contextvars.ContextVar[tuple[Node, Any] | None] = (
+    contextvars.ContextVar("djdt_template_render_node", default=None)
+)
+
+
+_original_render_annotated = Node.render_annotated
+# The objects that enabled the template tracking, usually panels.
+_template_tracking_owners: set[Any] = set()
+_template_tracking_lock = threading.Lock()
+
+
+def _render_annotated(self, context):
+    # Keep track of the innermost node being rendered so that SQL queries and
+    # cache calls can be attributed to it without walking the call stack.
+    token = _template_render_node.set((self, context))
     try:
-        while cur_frame is not None:
-            in_utils_module = cur_frame.f_code.co_filename.endswith(
-                "/debug_toolbar/utils.py"
-            )
-            is_get_template_context = (
-                cur_frame.f_code.co_name == get_template_context.__name__
-            )
-            if in_utils_module and is_get_template_context:
-                # If the method in the stack trace is this one
-                # then break from the loop as it's being check recursively.
-                break
-            elif cur_frame.f_code.co_name == "render":
-                node = cur_frame.f_locals["self"]
-                context = cur_frame.f_locals["context"]
-                if isinstance(node, Node):
-                    template_info = get_template_context(node, context)
-                    break
-            cur_frame = cur_frame.f_back
-    except Exception:
-        pass
-    del cur_frame
-    return template_info
+        return _original_render_annotated(self, context)
+    finally:
+        _template_render_node.reset(token)
 
 
-def get_template_context(
-    node: Node, context: stubs.RequestContext, context_lines: int = 3
-) -> dict[str, Any]:
-    line, source_lines, name = get_template_source_from_exception_info(node, context)
+def enable_template_tracking(owner: Any) -> None:
+    """
+    Monkey-patch ``Node.render_annotated()`` to keep track of the template
+    node being rendered, for :func:`capture_template_info`.
+
+    The patch stays in place until every ``owner`` that enabled it has called
+    :func:`disable_template_tracking`, so that it's only active while the
+    toolbar instruments a request. TextNode, by far the most common node,
+    overrides render_annotated() and isn't tracked.
+    """
+    with _template_tracking_lock:
+        if not _template_tracking_owners:
+            Node.render_annotated = _render_annotated
+        _template_tracking_owners.add(owner)
+
+
+def disable_template_tracking(owner: Any) -> None:
+    """Undo :func:`enable_template_tracking` for the given ``owner``."""
+    with _template_tracking_lock:
+        if owner not in _template_tracking_owners:
+            return
+        _template_tracking_owners.remove(owner)
+        if not _template_tracking_owners:
+            Node.render_annotated = _original_render_annotated
+
+
+def capture_template_info() -> tuple[Any, Any] | None:
+    """
+    Return a reference to the template node being rendered, or None.
+
+    The reference must be passed to :func:`resolve_template_info` to get the
+    template's name and source lines.
+    """
+    current = _template_render_node.get()
+    if current is None:
+        return None
+    node, context = current
+    if node.token.position is None:
+        # The source positions are only recorded in debug mode.
+        return None
+    return _get_node_template(node, context), node.token
+
+
+def resolve_template_info(template_info) -> dict[str, Any] | None:
+    """
+    Return the template information, as returned by :func:`get_template_info`,
+    for a reference captured by :func:`capture_template_info`.
+
+    Resolved template information is returned unchanged.
+    """
+    if template_info is None or isinstance(template_info, dict):
+        return template_info
+    return _get_stack_trace_recorder().resolve_template_info(*template_info)
+
+
+def get_template_info() -> dict[str, Any] | None:
+    return resolve_template_info(capture_template_info())
+
+
+def _get_node_template(node: Node, context: stubs.RequestContext) -> Any:
+    if context.template is not None and context.template.origin == node.origin:
+        return context.template
+    return context.render_context.template
+
+
+def _get_template_info(template, token, context_lines: int = 3) -> dict[str, Any]:
+    exception_info = template.get_exception_info(Exception("DDT"), token)
+    line = exception_info["line"]
     debug_context = []
     start = max(1, line - context_lines)
     end = line + 1 + context_lines
 
-    for line_num, content in source_lines:
+    for line_num, content in exception_info["source_lines"]:
         if start <= line_num <= end:
             debug_context.append(
                 {"num": line_num, "content": content, "highlight": (line_num == line)}
             )
 
-    return {"name": name, "context": debug_context}
+    return {"name": exception_info["name"], "context": debug_context}
+
+
+def get_template_context(
+    node: Node, context: stubs.RequestContext, context_lines: int = 3
+) -> dict[str, Any]:
+    return _get_template_info(
+        _get_node_template(node, context), node.token, context_lines
+    )
 
 
 def get_template_source_from_exception_info(
     node: Node, context: stubs.RequestContext
 ) -> tuple[int, list[tuple[int, str]], str]:
-    if context.template.origin == node.origin:
-        exception_info = context.template.get_exception_info(
-            Exception("DDT"), node.token
-        )
-    else:
-        exception_info = context.render_context.template.get_exception_info(
-            Exception("DDT"), node.token
-        )
+    exception_info = _get_node_template(node, context).get_exception_info(
+        Exception("DDT"), node.token
+    )
     line = exception_info["line"]
     source_lines = exception_info["source_lines"]
     name = exception_info["name"]
@@ -293,31 +360,113 @@ def _stack_frames(*, skip=0):
         frame = frame.f_back
 
 
+class _SourceCache:
+    """
+    A process-wide, bounded cache of the source information used to process
+    stack traces.
+
+    The source file of each code file name and the stripped source lines are
+    kept across requests. Source files are looked up again when their
+    modification time changes, and the source lines are keyed by it, so edits
+    made during development show up in the next request.
+    """
+
+    maxsize = 10000
+
+    def __init__(self):
+        # co_filename -> (filename, is_source, mtime)
+        self._files: dict[str, tuple[str, bool, int | None]] = {}
+        # (filename, mtime, line number) -> stripped source line
+        self._lines: dict[tuple[str, int | None, int], str] = {}
+        self._excluded_modules = None
+        self._excluded: dict[Any, bool] = {}
+        self._lock = threading.Lock()
+
+    def _set(self, entries, key, value):
+        # Lookups don't take the lock, so the oldest entries are evicted
+        # rather than the least recently used ones.
+        with self._lock:
+            entries[key] = value
+            while len(entries) > self.maxsize:
+                del entries[next(iter(entries))]
+
+    def get_source_file(self, code):
+        """
+        Return the ``(filename, is_source, mtime)`` of the code object's source
+        file. The file's modification time is checked on every call.
+        """
+        frame_filename = code.co_filename
+        value = self._files.get(frame_filename)
+        if value is not None:
+            filename, is_source, mtime = value
+            if not is_source or _get_mtime(filename) == mtime:
+                return value
+        filename = inspect.getsourcefile(code)
+        if filename is None:
+            value = (frame_filename, False, None)
+        else:
+            # Make linecache read the file again if it changed.
+            linecache.checkcache(filename)
+            value = (filename, True, _get_mtime(filename))
+        self._set(self._files, frame_filename, value)
+        return value
+
+    def get_source_line(self, filename, mtime, line_no, module_globals):
+        key = (filename, mtime, line_no)
+        source_line = self._lines.get(key)
+        if source_line is None:
+            source_line = linecache.getline(filename, line_no, module_globals).strip()
+            self._set(self._lines, key, source_line)
+        return source_line
+
+    def is_excluded_module(
+        self, module_name, excluded_modules: Sequence[str] | None = None
+    ):
+        excluded = self._excluded.get(module_name)
+        if excluded is None or excluded_modules != self._excluded_modules:
+            with self._lock:
+                if excluded_modules != self._excluded_modules:
+                    self._excluded_modules = excluded_modules
+                    self._excluded = {}
+            excluded = _is_excluded_module(module_name, excluded_modules)
+            self._excluded[module_name] = excluded
+        return excluded
+
+
+def _get_mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except OSError:
+        return None
+
+
+_source_cache = _SourceCache()
+
+
 class _StackTraceRecorder:
     pretty_printer = PrettyPrinter()
 
     def __init__(self):
         self.filename_cache = {}
+        self.frame_cache = {}
+        self.template_info_cache = {}
 
-    def get_source_file(self, frame):
-        frame_filename = frame.f_code.co_filename
-
-        value = self.filename_cache.get(frame_filename)
+    def get_source_file(self, code):
+        # The source file's modification time is only checked once per request.
+        value = self.filename_cache.get(code.co_filename)
         if value is None:
-            filename = inspect.getsourcefile(frame)
-            if filename is None:
-                is_source = False
-                filename = frame_filename
-            else:
-                is_source = True
-                # Ensure linecache validity the first time this recorder
-                # encounters the filename in this frame.
-                linecache.checkcache(filename)
-            value = (filename, is_source)
-            self.filename_cache[frame_filename] = value
-
+            value = _source_cache.get_source_file(code)
+            self.filename_cache[code.co_filename] = value
         return value
 
+    def get_source_line(self, code, line_no, module_globals):
+        filename, is_source, mtime = self.get_source_file(code)
+        if not is_source:
+            return filename, ""
+        return filename, _source_cache.get_source_line(
+            filename, mtime, line_no, module_globals
+        )
+
     def get_stack_trace(
         self,
         *,
@@ -331,19 +480,11 @@ class _StackTraceRecorder:
             if _is_excluded_frame(frame, excluded_modules):
                 continue
 
-            filename, is_source = self.get_source_file(frame)
-
             line_no = frame.f_lineno
             func_name = frame.f_code.co_name
-
-            if is_source:
-                module = inspect.getmodule(frame, filename)
-                module_globals = module.__dict__ if module is not None else None
-                source_line = linecache.getline(
-                    filename, line_no, module_globals
-                ).strip()
-            else:
-                source_line = ""
+            filename, source_line = self.get_source_line(
+                frame.f_code, line_no, frame.f_globals
+            )
 
             if include_locals:
                 frame_locals = self.pretty_printer.pformat(frame.f_locals)
@@ -354,6 +495,59 @@ class _StackTraceRecorder:
         trace.reverse()
         return trace
 
+    def resolve_template_info(self, template, token):
+        template_info = self.template_info_cache.get((template, token))
+        if template_info is None:
+            template_info = _get_template_info(template, token)
+            self.template_info_cache[(template, token)] = template_info
+        return template_info
+
+    def is_excluded_module(
+        self, module_name, excluded_modules: Sequence[str] | None = None
+    ):
+        return _source_cache.is_excluded_module(module_name, excluded_modules)
+
+    def get_caller_frame(
+        self, *, excluded_modules: Sequence[str] | None = None, skip=0
+    ):
+        frame = sys._getframe(skip + 1)
+        caller = None
+        while frame is not None:
+            caller = frame
+            if not self.is_excluded_module(
+                frame.f_globals.get("__name__"), excluded_modules
+            ):
+                break
+            frame = frame.f_back
+        return caller
+
+    def resolve_stack_trace(
+        self, trace, *, excluded_modules: Sequence[str] | None = None
+    ):
+        resolved = []
+        for code, line_no, module_name in trace:
+            if self.is_excluded_module(module_name, excluded_modules):
+                continue
+
+            frame_info = self.frame_cache.get((code, line_no))
+            if frame_info is None:
+                module = sys.modules.get(module_name)
+                filename, source_line = self.get_source_line(
+                    code, line_no, module.__dict__ if module is not None else None
+                )
+                frame_info = (filename, line_no, code.co_name, source_line, None)
+                self.frame_cache[(code, line_no)] = frame_info
+            resolved.append(frame_info)
+        return resolved
+
+
+def _get_stack_trace_recorder():
+    stack_trace_recorder = getattr(_local_data, "stack_trace_recorder", None)
+    if stack_trace_recorder is None:
+        stack_trace_recorder = _StackTraceRecorder()
+        _local_data.stack_trace_recorder = stack_trace_recorder
+    return stack_trace_recorder
+
 
 def get_stack_trace(*, skip=0):
     """
@@ -374,22 +568,162 @@ def get_stack_trace(*, skip=0):
     if not config["ENABLE_STACKTRACES"]:
         return []
     skip += 1  # Skip the frame for this function.
-    stack_trace_recorder = getattr(_local_data, "stack_trace_recorder", None)
-    if stack_trace_recorder is None:
-        stack_trace_recorder = _StackTraceRecorder()
-        _local_data.stack_trace_recorder = stack_trace_recorder
-    return stack_trace_recorder.get_stack_trace(
+    return _get_stack_trace_recorder().get_stack_trace(
         excluded_modules=config["HIDE_IN_STACKTRACES"],
         include_locals=config["ENABLE_STACKTRACES_LOCALS"],
         skip=skip,
     )
 
 
+def capture_stack_trace(*, skip=0):
+    """
+    Return a stack trace for the current call stack that is cheap to capture.
+
+    The frames are kept as (code object, line number, module name) tuples, with
+    the first entry for the bottom of the stack, and must be passed to
+    :func:`resolve_stack_trace` before the trace is stored or rendered. ``skip``
+    works as for :func:`get_stack_trace`.
+
+    If the ``ENABLE_STACKTRACES`` setting is False, return an empty :class:`list`.
+    If ``ENABLE_STACKTRACES_LOCALS`` is True, the locals can only be captured
+    right away, so the processed stack trace is returned instead.
+    """
+    config = dt_settings.get_config()
+    if not config["ENABLE_STACKTRACES"]:
+        return []
+    if config["ENABLE_STACKTRACES_LOCALS"]:
+        return get_stack_trace(skip=skip + 1)
+    trace = []
+    frame = sys._getframe(skip + 1)
+    while frame is not None:
+        trace.append((frame.f_code, frame.f_lineno, frame.f_globals.get("__name__")))
+        frame = frame.f_back
+    trace.reverse()
+    return trace
+
+
+def resolve_stack_trace(trace):
+    """
+    Return the processed stack trace, as returned by :func:`get_stack_trace`,
+    for a stack trace captured by :func:`capture_stack_trace`.
+
+    The file name and source line of each frame are looked up once per code
+    object and line. Processed stack traces are returned unchanged.
+    """
+    if not trace or not isinstance(trace[0][0], types.CodeType):
+        return trace
+    return _get_stack_trace_recorder().resolve_stack_trace(
+        trace, excluded_modules=dt_settings.get_config()["HIDE_IN_STACKTRACES"]
+    )
+
+
 def clear_stack_trace_caches():
     if hasattr(_local_data, "stack_trace_recorder"):
         del _local_data.stack_trace_recorder
 
 
+class AdaptiveStackTraces:
+    """
+    Capture full stack traces only for the calls that need them.
+
+    Calls are grouped by their caller, the innermost frame outside of the
+    ``HIDE_IN_STACKTRACES`` modules, and a key given by the panel. The first
+    call of a group only gets its caller frame. Once the group repeats, a full
+    stack trace is captured and shared by all of the calls of the group, the
+    earlier ones included.
+    """
+
+    def __init__(self):
+        self._traces = {}
+
+    def capture(self, key=None, *, force=False, skip=0):
+        """
+        Return a stack trace for the current call stack in the format of
+        :func:`capture_stack_trace`. ``force`` captures a full stack trace for
+        this call regardless of its group.
+        """
+        skip += 1  # Skip the frame for this method.
+        if force:
+            return capture_stack_trace(skip=skip)
+        caller = _get_stack_trace_recorder().get_caller_frame(
+            excluded_modules=dt_settings.get_config()["HIDE_IN_STACKTRACES"],
+            skip=skip,
+        )
+        group = (caller.f_code, caller.f_lineno, key)
+        entry = self._traces.get(group)
+        if entry is None:
+            # The list is kept so the full stack trace can be filled in for
+            # this call too if the group repeats.
+            trace = [(caller.f_code, caller.f_lineno, caller.f_globals.get("__name__"))]
+            self._traces[group] = (trace, False)
+            return trace
+        trace, promoted = entry
+        if not promoted:
+            trace[:] = capture_stack_trace(skip=skip)
+            self._traces[group] = (trace, True)
+        return trace
+
+
+class StackTraceTree:
+    """
+    Intern processed stack traces into a prefix tree of frames.
+
+    Each distinct frame is kept once in ``frames`` and each node of the tree is
+    a ``[parent, frame]`` pair of indexes in ``nodes``, the parent being None
+    for the outermost frame. A stack trace is referenced by the index of the
+    node for its innermost frame, so traces issued from the same call site
+    share all of their nodes.
+    """
+
+    def __init__(self, frames=(), nodes=()):
+        self.frames = [tuple(frame) for frame in frames]
+        self.nodes = [tuple(node) for node in nodes]
+        self._frame_ids = {frame: i for i, frame in enumerate(self.frames)}
+        self._node_ids = {node: i for i, node in enumerate(self.nodes)}
+        self._traces = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["frames"], data["nodes"])
+
+    def as_dict(self):
+        return {"frames": self.frames, "nodes": self.nodes}
+
+    def add(self, stack_trace):
+        """
+        Intern a processed stack trace and return its id, or None if the stack
+        trace is empty.
+        """
+        node_id = None
+        for frame in stack_trace:
+            frame = tuple(frame)
+            frame_id = self._frame_ids.get(frame)
+            if frame_id is None:
+                frame_id = self._frame_ids[frame] = len(self.frames)
+                self.frames.append(frame)
+            node = (node_id, frame_id)
+            node_id = self._node_ids.get(node)
+            if node_id is None:
+                node_id = self._node_ids[node] = len(self.nodes)
+                self.nodes.append(node)
+        return node_id
+
+    def get(self, trace_id):
+        """Return the processed stack trace for an id returned by ``add()``."""
+        if trace_id is None:
+            return []
+        stack_trace = self._traces.get(trace_id)
+        if stack_trace is None:
+            stack_trace = []
+            node_id = trace_id
+            while node_id is not None:
+                node_id, frame_id = self.nodes[node_id]
+                stack_trace.append(self.frames[frame_id])
+            stack_trace.reverse()
+            self._traces[trace_id] = stack_trace
+        return stack_trace
+
+
 _HTML_TYPES = ("text/html", "application/xhtml+xml")
 
 
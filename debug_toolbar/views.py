@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.http import HttpRequest, JsonResponse
 from django.utils.html import escape
 from django.utils.translation import gettext as _
@@ -11,9 +12,9 @@ from debug_toolbar.toolbar import DebugToolbar, StoredDebugToolbar
 @login_not_required
 @require_show_toolbar
 @render_with_toolbar_language
-def render_panel(request: HttpRequest) -> JsonResponse:
+async def render_panel(request: HttpRequest) -> JsonResponse:
     """Render the contents of a panel"""
-    toolbar: StoredDebugToolbar | None = DebugToolbar.fetch(
+    toolbar: StoredDebugToolbar | None = await DebugToolbar.afetch(
         request.GET["request_id"], request.GET["panel_id"]
     )
     if toolbar is None:
@@ -25,6 +26,6 @@ def render_panel(request: HttpRequest) -> JsonResponse:
         scripts = []
     else:
         panel: Panel = toolbar.get_panel_by_id(request.GET["panel_id"])
-        content = panel.content
-        scripts = panel.scripts
+        # Rendering a panel may run synchronous code, such as database queries.
+        content, scripts = await sync_to_async(lambda: (panel.content, panel.scripts))()
     return JsonResponse({"content": content, "scripts": scripts})
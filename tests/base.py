@@ -112,6 +112,7 @@ class BaseMixin:
             raise self.failureException("\n".join(msg_parts))
 
     def reload_stats(self):
+        self.toolbar.save_stats()
         data = self.toolbar.store.panel(self.toolbar.request_id, self.panel_id)
         self.panel.load_stats_from_store(data)
 
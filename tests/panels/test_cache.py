@@ -1,4 +1,5 @@
 from django.core import cache
+from django.test import override_settings
 
 from debug_toolbar.panels.cache import CachePanel
 
@@ -28,6 +29,18 @@ class CachePanelTestCase(BaseTestCase):
         second_cache.get("foo")
         self.assertEqual(len(self.panel.calls), 2)
 
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"ENABLE_STACKTRACES": "adaptive"})
+    def test_adaptive_stacktraces(self):
+        for _ in range(2):
+            cache.cache.get("foo")
+        cache.cache.set("foo", "bar")
+        calls = self.panel.calls
+        # Repeated calls share a full stack trace.
+        self.assertIs(calls[0]["trace"], calls[1]["trace"])
+        self.assertGreater(len(calls[0]["trace"]), 1)
+        # A call made once only gets its caller frame.
+        self.assertEqual(len(calls[2]["trace"]), 1)
+
     def test_hits_and_misses(self):
         cache.cache.clear()
         cache.cache.get("foo")
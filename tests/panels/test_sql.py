@@ -14,13 +14,27 @@ from django.db.models import Count
 from django.db.utils import DatabaseError
 from django.shortcuts import render
 from django.test.utils import override_settings
+from django.utils.html import escape
 from sqlparse.exceptions import SQLParseError
 
+import debug_toolbar.panels.sql.panel as sql_panel
 import debug_toolbar.panels.sql.tracking as sql_tracking
 from debug_toolbar import settings as dt_settings
+from debug_toolbar.forms import SignedDataForm
 from debug_toolbar.models import HistoryEntry
 from debug_toolbar.panels.sql import SQLPanel, tracking
-from debug_toolbar.panels.sql.utils import parse_sql
+from debug_toolbar.panels.sql.utils import (
+    QueryColumns,
+    _format_cache,
+    fingerprint_sql,
+    format_tokens,
+    get_query_sql,
+    interpolate_sql,
+    parse_sql,
+    reformat_query_sql,
+    reformat_sql,
+    tokenize,
+)
 
 try:
     import psycopg
@@ -97,7 +111,7 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
         self.assertEqual(query["alias"], "default")
-        self.assertTrue("sql" in query)
+        self.assertTrue("raw_sql" in query)
         self.assertTrue("duration" in query)
         self.assertTrue("stacktrace" in query)
 
@@ -124,7 +138,7 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
         self.assertEqual(query["alias"], "default")
-        self.assertTrue("sql" in query)
+        self.assertTrue("raw_sql" in query)
         self.assertTrue("duration" in query)
         self.assertTrue("stacktrace" in query)
 
@@ -140,7 +154,7 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 2)
         query = self.panel._queries[0]
         self.assertEqual(query["alias"], "default")
-        self.assertTrue("sql" in query)
+        self.assertTrue("raw_sql" in query)
         self.assertTrue("duration" in query)
         self.assertTrue("stacktrace" in query)
 
@@ -166,7 +180,7 @@ class SQLPanelTestCase(BaseTestCase):
         # ensure query was logged
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
-        self.assertTrue(HistoryEntry._meta.db_table in query["sql"])
+        self.assertTrue(HistoryEntry._meta.db_table in query["raw_sql"])
 
     @override_settings(
         DEBUG_TOOLBAR_CONFIG={
@@ -187,7 +201,7 @@ class SQLPanelTestCase(BaseTestCase):
         # ensure query was logged
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
-        self.assertTrue(HistoryEntry._meta.db_table in query["sql"])
+        self.assertTrue(HistoryEntry._meta.db_table in query["raw_sql"])
 
     @override_settings(
         DEBUG_TOOLBAR_CONFIG={
@@ -321,6 +335,181 @@ class SQLPanelTestCase(BaseTestCase):
             ],
         )
 
+    def test_cursor_wrapper_class_is_reused(self):
+        self.assertIs(
+            sql_tracking.patch_cursor_wrapper_with_mixin(
+                CursorWrapper, sql_tracking.NormalCursorMixin
+            ),
+            sql_tracking.patch_cursor_wrapper_with_mixin(
+                CursorWrapper, sql_tracking.NormalCursorMixin
+            ),
+        )
+
+    def test_query_ids_are_sequential(self):
+        sql_call()
+        sql_call()
+
+        self.assertEqual(
+            [query["djdt_query_id"] for query in self.panel._queries], ["0", "1"]
+        )
+
+    def test_ddt_models_pattern_follows_ddt_models(self):
+        with patch.object(tracking, "DDT_MODELS", set()):
+            self.assertIsNone(tracking.get_ddt_models_pattern())
+            tracking.DDT_MODELS.add("djdt_cache")
+            pattern = tracking.get_ddt_models_pattern()
+            self.assertTrue(pattern.search('SELECT * FROM "djdt_cache"'))
+            self.assertFalse(pattern.search('SELECT * FROM "auth_user"'))
+            self.assertIs(tracking.get_ddt_models_pattern(), pattern)
+
+    def test_recording_defers_formatting(self):
+        params = ["Foo"]
+        with (
+            patch.object(connection.ops, "last_executed_query") as last_executed,
+            connection.cursor() as cursor,
+        ):
+            cursor.execute("SELECT %s", params)
+        last_executed.assert_not_called()
+
+        query = self.panel._queries[0]
+        self.assertNotIn("sql", query)
+        self.assertEqual(query["raw_sql"], "SELECT %s")
+        self.assertEqual(query["params"], params)
+        self.assertIsNot(query["params"], params)
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        self.assertEqual(get_query_sql(query), "SELECT 'Foo'")
+
+    def test_stacktrace_is_resolved_on_generate_stats(self):
+        sql_call()
+
+        # Only code objects and line numbers are captured while recording.
+        trace = self.panel._queries[0]["stacktrace"]
+        self.assertIn(sql_call.__code__, [frame[0] for frame in trace])
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        query = self.panel._render_context["queries"][0]
+        filename, _, func_name, source_line, _ = query["stacktrace"][-1]
+        self.assertEqual(filename, sql_call.__code__.co_filename)
+        self.assertEqual(func_name, "sql_call")
+        self.assertIn("list(qs)", source_line)
+
+    def test_stacktraces_are_interned(self):
+        for _ in range(3):
+            sql_call()
+        sql_call_toolbar_model()
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        stats = self.panel.get_stats()
+        trace_ids = [query["stacktrace"] for query in stats["queries"]]
+        # The queries made from the loop share their stack trace.
+        self.assertEqual(trace_ids[0], trace_ids[1])
+        self.assertEqual(trace_ids[0], trace_ids[2])
+        self.assertNotEqual(trace_ids[0], trace_ids[3])
+        # Each frame is stored once.
+        frames = stats["stacktraces"]["frames"]
+        self.assertEqual(len(frames), len(set(frames)))
+
+        # Each distinct stack trace is rendered once.
+        context = self.panel._render_context
+        self.assertEqual(
+            [trace_id for trace_id, _ in context["stacktraces"]],
+            [trace_ids[0], trace_ids[3]],
+        )
+        self.assertEqual(
+            context["queries"][0]["trace_color"], context["queries"][1]["trace_color"]
+        )
+        self.assertEqual(self.panel.content.count('data-djdt-stack="'), 4)
+        self.assertEqual(self.panel.content.count('<template id="sqlStack_'), 2)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"ENABLE_STACKTRACES": "adaptive"})
+    def test_adaptive_stacktraces(self):
+        for _ in range(3):
+            sql_call()
+        sql_call_toolbar_model()
+        with self.settings(
+            DEBUG_TOOLBAR_CONFIG={
+                "ENABLE_STACKTRACES": "adaptive",
+                "SQL_WARNING_THRESHOLD": -1,
+            }
+        ):
+            sql_call_toolbar_model()
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        queries = self.panel._render_context["queries"]
+        # Repeated queries share a full stack trace.
+        self.assertGreater(len(queries[0]["stacktrace"]), 1)
+        self.assertEqual(queries[0]["stacktrace"], queries[2]["stacktrace"])
+        # A query made once only gets its caller frame, unless it is slow.
+        self.assertEqual(len(queries[3]["stacktrace"]), 1)
+        self.assertEqual(queries[3]["stacktrace"][0][2], "sql_call_toolbar_model")
+        self.assertGreater(len(queries[4]["stacktrace"]), 1)
+
+    def test_content_signs_once_per_request(self):
+        for i in range(3):
+            User.objects.filter(id=i).count()
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        with patch.object(SignedDataForm, "sign", wraps=SignedDataForm.sign) as sign:
+            content = self.panel.content
+        sign.assert_called_once_with({"request_id": self.toolbar.request_id})
+        signed = SignedDataForm.sign({"request_id": self.toolbar.request_id})
+        self.assertEqual(content.count(escape(signed)), 3)
+        for query in self.panel.get_stats()["queries"]:
+            self.assertIn(
+                f'name="djdt_query_id" value="{query["djdt_query_id"]}"', content
+            )
+
+    def test_interpolate_sql(self):
+        self.assertEqual(
+            interpolate_sql(
+                "SELECT %s, %s, %s, %s, %s", [None, True, 1.5, "it's", [1, "a"]]
+            ),
+            "SELECT NULL, TRUE, 1.5, 'it''s', (1, 'a')",
+        )
+        self.assertEqual(
+            interpolate_sql("SELECT %(name)s", {"name": "Foo"}), "SELECT 'Foo'"
+        )
+        self.assertEqual(interpolate_sql("SELECT 1", None), "SELECT 1")
+        self.assertEqual(
+            interpolate_sql("SELECT %s, %s", [b"\x00\xffa", bytearray(b"'")]),
+            "SELECT X'00ff61', X'27'",
+        )
+        # Parameters that don't fit the placeholders leave the SQL as is.
+        self.assertEqual(interpolate_sql("SELECT %s", [1, 2]), "SELECT %s")
+
+    def test_queries_are_stored_as_columns(self):
+        sql_call()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT %s", ["Foo"])
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        columns = self.panel.get_stats()["queries"].columns
+        self.assertEqual(columns["djdt_query_id"], ["0", "1"])
+        self.assertEqual(columns["params"][1], ["Foo"])
+        # Fields derived from the recorded ones aren't stored.
+        self.assertNotIn("width_ratio", columns)
+        self.assertNotIn("similar_count", columns)
+        self.assertEqual(self.panel.get_stats()["queries"][-1]["raw_sql"], "SELECT %s")
+
+    def test_query_columns(self):
+        queries = QueryColumns()
+        queries.append({"id": 1})
+        queries.append({"id": 2, "extra": "x"})
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries.columns, {"id": [1, 2], "extra": [None, "x"]})
+        self.assertEqual(queries[0], {"id": 1, "extra": None})
+        self.assertEqual(list(queries)[-1], {"id": 2, "extra": "x"})
+        self.assertEqual(QueryColumns(queries.columns)[-1], queries[-1])
+
     def test_generate_server_timing(self):
         self.assertEqual(len(self.panel._queries), 0)
 
@@ -624,8 +813,8 @@ class SQLPanelTestCase(BaseTestCase):
 
         query = self.panel._queries[0]
         self.assertEqual(query["alias"], "default")
-        self.assertTrue("sql" in query)
-        self.assertEqual(query["sql"], 'select "username" from "auth_user"')
+        self.assertTrue("raw_sql" in query)
+        self.assertEqual(query["raw_sql"], 'select "username" from "auth_user"')
 
     def test_disable_stacktraces(self):
         self.assertEqual(len(self.panel._queries), 0)
@@ -637,7 +826,7 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 1)
         query = self.panel._queries[0]
         self.assertEqual(query["alias"], "default")
-        self.assertTrue("sql" in query)
+        self.assertTrue("raw_sql" in query)
         self.assertTrue("duration" in query)
         self.assertTrue("stacktrace" in query)
 
@@ -667,7 +856,7 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertEqual(len(self.panel._queries), 2)
         query = self.panel._queries[0]
         self.assertEqual(query["alias"], "default")
-        self.assertTrue("sql" in query)
+        self.assertTrue("raw_sql" in query)
         self.assertTrue("duration" in query)
         self.assertTrue("stacktrace" in query)
 
@@ -686,7 +875,7 @@ class SQLPanelTestCase(BaseTestCase):
             self.panel.generate_stats(self.request, response)
             # The content formats the sql and prettifies it
             self.assertTrue(self.panel.content)
-            pretty_sql = self.panel._queries[-1]["sql"]
+            pretty_sql = self.panel._render_context["queries"][-1]["sql"]
             self.assertEqual(len(self.panel._queries), 1)
 
         # Recreate the panel to reset the queries. Content being a cached_property
@@ -719,6 +908,99 @@ class SQLPanelTestCase(BaseTestCase):
             self.assertEqual(len(self.panel._queries), 1)
             self.assertIn(pretty_sql, self.panel.content)
 
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_QUERIES_PAGE_SIZE": 2})
+    def test_paged_queries(self):
+        for _ in range(5):
+            list(User.objects.all())
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        context = self.panel._render_context
+        self.assertEqual(context["query_count"], 5)
+        self.assertEqual(len(context["queries"]), 2)
+        self.assertEqual(context["next_offset"], 2)
+        self.assertIn("djdt-sql-more", self.panel.content)
+        self.assertNotIn('id="sqlMain_3"', self.panel.content)
+        # The queries share their stack trace, which is only rendered with the
+        # first page.
+        self.assertEqual(len(context["stacktraces"]), 1)
+
+        content, stacktraces, next_offset = self.panel.render_queries(2)
+        self.assertIn('id="sqlMain_3"', content)
+        self.assertIn('id="sqlMain_4"', content)
+        self.assertNotIn('id="sqlMain_5"', content)
+        self.assertNotIn("<template", stacktraces)
+        self.assertEqual(next_offset, 4)
+        content, stacktraces, next_offset = self.panel.render_queries(4)
+        self.assertIn('id="sqlMain_5"', content)
+        self.assertIsNone(next_offset)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_QUERIES_PAGE_SIZE": 0})
+    def test_page_size_below_one_lists_every_query(self):
+        for _ in range(3):
+            list(User.objects.all())
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        context = self.panel._render_context
+        self.assertEqual(len(context["queries"]), 3)
+        self.assertIsNone(context["next_offset"])
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_QUERIES_PAGE_SIZE": 2})
+    def test_page_only_annotates_its_queries(self):
+        list(User.objects.filter(id=1))
+        for _ in range(4):
+            list(User.objects.all())
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        # The queries are annotated along with their stats, not per page.
+        self.assertEqual(self.panel.get_stats()["annotations"]["similar_count"][1], 4)
+        with (
+            patch.object(sql_panel, "_annotate_queries") as annotate_queries,
+            patch.object(
+                sql_panel, "_annotate_row", wraps=sql_panel._annotate_row
+            ) as annotate_row,
+        ):
+            content, _, _ = self.panel.render_queries(2)
+        annotate_queries.assert_not_called()
+        self.assertEqual(annotate_row.call_count, 2)
+        self.assertIn("4 similar queries.", content)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_COLLAPSE_DUPLICATES": True})
+    def test_collapse_duplicates(self):
+        for _ in range(3):
+            list(User.objects.filter(id=1))
+        list(User.objects.filter(id=2))
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        # Only the first occurrence of the duplicated query is stored in full.
+        stats = self.panel.get_stats()
+        self.assertEqual(len(stats["queries"]), 2)
+        first_id = stats["queries"][0]["djdt_query_id"]
+        self.assertEqual(list(stats["duplicates"]), [first_id])
+        self.assertEqual(len(stats["duplicates"][first_id]["duration"]), 2)
+        self.assertIn("4 queries", self.panel.nav_subtitle)
+
+        context = self.panel._render_context
+        self.assertEqual(len(context["queries"]), 2)
+        query = context["queries"][0]
+        self.assertEqual(query["occurrence_count"], 3)
+        self.assertNotIn("occurrence_count", context["queries"][1])
+        databases = dict(context["databases"])
+        self.assertEqual(databases["default"]["duplicate_count"], 3)
+        self.assertEqual(databases["default"]["similar_count"], 4)
+        self.assertIn("Executed 3 times", self.panel.content)
+        # The call sites are only rendered when asked for.
+        self.assertNotIn("<th>Call site</th>", self.panel.content)
+        self.assertIn("djdt-sql-call-sites", self.panel.content)
+        call_sites = self.panel.render_call_sites(first_id)
+        self.assertEqual(call_sites.count("<td>3</td>"), 1)
+        self.assertIsNone(
+            self.panel.render_call_sites(stats["queries"][1]["djdt_query_id"])
+        )
+
     def test_simplification(self):
         """
         Test case to validate that select lists for .count() and .exist() queries do not
@@ -732,9 +1014,9 @@ class SQLPanelTestCase(BaseTestCase):
         # The content formats the sql which injects the ellipsis character
         self.assertTrue(self.panel.content)
         self.assertEqual(len(self.panel._queries), 3)
-        self.assertNotIn("\u2022", self.panel._queries[0]["sql"])
-        self.assertNotIn("\u2022", self.panel._queries[1]["sql"])
-        self.assertIn("\u2022", self.panel._queries[2]["sql"])
+        self.assertNotIn("\u2022", self.panel._render_context["queries"][0]["sql"])
+        self.assertNotIn("\u2022", self.panel._render_context["queries"][1]["sql"])
+        self.assertIn("\u2022", self.panel._render_context["queries"][2]["sql"])
 
     def test_top_level_simplification(self):
         """
@@ -763,18 +1045,34 @@ class SQLPanelTestCase(BaseTestCase):
         else:
             self.assertEqual(len(self.panel._queries), 2)
         # WHERE ... IN SELECT ... queries should have only one elided select list
-        self.assertEqual(self.panel._queries[0]["sql"].count("SELECT"), 4)
-        self.assertEqual(self.panel._queries[0]["sql"].count("\u2022"), 3)
+        self.assertEqual(
+            self.panel._render_context["queries"][0]["sql"].count("SELECT"), 4
+        )
+        self.assertEqual(
+            self.panel._render_context["queries"][0]["sql"].count("\u2022"), 3
+        )
         # UNION queries should have two elidid select lists
-        self.assertEqual(self.panel._queries[1]["sql"].count("SELECT"), 4)
-        self.assertEqual(self.panel._queries[1]["sql"].count("\u2022"), 6)
+        self.assertEqual(
+            self.panel._render_context["queries"][1]["sql"].count("SELECT"), 4
+        )
+        self.assertEqual(
+            self.panel._render_context["queries"][1]["sql"].count("\u2022"), 6
+        )
         if connection.vendor != "mysql":
             # INTERSECT queries should have two elidid select lists
-            self.assertEqual(self.panel._queries[2]["sql"].count("SELECT"), 4)
-            self.assertEqual(self.panel._queries[2]["sql"].count("\u2022"), 6)
+            self.assertEqual(
+                self.panel._render_context["queries"][2]["sql"].count("SELECT"), 4
+            )
+            self.assertEqual(
+                self.panel._render_context["queries"][2]["sql"].count("\u2022"), 6
+            )
             # EXCEPT queries should have two elidid select lists
-            self.assertEqual(self.panel._queries[3]["sql"].count("SELECT"), 4)
-            self.assertEqual(self.panel._queries[3]["sql"].count("\u2022"), 6)
+            self.assertEqual(
+                self.panel._render_context["queries"][3]["sql"].count("SELECT"), 4
+            )
+            self.assertEqual(
+                self.panel._render_context["queries"][3]["sql"].count("\u2022"), 6
+            )
 
     @override_settings(
         DEBUG=True,
@@ -791,8 +1089,9 @@ class SQLPanelTestCase(BaseTestCase):
 
         self.assertEqual(len(self.panel._queries), 1)
 
-        query = self.panel._queries[0]
-        template_info = query["template_info"]
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        template_info = self.panel.get_stats()["queries"][0]["template_info"]
         template_name = os.path.basename(template_info["name"])
         self.assertEqual(template_name, "flat.html")
         self.assertEqual(template_info["context"][3]["content"].strip(), "{{ users }}")
@@ -813,8 +1112,9 @@ class SQLPanelTestCase(BaseTestCase):
 
         self.assertEqual(len(self.panel._queries), 1)
 
-        query = self.panel._queries[0]
-        template_info = query["template_info"]
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+        template_info = self.panel.get_stats()["queries"][0]["template_info"]
         template_name = os.path.basename(template_info["name"])
         self.assertEqual(template_name, "included.html")
         self.assertEqual(template_info["context"][0]["content"].strip(), "{{ users }}")
@@ -835,7 +1135,7 @@ class SQLPanelTestCase(BaseTestCase):
 
         self.assertEqual(len(self.panel._queries), 6)
 
-        queries = self.panel._queries
+        queries = self.panel._render_context["queries"]
         query = queries[0]
         self.assertEqual(query["similar_count"], 3)
         self.assertEqual(query["duplicate_count"], 2)
@@ -869,6 +1169,99 @@ class SQLPanelTestCase(BaseTestCase):
         self.assertNotEqual(queries[0]["similar_color"], queries[3]["similar_color"])
         self.assertNotEqual(queries[0]["duplicate_color"], queries[3]["similar_color"])
 
+    def test_similar_grouping_ignores_in_list_length(self):
+        list(User.objects.filter(id__in=[1, 2]))
+        list(User.objects.filter(id__in=[1, 2, 3]))
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        queries = self.panel._render_context["queries"]
+        self.assertEqual(queries[0]["similar_count"], 2)
+        self.assertEqual(queries[1]["similar_count"], 2)
+
+    def test_fingerprint_sql(self):
+        self.assertEqual(
+            fingerprint_sql(
+                'SELECT  "t1"."id" FROM "t1"\n'
+                'WHERE "t1"."id" IN (%s, %s) AND "t1"."name" = \'it\'\'s\' LIMIT 21'
+            ),
+            'SELECT "t1"."id" FROM "t1" WHERE "t1"."id" IN (...) '
+            'AND "t1"."name" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"),
+            fingerprint_sql("INSERT INTO t (a, b) VALUES (%s, %s)"),
+        )
+
+    def test_fingerprint_stats(self):
+        for i in range(3):
+            User.objects.filter(id=i).count()
+        User.objects.count()
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        fingerprints = self.panel._render_context["fingerprints"]
+        self.assertEqual(len(fingerprints), 2)
+        fingerprint = next(f for f in fingerprints if f["count"] == 3)
+        durations = [query["duration"] for query in self.panel._queries[:3]]
+        self.assertIn("WHERE", fingerprint["fingerprint"])
+        self.assertEqual(fingerprint["alias"], "default")
+        self.assertAlmostEqual(fingerprint["total_time"], sum(durations))
+        self.assertEqual(fingerprint["max_time"], max(durations))
+        self.assertEqual(fingerprint["p50_time"], sorted(durations)[1])
+        self.assertEqual(fingerprint["call_sites"], 1)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_N_PLUS_ONE_THRESHOLD": 3})
+    def test_n_plus_one_detection(self):
+        for i in range(3):
+            User.objects.filter(id=i).count()
+        User.objects.filter(id=3).count()
+        User.objects.filter(id=4).count()
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        context = self.panel._render_context
+        self.assertEqual(
+            [query.get("n_plus_one") for query in context["queries"]],
+            [True] * 3 + [None] * 2,
+        )
+        (fingerprint,) = context["fingerprints"]
+        self.assertEqual(fingerprint["call_sites"], 3)
+        (call_site,) = fingerprint["n_plus_one"]
+        self.assertEqual(call_site["filename"], __file__)
+        self.assertEqual(call_site["count"], 3)
+        self.assertEqual(dict(context["databases"])["default"]["n_plus_one_count"], 3)
+        self.assertIn("Possible N+1", self.panel.content)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_MAX_QUERIES": 2})
+    def test_max_queries(self):
+        with patch.object(
+            sql_panel, "capture_stack_trace", wraps=sql_panel.capture_stack_trace
+        ) as capture_stack_trace:
+            for i in range(4):
+                User.objects.filter(id=i).count()
+            User.objects.count()
+        # Queries past the limit are summarized without capturing a stack.
+        self.assertEqual(capture_stack_trace.call_count, 2)
+
+        response = self.panel.process_request(self.request)
+        self.panel.generate_stats(self.request, response)
+
+        stats = self.panel.get_stats()
+        self.assertEqual(len(stats["queries"]), 2)
+        self.assertEqual(stats["overflow_count"], 3)
+        self.assertEqual(
+            sorted(summary["count"] for summary in stats["overflow"]), [1, 2]
+        )
+        for summary in stats["overflow"]:
+            self.assertEqual(sum(summary["histogram"]), summary["count"])
+        self.assertEqual(self.panel._databases["default"]["num_queries"], 5)
+        self.assertIn("5 queries", self.panel.nav_subtitle)
+        self.assertIn("3 more queries were summarized", self.panel.content)
+
     def test_explain_with_union(self):
         list(User.objects.filter(id__lt=20).union(User.objects.filter(id__gt=10)))
         response = self.panel.process_request(self.request)
@@ -880,7 +1273,7 @@ class SQLPanelTestCase(BaseTestCase):
         """
         Test that SQLParseError is handled gracefully by disabling grouping.
         """
-        parse_sql.cache_clear()
+        _format_cache.clear()
 
         def run_side_effect(sql):
             if mock_stack.run.call_count == 1:
@@ -900,7 +1293,56 @@ class SQLPanelTestCase(BaseTestCase):
             self.assertFalse(mock_stack._grouping)
             self.assertIn("SELECT", result)
 
-        parse_sql.cache_clear()
+        _format_cache.clear()
+
+    def test_reformat_query_sql(self):
+        """
+        Formatting before interpolating the parameters gives the same output
+        as formatting the interpolated SQL.
+        """
+        queries = [
+            {
+                "raw_sql": 'SELECT "a", "b" FROM "t" WHERE "a" = %s AND "b" IN (%s, %s)',
+                "params": ["x<y", None, True],
+            },
+            {
+                "raw_sql": 'SELECT "a" FROM "t" WHERE "a" = %(a)s',
+                "params": {"a": "it's"},
+            },
+            {"raw_sql": 'SELECT "a" FROM "t" WHERE "a" = 1', "params": None},
+            {"sql": "SELECT 'legacy'"},
+        ]
+        for query in queries:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    reformat_query_sql(query, with_toggle=True),
+                    reformat_sql(get_query_sql(query), with_toggle=True),
+                )
+
+    def test_format_tokens_breaks_top_level_clauses(self):
+        sql = 'SELECT "a" FROM "t" WHERE "a" IN (SELECT "b" FROM "u") ORDER BY "a"'
+        formatted = format_tokens(tokenize(sql), break_clauses=True)
+        self.assertEqual(
+            formatted,
+            '<strong>SELECT</strong> "a"<br/><strong>FROM</strong> "t"<br/>'
+            '<strong>WHERE</strong> "a" <strong>IN</strong> (<strong>SELECT</strong> '
+            '"b" <strong>FROM</strong> "u")<br/><strong>ORDER BY</strong> "a"',
+        )
+
+    def test_format_cache(self):
+        _format_cache.clear()
+        sql = 'SELECT "a" FROM "t"'
+        parse_sql(sql)
+        self.assertIsNotNone(_format_cache.get((sql, False)))
+        with override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_FORMAT_CACHE_SIZE": 0}):
+            parse_sql(sql)
+            self.assertIsNone(_format_cache.get((sql, False)))
+        with override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_FORMAT_CACHE_SIZE": 2}):
+            for table in "tuvw":
+                parse_sql(f'SELECT "a" FROM "{table}"')
+            self.assertEqual(len(_format_cache._entries), 2)
+            self.assertIsNotNone(_format_cache.get(('SELECT "a" FROM "w"', False)))
+        _format_cache.clear()
 
 
 class SQLPanelMultiDBTestCase(BaseMultiDBTestCase):
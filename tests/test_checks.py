@@ -314,3 +314,11 @@ class ChecksTestCase(SimpleTestCase):
         errors = run_checks()
         self.assertEqual(len(errors), 1)
         self.assertEqual(errors[0].id, "debug_toolbar.W008")
+
+    @override_settings(
+        DEBUG_TOOLBAR_CONFIG={"SQL_QUERIES_PAGE_SIZE": 0, "IS_RUNNING_TESTS": False}
+    )
+    def test_sql_queries_page_size_below_one(self):
+        errors = run_checks()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].id, "debug_toolbar.W009")
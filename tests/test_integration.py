@@ -1,3 +1,4 @@
+import copy
 import os
 import re
 import time
@@ -27,6 +28,7 @@ from debug_toolbar.panels.cache import CachePanel
 from debug_toolbar.panels.history import HistoryPanel
 from debug_toolbar.panels.request import RequestPanel
 from debug_toolbar.panels.sql import SQLPanel
+from debug_toolbar.panels.sql.explain import PLANS_ID, collect_plans, save_plans
 from debug_toolbar.panels.templates import TemplatesPanel
 from debug_toolbar.panels.versions import VersionsPanel
 from debug_toolbar.store import get_store
@@ -111,6 +113,38 @@ class DebugToolbarTestCase(BaseTestCase):
             self.assertEqual(response.status_code, 200)
             self.assertContains(response, "djDebug")  # toolbar
 
+    def test_panel_stats_saved_once_per_request(self):
+        store = get_store()
+        with (
+            patch.object(store, "save_panel", wraps=store.save_panel) as save_panel,
+            patch.object(store, "save_panels", wraps=store.save_panels) as save_panels,
+        ):
+            self.client.get("/regular/basic/")
+        save_panel.assert_not_called()
+        save_panels.assert_called_once()
+        request_id, panels = save_panels.call_args.args
+        self.assertIn(RequestPanel.panel_id, panels)
+        self.assertEqual(
+            store.panel(request_id, RequestPanel.panel_id)["view_func"],
+            "tests.views.regular_view",
+        )
+
+    def test_panel_stats_saved_after_response_is_closed(self):
+        def get_response(request):
+            return regular_view(request, "title")
+
+        with patch.object(Panel, "stats_saved") as stats_saved:
+            response = DebugToolbarMiddleware(get_response)(self.request)
+            self.assertContains(response, "djDebug")
+            # The panels aren't told before the response is sent.
+            stats_saved.assert_not_called()
+            response.close()
+            self.assertTrue(stats_saved.called)
+            stats_saved.reset_mock()
+            # Closing another response doesn't tell them again.
+            HttpResponse().close()
+        stats_saved.assert_not_called()
+
     def test_should_render_panels_RENDER_PANELS(self):
         """
         The toolbar should force rendering panels on each request
@@ -455,6 +489,105 @@ class DebugToolbarIntegrationTestCase(IntegrationTestCase):
             )
             self.assertEqual(response.status_code, 404)
 
+    def test_sql_select_with_request_token(self):
+        self.client.get("/execute_sql/")
+        request_id = list(get_store().request_ids())[-1]
+        toolbar = DebugToolbar.fetch(request_id, SQLPanel.panel_id)
+        panel = toolbar.get_panel_by_id(SQLPanel.panel_id)
+        djdt_query_id = panel.get_stats()["queries"][-1]["djdt_query_id"]
+        signed = SignedDataForm.sign({"request_id": request_id})
+
+        url = "/__debug__/sql_select/"
+        response = self.client.post(
+            url, {"signed": signed, "djdt_query_id": djdt_query_id}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {"signed": signed, "djdt_query_id": "x"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            url, {"signed": signed + "x", "djdt_query_id": djdt_query_id}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_sql_queries(self):
+        self.client.get("/execute_sql/")
+        request_id = list(get_store().request_ids())[-1]
+
+        url = "/__debug__/sql_queries/"
+        response = self.client.get(url, {"request_id": request_id, "offset": 0})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn('id="sqlMain_1"', data["content"])
+        self.assertIsNone(data["next"])
+        response = self.client.get(url, {"request_id": request_id, "offset": "x"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"request_id": "x", "offset": 0})
+        self.assertEqual(response.status_code, 400)
+        with self.settings(INTERNAL_IPS=[]):
+            response = self.client.get(url, {"request_id": request_id, "offset": 0})
+            self.assertEqual(response.status_code, 404)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_COLLAPSE_DUPLICATES": True})
+    def test_sql_queries_call_sites(self):
+        self.client.get("/execute_duplicated_sql/")
+        request_id = list(get_store().request_ids())[-1]
+        toolbar = DebugToolbar.fetch(request_id, SQLPanel.panel_id)
+        panel = toolbar.get_panel_by_id(SQLPanel.panel_id)
+        (query_id,) = panel.get_stats()["duplicates"]
+
+        url = "/__debug__/sql_queries/"
+        response = self.client.get(
+            url, {"request_id": request_id, "query_id": query_id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("<td>3</td>", response.json()["content"])
+        response = self.client.get(url, {"request_id": request_id, "query_id": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQL_AUTO_EXPLAIN": 1})
+    def test_sql_auto_explain(self):
+        store = get_store()
+        saved = []
+
+        def schedule_explain(request_id, queries):
+            saved.append(bool(store.panel(request_id, SQLPanel.panel_id)))
+
+        with patch(
+            "debug_toolbar.panels.sql.panel.schedule_explain",
+            side_effect=schedule_explain,
+        ) as schedule:
+            self.client.get("/execute_sql/")
+        request_id = list(store.request_ids())[-1]
+        # The queries are handed to the worker once the stats are stored.
+        schedule.assert_called_once()
+        self.assertEqual(saved, [True])
+        self.assertEqual(schedule.call_args.args[0], request_id)
+        queries = schedule.call_args.args[1]
+        self.assertEqual(len(queries), 1)
+        self.assertIn("auth_user", queries[0]["raw_sql"])
+
+        sql_data = store.panel(request_id, SQLPanel.panel_id)
+        with patch.object(
+            store, "update_panels", wraps=store.update_panels
+        ) as update_panels:
+            save_plans(request_id, collect_plans(queries))
+        # The plans are stored on their own, the panel's data isn't rewritten.
+        self.assertEqual(list(update_panels.call_args.args[1]), [PLANS_ID])
+        self.assertEqual(store.panel(request_id, SQLPanel.panel_id), sql_data)
+        toolbar = DebugToolbar.fetch(request_id, SQLPanel.panel_id)
+        panel = toolbar.get_panel_by_id(SQLPanel.panel_id)
+        self.assertIn(queries[0]["djdt_query_id"], panel._plans)
+        self.assertIn("Query plan:", panel.content)
+
+    def test_sql_auto_explain_drops_plans_of_deleted_request(self):
+        self.client.get("/execute_sql/")
+        store = get_store()
+        request_id = list(store.request_ids())[-1]
+        store.delete(request_id)
+        save_plans(request_id, {"query": {"headers": [], "result": []}})
+        self.assertFalse(store.exists(request_id))
+        self.assertEqual(store.panel(request_id, PLANS_ID), {})
+
     def test_sql_explain_checks_show_toolbar(self):
         self.client.get("/execute_sql/")
         request_ids = list(get_store().request_ids())
@@ -571,6 +704,19 @@ class DebugToolbarIntegrationTestCase(IntegrationTestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, 200)
 
+    def test_sql_panel_content_does_not_modify_stored_queries(self):
+        self.client.get("/execute_sql/")
+        request_id = list(get_store().request_ids())[-1]
+        stored = get_store().panel(request_id, SQLPanel.panel_id)
+        stored_queries = copy.deepcopy(stored["queries"])
+
+        toolbar = DebugToolbar.fetch(request_id, SQLPanel.panel_id)
+        self.assertTrue(toolbar.get_panel_by_id(SQLPanel.panel_id).content)
+
+        stored = get_store().panel(request_id, SQLPanel.panel_id)
+        self.assertEqual(stored["queries"], stored_queries)
+        self.assertNotIn("form", stored["queries"])
+
     def test_sql_profile_checks_show_toolbar(self):
         self.client.get("/execute_sql/")
         request_ids = list(get_store().request_ids())
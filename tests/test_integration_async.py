@@ -103,6 +103,17 @@ class DebugToolbarTestCase(BaseTestCase):
         # check toolbar insertion before "</body>"
         self.assertContains(response, "</div>\n</body>")
 
+    async def test_panel_stats_saved_after_response_is_closed(self):
+        async def get_response(request):
+            return regular_view(request, "title")
+
+        with patch.object(Panel, "stats_saved") as stats_saved:
+            response = await DebugToolbarMiddleware(get_response)(self.request)
+            self.assertContains(response, "djDebug")
+            stats_saved.assert_not_called()
+            response.close()
+        self.assertTrue(stats_saved.called)
+
     async def test_middleware_no_injection_when_encoded(self):
         async def get_response(request):
             response = HttpResponse("<html><body></body></html>")
@@ -237,6 +248,34 @@ class DebugToolbarIntegrationTestCase(IntegrationTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "djDebug")
 
+    async def test_middleware_uses_async_store_methods(self):
+        store = get_store()
+        with (
+            patch.object(store, "aset", wraps=store.aset) as aset,
+            patch.object(
+                store, "asave_panels", wraps=store.asave_panels
+            ) as asave_panels,
+        ):
+            response = await self.async_client.get("/regular/basic/")
+        self.assertContains(response, "djDebug")
+        aset.assert_awaited_once()
+        request_id = aset.await_args.args[0]
+        asave_panels.assert_awaited_once()
+        self.assertEqual(asave_panels.await_args.args[0], request_id)
+
+    async def test_history_views_use_async_store_methods(self):
+        await self.async_client.get("/regular/basic/")
+        store = get_store()
+        request_id = list(store.request_ids())[-1]
+        with patch.object(store, "apanels", wraps=store.apanels) as apanels:
+            response = await self.async_client.get(
+                "/__debug__/history_sidebar/",
+                {"request_id": request_id, "exclude_history": True},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("SQLPanel", response.json())
+        apanels.assert_called_once_with(request_id)
+
     @override_settings(DEFAULT_CHARSET="iso-8859-1")
     async def test_non_utf8_charset(self):
         response = await self.async_client.get("/regular/ASCII/")
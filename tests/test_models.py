@@ -1,8 +1,9 @@
 import uuid
 
+from django.db import IntegrityError
 from django.test import TestCase
 
-from debug_toolbar.models import HistoryEntry
+from debug_toolbar.models import HistoryEntry, HistoryEntryBlob, HistoryEntryPanel
 
 
 class HistoryEntryTestCase(TestCase):
@@ -11,22 +12,57 @@ class HistoryEntryTestCase(TestCase):
         entry = HistoryEntry(request_id=test_uuid)
         self.assertEqual(str(entry), str(test_uuid))
 
-    def test_data_field_default(self):
-        """Test that the data field defaults to an empty dict"""
-        entry = HistoryEntry(request_id=uuid.uuid4())
-        self.assertEqual(entry.data, {})
-
     def test_model_persistence(self):
         """Test saving and retrieving a model instance"""
         test_uuid = uuid.uuid4()
-        entry = HistoryEntry(request_id=test_uuid, data={"test": True})
+        entry = HistoryEntry(request_id=test_uuid)
         entry.save()
 
         # Retrieve from database and verify
         saved_entry = HistoryEntry.objects.get(request_id=test_uuid)
-        self.assertEqual(saved_entry.data, {"test": True})
+        self.assertIsNotNone(saved_entry.created_at)
         self.assertEqual(str(saved_entry), str(test_uuid))
 
     def test_default_ordering(self):
         """Test that the default ordering is by created_at in descending order"""
         self.assertEqual(HistoryEntry._meta.ordering, ["-created_at"])
+
+    def test_created_at_is_indexed(self):
+        self.assertTrue(HistoryEntry._meta.get_field("created_at").db_index)
+
+
+class HistoryEntryBlobTestCase(TestCase):
+    def test_str_method(self):
+        blob = HistoryEntryBlob(digest="0" * 64, data="{}")
+        self.assertEqual(str(blob), "0" * 64)
+
+
+class HistoryEntryPanelTestCase(TestCase):
+    def setUp(self):
+        self.blob = HistoryEntryBlob.objects.create(
+            digest="0" * 64, data='{"test": true}', refs=1
+        )
+
+    def test_str_method(self):
+        test_uuid = uuid.uuid4()
+        panel = HistoryEntryPanel(entry_id=test_uuid, panel_id="SQLPanel")
+        self.assertEqual(str(panel), f"{test_uuid} SQLPanel")
+
+    def test_model_persistence(self):
+        """Test that the panel data is stored as is"""
+        entry = HistoryEntry.objects.create(request_id=uuid.uuid4())
+        HistoryEntryPanel.objects.create(
+            entry=entry, panel_id="SQLPanel", blob=self.blob
+        )
+        saved_panel = HistoryEntryPanel.objects.get(entry=entry)
+        self.assertEqual(saved_panel.blob.data, '{"test": true}')
+
+    def test_unique_panel_per_entry(self):
+        entry = HistoryEntry.objects.create(request_id=uuid.uuid4())
+        HistoryEntryPanel.objects.create(
+            entry=entry, panel_id="SQLPanel", blob=self.blob
+        )
+        with self.assertRaises(IntegrityError):
+            HistoryEntryPanel.objects.create(
+                entry=entry, panel_id="SQLPanel", blob=self.blob
+            )
@@ -1,8 +1,15 @@
 import base64
+import os
+import sqlite3
 import sys
+import tempfile
+import threading
 import uuid
+from contextlib import closing
 from unittest.mock import patch
 
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management import call_command
 from django.db import connection
 from django.http import HttpResponse
@@ -11,6 +18,7 @@ from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.safestring import SafeData, mark_safe
 
 from debug_toolbar import store
+from debug_toolbar.models import HistoryEntry, HistoryEntryBlob, HistoryEntryPanel
 from debug_toolbar.toolbar import DebugToolbar
 
 
@@ -87,13 +95,68 @@ class SerializationTestCase(TestCase):
         )
 
 
+@override_settings(
+    DEBUG_TOOLBAR_CONFIG={
+        "TOOLBAR_SERIALIZER_CLASS": "debug_toolbar.store.ZlibJSONSerializer"
+    }
+)
+class ZlibJSONSerializationTestCase(TestCase):
+    def test_serialize(self):
+        serialized = store.serialize({"hello": {"foo": "bar"}})
+        self.assertTrue(serialized.startswith("zlib:"))
+        self.assertEqual(store.deserialize(serialized), {"hello": {"foo": "bar"}})
+
+    def test_binary_roundtrip(self):
+        data = {"geometry": b"\x01\x01\x00\x00\x20\xe6\x10\x00\x00", "name": "test"}
+        self.assertEqual(store.deserialize(store.serialize(data)), data)
+
+    def test_compresses_repeated_data(self):
+        data = {"queries": [{"sql": "SELECT * FROM auth_user"}] * 100}
+        self.assertLess(
+            len(store.serialize(data)), len(store.JSONSerializer.dumps(data)) // 10
+        )
+
+    def test_deserialize_json(self):
+        self.assertEqual(
+            store.deserialize('{"hello": {"foo": "bar"}}'),
+            {"hello": {"foo": "bar"}},
+        )
+
+    def test_deserialize_after_setting_change(self):
+        serialized = store.serialize({"hello": {"foo": "bar"}})
+        with self.settings(DEBUG_TOOLBAR_CONFIG={}):
+            self.assertEqual(store.deserialize(serialized), {"hello": {"foo": "bar"}})
+
+
+class DecodedPanelCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = store._DecodedPanelCache()
+
+    def test_bounded_by_bytes(self):
+        self.cache.max_bytes = 30
+        small = store.serialize("x" * 10)
+        for request_id in ("foo", "bar", "baz"):
+            self.cache.get(request_id, "panel", small)
+        self.assertEqual(
+            list(self.cache._entries), [("bar", "panel"), ("baz", "panel")]
+        )
+        self.assertEqual(self.cache._size, 2 * len(small))
+
+    def test_large_panel_is_not_cached(self):
+        self.cache.max_bytes = 30
+        large = store.serialize("x" * 40)
+        self.assertEqual(self.cache.get("foo", "panel", large), "x" * 40)
+        self.assertEqual(self.cache._entries, {})
+        self.assertEqual(self.cache._size, 0)
+
+
 class BaseStoreTestCase(TestCase):
     def test_methods_are_not_implemented(self):
         # Find all the non-private and dunder class methods
         methods = [
             member for member in vars(store.BaseStore) if not member.startswith("_")
         ]
-        self.assertEqual(len(methods), 7)
+        self.assertEqual(len(methods), 19)
         with self.assertRaises(NotImplementedError):
             store.BaseStore.request_ids()
         with self.assertRaises(NotImplementedError):
@@ -106,8 +169,34 @@ class BaseStoreTestCase(TestCase):
             store.BaseStore.delete("")
         with self.assertRaises(NotImplementedError):
             store.BaseStore.save_panel("", "", None)
+        with self.assertRaises(NotImplementedError):
+            store.BaseStore.save_panels("", {"": None})
+        with self.assertRaises(NotImplementedError):
+            store.BaseStore.update_panels("", {"": None})
         with self.assertRaises(NotImplementedError):
             store.BaseStore.panel("", "")
+        with self.assertRaises(NotImplementedError):
+            list(store.BaseStore.panels(""))
+        with self.assertRaises(NotImplementedError):
+            store.BaseStore.panel_record("", "", "", "")
+
+    async def test_async_methods_are_not_implemented(self):
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.arequest_ids()
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.aexists("")
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.aset("")
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.asave_panel("", "", None)
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.asave_panels("", {"": None})
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.aupdate_panels("", {"": None})
+        with self.assertRaises(NotImplementedError):
+            await store.BaseStore.apanel("", "")
+        with self.assertRaises(NotImplementedError):
+            [item async for item in store.BaseStore.apanels("")]
 
 
 class CommonStoreTestsMixin:
@@ -143,6 +232,28 @@ class CommonStoreTestsMixin:
         self.store.set(foo_id)
         self.assertTrue(self.store.exists(foo_id))
 
+    async def test_async_methods(self):
+        foo_id = self._get_request_id("foo")
+        self.assertFalse(await self.store.aexists(foo_id))
+        await self.store.aset(foo_id)
+        self.assertTrue(await self.store.aexists(foo_id))
+        self.assertIn(
+            str(foo_id),
+            [str(request_id) for request_id in await self.store.arequest_ids()],
+        )
+        await self.store.asave_panel(foo_id, "foo.panel", {"a": 1})
+        await self.store.asave_panels(foo_id, {"bar.panel": {"b": 2}})
+        self.assertEqual(await self.store.apanel(foo_id, "foo.panel"), {"a": 1})
+        self.assertEqual(await self.store.apanel(foo_id, "missing.panel"), {})
+        self.assertEqual(
+            {panel_id: data async for panel_id, data in self.store.apanels(foo_id)},
+            {"foo.panel": {"a": 1}, "bar.panel": {"b": 2}},
+        )
+        # The sync and async methods share the same data.
+        self.assertEqual(
+            await sync_to_async(self.store.panel)(foo_id, "bar.panel"), {"b": 2}
+        )
+
     def test_set_max_size(self):
         foo_id = self._get_request_id("foo")
         bar_id = self._get_request_id("bar")
@@ -177,6 +288,39 @@ class CommonStoreTestsMixin:
         self.assertTrue(self.store.exists(bar_id))
         self.assertEqual(self.store.panel(bar_id, "bar.panel"), {"a": 1})
 
+    def test_save_panels(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(bar_id, "panel1", {"a": 1})
+        self.store.save_panels(bar_id, {"panel2": {"b": 2}, "panel3": {"c": 3}})
+        self.assertTrue(self.store.exists(bar_id))
+        self.assertEqual(
+            dict(self.store.panels(bar_id)),
+            {"panel1": {"a": 1}, "panel2": {"b": 2}, "panel3": {"c": 3}},
+        )
+
+    def test_update_panels(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(bar_id, "panel1", {"a": 1})
+        self.assertTrue(self.store.update_panels(bar_id, {"panel2": {"b": 2}}))
+        self.assertEqual(
+            dict(self.store.panels(bar_id)), {"panel1": {"a": 1}, "panel2": {"b": 2}}
+        )
+
+    def test_update_panels_of_missing_request(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(bar_id, "panel1", {"a": 1})
+        self.store.delete(bar_id)
+        self.assertFalse(self.store.update_panels(bar_id, {"panel2": {"b": 2}}))
+        self.assertFalse(self.store.exists(bar_id))
+        self.assertEqual(self.store.panel(bar_id, "panel2"), {})
+
+    async def test_aupdate_panels(self):
+        bar_id = self._get_request_id("bar")
+        self.assertFalse(await self.store.aupdate_panels(bar_id, {"panel": {"a": 1}}))
+        await self.store.aset(bar_id)
+        self.assertTrue(await self.store.aupdate_panels(bar_id, {"panel": {"a": 1}}))
+        self.assertEqual(await self.store.apanel(bar_id, "panel"), {"a": 1})
+
     def test_panel(self):
         missing_id = self._get_request_id("missing")
         bar_id = self._get_request_id("bar")
@@ -198,6 +342,61 @@ class CommonStoreTestsMixin:
         panels = dict(self.store.panels(missing_id))
         self.assertEqual(panels, {})
 
+    def test_panel_is_decoded_once(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(bar_id, "bar.panel", {"a": 1})
+        with patch("debug_toolbar.store.deserialize", wraps=store.deserialize) as m:
+            first = self.store.panel(bar_id, "bar.panel")
+            second = self.store.panel(bar_id, "bar.panel")
+        self.assertIs(first, second)
+        self.assertEqual(m.call_count, 1)
+
+    def test_panel_decoded_again_after_save(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(bar_id, "bar.panel", {"a": 1})
+        self.assertEqual(self.store.panel(bar_id, "bar.panel"), {"a": 1})
+        self.store.save_panel(bar_id, "bar.panel", {"a": 2})
+        self.assertEqual(self.store.panel(bar_id, "bar.panel"), {"a": 2})
+
+    def test_panel_record(self):
+        bar_id = self._get_request_id("bar")
+        missing_id = self._get_request_id("missing")
+        self.store.save_panel(
+            bar_id,
+            "bar.panel",
+            {"records": [{"record_id": "x", "value": 1}, {"record_id": "y"}]},
+        )
+        self.assertEqual(
+            self.store.panel_record(
+                bar_id, "bar.panel", "records", "x", id_key="record_id"
+            ),
+            {"record_id": "x", "value": 1},
+        )
+        self.assertIsNone(
+            self.store.panel_record(
+                bar_id, "bar.panel", "records", "z", id_key="record_id"
+            )
+        )
+        self.assertIsNone(
+            self.store.panel_record(
+                missing_id, "bar.panel", "records", "x", id_key="record_id"
+            )
+        )
+
+    def test_panel_record_from_columns(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(
+            bar_id,
+            "bar.panel",
+            {"records": {"record_id": ["x", "y"], "value": [1, None]}},
+        )
+        self.assertEqual(
+            self.store.panel_record(
+                bar_id, "bar.panel", "records", "y", id_key="record_id"
+            ),
+            {"record_id": "y", "value": None},
+        )
+
 
 class MemoryStoreTestCase(CommonStoreTestsMixin, TestCase):
     @classmethod
@@ -219,6 +418,85 @@ class MemoryStoreTestCase(CommonStoreTestsMixin, TestCase):
         self.assertTrue(type(after["string"]) is str)
         self.assertFalse(isinstance(after["string"], SafeData))
 
+    def test_max_bytes_evicts_least_recently_written(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_MAX_BYTES": 100}):
+            self.store.save_panel("foo", "foo.panel", "x" * 40)
+            self.store.save_panel("bar", "bar.panel", "y" * 40)
+            self.assertEqual(list(self.store.request_ids()), ["foo", "bar"])
+            # Reading a request doesn't change the order of eviction.
+            self.store.panel("foo", "foo.panel")
+            self.store.save_panel("baz", "baz.panel", "z" * 40)
+            self.assertEqual(list(self.store.request_ids()), ["bar", "baz"])
+            self.assertEqual(self.store.panel("foo", "foo.panel"), {})
+            self.assertLessEqual(self.store._total_size, 100)
+
+    def test_max_bytes_drops_oversized_panel(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_MAX_BYTES": 100}):
+            self.store.save_panel("foo", "small.panel", {"a": 1})
+            self.store.save_panel("foo", "big.panel", "x" * 200)
+            self.assertEqual(list(self.store.request_ids()), ["foo"])
+            self.assertEqual(self.store.panel("foo", "small.panel"), {"a": 1})
+            self.assertEqual(self.store.panel("foo", "big.panel"), {})
+            self.assertLessEqual(self.store._total_size, 100)
+
+    def test_size_accounting(self):
+        self.store.save_panel("foo", "foo.panel", {"a": 1})
+        self.store.save_panel("foo", "foo.panel", {"a": 12345})
+        self.store.save_panel("bar", "bar.panel", [1, 2])
+        self.assertEqual(
+            self.store._total_size,
+            len(store.serialize({"a": 12345})) + len(store.serialize([1, 2])),
+        )
+        self.store.delete("foo")
+        self.assertEqual(self.store._total_size, len(store.serialize([1, 2])))
+        self.store.clear()
+        self.assertEqual(self.store._total_size, 0)
+
+    def test_concurrent_writes(self):
+        def save(name):
+            for i in range(50):
+                self.store.save_panel(f"{name}-{i}", "panel", {"i": i})
+
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 10}):
+            threads = [threading.Thread(target=save, args=(name,)) for name in "abcd"]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(self.store.request_ids()), 10)
+            self.assertEqual(
+                self.store._total_size,
+                sum(len(data) for data, _ in self.store._blobs.values()),
+            )
+            self.assertEqual(
+                sum(refs for _, refs in self.store._blobs.values()),
+                sum(len(panels) for panels in self.store._request_store.values()),
+            )
+
+    def test_identical_panels_are_stored_once(self):
+        for request_id in ("foo", "bar", "baz"):
+            self.store.save_panels(
+                request_id, {"settings": {"DEBUG": True}, "request": request_id}
+            )
+        shared = store.serialize({"DEBUG": True})
+        self.assertEqual(self.store._blobs[shared][1], 3)
+        self.assertIs(
+            self.store._request_store["foo"]["settings"],
+            self.store._request_store["bar"]["settings"],
+        )
+        self.assertEqual(
+            self.store._total_size,
+            len(shared) + sum(len(store.serialize(i)) for i in ("foo", "bar", "baz")),
+        )
+
+        # The shared payload is kept until no request references it.
+        self.store.delete("foo")
+        self.store.save_panel("bar", "settings", {"DEBUG": False})
+        self.assertEqual(self.store._blobs[shared][1], 1)
+        self.assertEqual(self.store.panel("baz", "settings"), {"DEBUG": True})
+        self.store.delete("baz")
+        self.assertNotIn(shared, self.store._blobs)
+
 
 class StubStore(store.BaseStore):
     pass
@@ -281,6 +559,104 @@ class DatabaseStoreTestCase(CommonStoreTestsMixin, TestCase):
             self.assertEqual(request_ids, {id2})
             self.assertFalse(self.store.exists(id1))
 
+    def test_set_prunes_in_batches(self):
+        ids = [str(uuid.uuid4()) for _ in range(10)]
+        with (
+            self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 8}),
+            patch.object(self.store, "_requests_since_prune", 0),
+        ):
+            for request_id in ids[:9]:
+                self.store.set(request_id)
+            # The surplus entry is kept until a full batch of two is due.
+            self.assertEqual(HistoryEntry.objects.count(), 9)
+            self.assertEqual(set(map(str, self.store.request_ids())), set(ids[1:9]))
+
+            with CaptureQueriesContext(connection) as context:
+                self.store.set(ids[9])
+            self.assertEqual(HistoryEntry.objects.count(), 8)
+            self.assertEqual(set(map(str, self.store.request_ids())), set(ids[2:]))
+            self.assertFalse(
+                HistoryEntryPanel.objects.exclude(entry__in=ids[2:]).exists()
+            )
+            # The prune deletes by creation time rather than listing the ids
+            # to keep.
+            self.assertTrue(
+                all(ids[2] not in query["sql"] for query in context.captured_queries)
+            )
+
+    def test_save_panels_queries(self):
+        id1 = str(uuid.uuid4())
+        with CaptureQueriesContext(connection) as context:
+            self.store.save_panels(id1, {"panel1": {"a": 1}, "panel2": {"b": 2}})
+        writes = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        # One insert for the entry, one for the blobs of its panels' data, one
+        # update to count the references to them and one insert for all of
+        # its panels.
+        self.assertEqual(len(writes), 4)
+
+    def test_panel_rows(self):
+        id1 = str(uuid.uuid4())
+        self.store.save_panels(id1, {"panel1": {"a": 1}, "panel2": {"b": 2}})
+        self.store.save_panel(id1, "panel1", {"a": 2})
+        rows = dict(
+            HistoryEntryPanel.objects.filter(entry_id=id1).values_list(
+                "panel_id", "blob__data"
+            )
+        )
+        self.assertEqual(rows, {"panel1": '{"a": 2}', "panel2": '{"b": 2}'})
+        # The blob of the overwritten data was deleted.
+        self.assertEqual(HistoryEntryBlob.objects.count(), 2)
+        self.store.delete(id1)
+        self.assertFalse(HistoryEntryPanel.objects.filter(entry_id=id1).exists())
+        self.assertFalse(HistoryEntryBlob.objects.exists())
+
+    def test_identical_panels_are_stored_once(self):
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        for request_id in ids:
+            self.store.save_panels(
+                request_id,
+                {"settings": {"DEBUG": True}, "empty": {}, "other": {}},
+            )
+        refs = dict(HistoryEntryBlob.objects.values_list("data", "refs"))
+        self.assertEqual(refs, {'{"DEBUG": true}': 3, "{}": 6})
+
+        # A blob is kept until no panel references it.
+        self.store.delete(ids[0])
+        self.store.save_panel(ids[1], "settings", {"DEBUG": False})
+        refs = dict(HistoryEntryBlob.objects.values_list("data", "refs"))
+        self.assertEqual(refs, {'{"DEBUG": true}': 1, '{"DEBUG": false}': 1, "{}": 4})
+        self.assertEqual(self.store.panel(ids[2], "settings"), {"DEBUG": True})
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 1}):
+            self.store._cleanup_old_entries()
+        refs = dict(HistoryEntryBlob.objects.values_list("data", "refs"))
+        self.assertEqual(refs, {'{"DEBUG": true}': 1, "{}": 2})
+
+    def test_deleted_blob_is_created_again(self):
+        id1 = str(uuid.uuid4())
+        digest = store._digest(store.serialize({"a": 1}))
+        original_update_refs = self.store._update_refs
+
+        def update_refs(refs, sign):
+            # Simulate another request deleting the unused blob after it was
+            # found to exist, the first time only.
+            if not calls:
+                HistoryEntryBlob.objects.filter(digest=digest).delete()
+            calls.append(dict(refs))
+            return original_update_refs(refs, sign)
+
+        calls = []
+
+        HistoryEntryBlob.objects.create(digest=digest, data='{"a": 1}', refs=0)
+        with patch.object(self.store, "_update_refs", update_refs):
+            self.store.save_panel(id1, "panel", {"a": 1})
+        self.assertEqual(calls, [{digest: 1}, {digest: 1}])
+        self.assertEqual(HistoryEntryBlob.objects.get(digest=digest).refs, 1)
+        self.assertEqual(self.store.panel(id1, "panel"), {"a": 1})
+
     def test_update_panel(self):
         id1 = str(uuid.uuid4())
         self.store.save_panel(id1, "test.panel", {"original": True})
@@ -326,6 +702,105 @@ class DatabaseStoreTestCase(CommonStoreTestsMixin, TestCase):
         self.assertEqual(len(context.captured_queries), 1)
 
 
+class SQLiteStorePathTestCase(TestCase):
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"SQLITE_STORE_PATH": None})
+    def test_path_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            store.SQLiteStore.exists("foo")
+
+
+class SQLiteStoreTestCase(CommonStoreTestsMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.store = store.SQLiteStore
+        directory = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.path = os.path.join(directory, "djdt.sqlite3")
+        cls.enterClassContext(
+            patch.object(store.SQLiteStore, "_path", return_value=cls.path)
+        )
+
+    def tearDown(self) -> None:
+        self.store.clear()
+
+    def test_wal_mode(self):
+        self.store.set("foo")
+        with closing(sqlite3.connect(self.path)) as conn:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone(), ("wal",))
+
+    def test_file_permissions(self):
+        self.store.set("foo")
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_shared_between_connections(self):
+        self.store.save_panels("foo", {"panel1": {"a": 1}, "panel2": {"b": 2}})
+
+        # Another thread uses its own connection, like another process would.
+        results = {}
+
+        def worker():
+            results["ids"] = self.store.request_ids()
+            results["panels"] = dict(self.store.panels("foo"))
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(results["ids"], ["foo"])
+        self.assertEqual(results["panels"], {"panel1": {"a": 1}, "panel2": {"b": 2}})
+
+    def test_set_prunes_in_batches(self):
+        with (
+            self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 8}),
+            patch.object(self.store, "_requests_since_prune", 0),
+        ):
+            for i in range(9):
+                self.store.save_panel(f"id{i}", "test.panel", {"value": i})
+            # The surplus request is kept until a full batch of two is due.
+            self.assertEqual(self.store.request_ids(), [f"id{i}" for i in range(1, 9)])
+            self.assertTrue(self.store.exists("id0"))
+
+            self.store.save_panel("id9", "test.panel", {"value": 9})
+            self.assertEqual(self.store.request_ids(), [f"id{i}" for i in range(2, 10)])
+            self.assertFalse(self.store.exists("id0"))
+            self.assertEqual(self.store.panel("id1", "test.panel"), {})
+
+    def test_identical_panels_are_stored_once(self):
+        def blob_refs():
+            with closing(sqlite3.connect(self.path)) as conn:
+                return dict(conn.execute("SELECT data, refs FROM djdt_blob"))
+
+        for request_id in ("foo", "bar", "baz"):
+            self.store.save_panels(
+                request_id, {"settings": {"DEBUG": True}, "empty": {}, "other": {}}
+            )
+        self.assertEqual(blob_refs(), {'{"DEBUG": true}': 3, "{}": 6})
+
+        # A blob is kept until no panel references it.
+        self.store.delete("foo")
+        self.store.save_panel("bar", "settings", {"DEBUG": False})
+        self.assertEqual(
+            blob_refs(), {'{"DEBUG": true}': 1, '{"DEBUG": false}': 1, "{}": 4}
+        )
+        self.assertEqual(self.store.panel("baz", "settings"), {"DEBUG": True})
+        connection = self.store._connection()
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 1}), connection:
+            self.store._cleanup_old_entries(connection)
+        self.assertEqual(blob_refs(), {'{"DEBUG": true}': 1, "{}": 2})
+
+    def test_set_concurrent(self):
+        def worker(thread):
+            for i in range(10):
+                self.store.save_panel(f"{thread}-{i}", "test.panel", {"value": i})
+
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 100}):
+            threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(self.store.request_ids()), 80)
+
+
 @override_settings(
     DEBUG_TOOLBAR_CONFIG={
         "CACHES": {
@@ -346,6 +821,119 @@ class CacheStoreWithMemoryBackendTestCase(CommonStoreTestsMixin, TestCase):
     def tearDown(self) -> None:
         self.store.clear()
 
+    def test_set_prunes_in_batches(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 8}):
+            for i in range(9):
+                self.store.save_panel(f"id{i}", "test.panel", {"value": i})
+            # The surplus request is kept until a full batch of two is due.
+            self.assertEqual(self.store.request_ids(), [f"id{i}" for i in range(1, 9)])
+            self.assertEqual(self.store.panel("id0", "test.panel"), {"value": 0})
+
+            self.store.save_panel("id9", "test.panel", {"value": 9})
+            self.assertEqual(self.store.request_ids(), [f"id{i}" for i in range(2, 10)])
+            self.assertFalse(self.store.exists("id0"))
+            self.assertEqual(self.store.panel("id0", "test.panel"), {})
+            self.assertEqual(self.store.panel("id1", "test.panel"), {})
+
+    def test_set_reuses_slots(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 4}):
+            for i in range(20):
+                self.store.set(f"id{i}")
+            self.assertEqual(
+                self.store.request_ids(), [f"id{i}" for i in range(16, 20)]
+            )
+            cache = self.store._get_cache()
+            slots = cache.get_many(self.store._slot_keys())
+            # The slots wrapped around and only hold the kept requests.
+            self.assertEqual(len(slots), 4)
+            self.assertIn((20, "id19"), slots.values())
+
+    def test_set_when_ring_is_occupied(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 100}):
+            for i in range(156):
+                self.store.set(f"old{i}")
+            ring_size = self.store._slot_count()
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 4}):
+            cache = self.store._get_cache()
+            # Every slot of the smaller ring holds one of the older requests.
+            self.assertEqual(len(cache.get_many(self.store._slot_keys())), 6)
+            for i in range(3):
+                self.store.set(f"new{i}")
+            # The old requests in the slots that were reused or pruned and in
+            # the slots outside of the smaller ring were deleted.
+            self.assertEqual(
+                self.store.request_ids(), ["old149", "new0", "new1", "new2"]
+            )
+            self.assertEqual(cache.get_many(self.store._slot_keys(6, ring_size)), {})
+            self.assertFalse(self.store.exists("old155"))
+            self.assertFalse(self.store.exists("old154"))
+
+    def test_set_when_every_slot_is_newer(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 4}):
+            cache = self.store._get_cache()
+            slot_keys = self.store._slot_keys()
+            cache.set_many(
+                {key: (100 + i, f"id{i}") for i, key in enumerate(slot_keys)}, None
+            )
+            cache.set(self.store._request_key("id0"), [], None)
+            cache.set(self.store._counter_key(), 0, None)
+            self.store.set("new")
+            # The oldest slot was overwritten.
+            self.assertEqual(cache.get(slot_keys[0])[1], "new")
+            self.assertFalse(self.store.exists("id0"))
+
+    def test_set_without_counter(self):
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 4}):
+            for i in range(3):
+                self.store.set(f"id{i}")
+            cache = self.store._get_cache()
+            cache.delete(self.store._counter_key())
+            self.store.set("id3")
+            self.assertEqual(cache.get(self.store._counter_key()), 4)
+            self.assertEqual(self.store.request_ids(), ["id0", "id1", "id2", "id3"])
+
+    def test_update_panels_when_request_is_deleted(self):
+        bar_id = self._get_request_id("bar")
+        self.store.save_panel(bar_id, "panel1", {"a": 1})
+        cache = self.store._get_cache()._cache
+        set_many = cache.set_many
+
+        def delete_while_writing(data, timeout):
+            set_many(data, timeout)
+            self.store.delete(bar_id)
+
+        with patch.object(cache, "set_many", side_effect=delete_while_writing):
+            self.assertFalse(self.store.update_panels(bar_id, {"panel2": {"b": 2}}))
+        self.assertFalse(self.store.exists(bar_id))
+        self.assertIsNone(cache.get(self.store._panel_key(bar_id, "panel2")))
+
+    def test_panel_keys(self):
+        self.store.save_panels("test", {"panel1": {"a": 1}, "panel2": {"b": 2}})
+        cache = self.store._get_cache()
+        self.assertEqual(
+            cache.get(self.store._request_key("test")), ["panel1", "panel2"]
+        )
+        self.assertEqual(cache.get(self.store._panel_key("test", "panel2")), '{"b": 2}')
+        self.store.save_panel("test", "panel3", {"c": 3})
+        self.assertEqual(
+            cache.get(self.store._request_key("test")), ["panel1", "panel2", "panel3"]
+        )
+        self.store.delete("test")
+        self.assertIsNone(cache.get(self.store._panel_key("test", "panel1")))
+
+    def test_set_concurrent(self):
+        def worker(thread):
+            for i in range(10):
+                self.store.set(f"{thread}-{i}")
+
+        with self.settings(DEBUG_TOOLBAR_CONFIG={"RESULTS_CACHE_SIZE": 100}):
+            threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(self.store.request_ids()), 80)
+
     def test_custom_cache_backend(self):
         with self.settings(
             DEBUG_TOOLBAR_CONFIG={
@@ -488,7 +1076,7 @@ class CacheStoreWithDatabaseBackendTestCase(CommonStoreTestsMixin, TestCase):
             cache_queries = [
                 q
                 for q in sql_panel._queries[initial_query_count:]
-                if "test_cache_store_table" in q.get("sql", "").lower()
+                if "test_cache_store_table" in q["raw_sql"].lower()
             ]
 
             self.assertEqual(
@@ -522,6 +1110,8 @@ class CacheStoreWithDatabaseBackendTestCase(CommonStoreTestsMixin, TestCase):
         sql_panel.enable_instrumentation()
 
         try:
+            # Store a request first, so the counter of request ids exists.
+            self.store.set("first_req")
             # Record the initial number of SQL queries
             initial_query_count = len(sql_panel._queries)
 
@@ -533,8 +1123,10 @@ class CacheStoreWithDatabaseBackendTestCase(CommonStoreTestsMixin, TestCase):
             cache_queries = [
                 q
                 for q in sql_panel._queries[initial_query_count:]
-                if "test_cache_store_table" in q.get("sql", "").lower()
+                if "test_cache_store_table" in q["raw_sql"].lower()
             ]
-            self.assertEqual(len(cache_queries), 4)
+            # Adding the request, incrementing the counter and claiming the
+            # next slot. This doesn't depend on RESULTS_CACHE_SIZE.
+            self.assertEqual(len(cache_queries), 10)
         finally:
             sql_panel.disable_instrumentation()
@@ -1,14 +1,27 @@
+import importlib.util
+import os
+import tempfile
 import unittest
 
 from django.http import QueryDict
+from django.template import Context, Engine, Node
 from django.test import override_settings
 
 import debug_toolbar.utils
 from debug_toolbar.utils import (
+    AdaptiveStackTraces,
+    StackTraceTree,
+    capture_stack_trace,
+    capture_template_info,
+    clear_stack_trace_caches,
+    disable_template_tracking,
+    enable_template_tracking,
     get_name_from_obj,
     get_stack,
     get_stack_trace,
     render_stacktrace,
+    resolve_stack_trace,
+    resolve_template_info,
     sanitize_and_sort_request_vars,
     tidy_stacktrace,
 )
@@ -81,6 +94,87 @@ class StackTraceTestCase(unittest.TestCase):
         self.assertEqual(stack_trace[-1][0], __file__)
         self.assertEqual(stack_trace[-1][2], "test_get_stack_trace_skip")
 
+    def test_capture_stack_trace(self):
+        # Both stack traces are taken on the same line so they match exactly.
+        trace, stack_trace = capture_stack_trace(), get_stack_trace()
+        self.assertIs(trace[-1][0], self.test_capture_stack_trace.__code__)
+        self.assertEqual(resolve_stack_trace(trace), stack_trace)
+        self.assertEqual(stack_trace[-1][0], __file__)
+        self.assertEqual(stack_trace[-1][2], "test_capture_stack_trace")
+        self.assertIn("capture_stack_trace()", stack_trace[-1][3])
+        # Resolved stack traces are returned unchanged.
+        self.assertIs(resolve_stack_trace(stack_trace), stack_trace)
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"HIDE_IN_STACKTRACES": ["tests"]})
+    def test_resolve_stack_trace_hides_modules(self):
+        stack_trace = resolve_stack_trace(capture_stack_trace())
+        self.assertTrue(stack_trace)
+        self.assertNotIn(__file__, [frame[0] for frame in stack_trace])
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"ENABLE_STACKTRACES": False})
+    def test_capture_stack_trace_disabled(self):
+        self.assertEqual(capture_stack_trace(), [])
+
+    def test_source_cache_follows_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "djdt_source_cache_module.py")
+            with open(path, "w") as f:
+                f.write("def trace(capture):\n    return capture()  # before\n")
+            spec = importlib.util.spec_from_file_location(
+                "djdt_source_cache_module", path
+            )
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            trace = module.trace(capture_stack_trace)
+            self.addCleanup(clear_stack_trace_caches)
+
+            self.assertIn("# before", resolve_stack_trace(trace)[-1][3])
+            with open(path, "w") as f:
+                f.write("def trace(capture):\n    return capture()  # after\n")
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            # The source is cached across requests until the file changes.
+            clear_stack_trace_caches()
+            self.assertIn("# after", resolve_stack_trace(trace)[-1][3])
+
+    @override_settings(DEBUG_TOOLBAR_CONFIG={"HIDE_IN_STACKTRACES": []})
+    def test_adaptive_stack_traces(self):
+        stack_traces = AdaptiveStackTraces()
+        traces = []
+        for _ in range(3):
+            traces.append(stack_traces.capture("key"))
+        single = stack_traces.capture("key")
+        forced = stack_traces.capture("key", force=True)
+
+        # The repeated calls share a full stack trace, the first one included.
+        self.assertIs(traces[0], traces[1])
+        self.assertIs(traces[0], traces[2])
+        self.assertEqual(resolve_stack_trace(traces[0])[-1][2], self._testMethodName)
+        self.assertGreater(len(traces[0]), 1)
+        # A call from another line only gets its caller frame.
+        self.assertEqual(len(single), 1)
+        self.assertEqual(resolve_stack_trace(single)[0][2], self._testMethodName)
+        self.assertGreater(len(forced), 1)
+
+    def test_stack_trace_tree(self):
+        outer = ("a.py", 1, "outer", "inner()", None)
+        inner = ("a.py", 5, "inner", "query()", None)
+        other = ("b.py", 2, "other", "query()", None)
+        tree = StackTraceTree()
+        trace_id = tree.add([outer, inner])
+        self.assertEqual(tree.add([outer, inner]), trace_id)
+        other_id = tree.add([outer, other])
+        self.assertNotEqual(other_id, trace_id)
+        self.assertIsNone(tree.add([]))
+        # The outermost frame is shared by both stack traces.
+        self.assertEqual(len(tree.frames), 3)
+        self.assertEqual(len(tree.nodes), 3)
+
+        tree = StackTraceTree.from_dict(tree.as_dict())
+        self.assertEqual(tree.get(trace_id), [outer, inner])
+        self.assertEqual(tree.get(other_id), [outer, other])
+        self.assertEqual(tree.get(None), [])
+
     def test_deprecated_functions(self):
         with self.assertWarns(DeprecationWarning):
             stack = get_stack()
@@ -113,6 +207,58 @@ class StackTraceTestCase(unittest.TestCase):
         self.assertIn("test_locals_value_2", rendered_stack_2)
 
 
+class TemplateInfoTestCase(unittest.TestCase):
+    def test_capture_template_info(self):
+        self.assertIsNone(capture_template_info())
+
+        captured = []
+        template = Engine(debug=True).from_string(
+            "{% if True %}\n  {{ value }}\n{% endif %}\n"
+        )
+        enable_template_tracking(self)
+        try:
+            template.render(
+                Context({"value": lambda: captured.append(capture_template_info())})
+            )
+        finally:
+            disable_template_tracking(self)
+        self.assertIsNone(capture_template_info())
+
+        (template_info,) = captured
+        self.assertEqual(template_info[0], template)
+        template_info = resolve_template_info(template_info)
+        self.assertEqual(template_info["name"], "<unknown source>")
+        highlighted = [line for line in template_info["context"] if line["highlight"]]
+        self.assertEqual(
+            highlighted, [{"num": 2, "content": "  {{ value }}\n", "highlight": True}]
+        )
+        # Resolved template information is returned unchanged.
+        self.assertIs(resolve_template_info(template_info), template_info)
+
+    def test_template_tracking(self):
+        original = Node.render_annotated
+        # Nodes are left alone unless the toolbar instruments a request.
+        self.assertIs(original, debug_toolbar.utils._original_render_annotated)
+        captured = []
+        template = Engine(debug=True).from_string("{% if True %}{{ value }}{% endif %}")
+        context = Context({"value": lambda: captured.append(capture_template_info())})
+        template.render(context)
+        self.assertEqual(captured, [None])
+
+        first, second = object(), object()
+        enable_template_tracking(first)
+        enable_template_tracking(first)
+        enable_template_tracking(second)
+        self.assertIsNot(Node.render_annotated, original)
+        disable_template_tracking(first)
+        # The patch stays until every owner has disabled it.
+        self.assertIsNot(Node.render_annotated, original)
+        disable_template_tracking(second)
+        self.assertIs(Node.render_annotated, original)
+        disable_template_tracking(second)
+        self.assertIs(Node.render_annotated, original)
+
+
 class SanitizeAndSortRequestVarsTestCase(unittest.TestCase):
     """Tests for the sanitize_and_sort_request_vars function."""
 
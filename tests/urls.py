@@ -17,6 +17,7 @@ urlpatterns = [
     path("non_ascii_request/", views.regular_view, {"title": NonAsciiRepr()}),
     path("new_user/", views.new_user),
     path("execute_sql/", views.execute_sql),
+    path("execute_duplicated_sql/", views.execute_duplicated_sql),
     path("execute_json_sql/", views.execute_json_sql),
     path("execute_union_sql/", views.execute_union_sql),
     path("execute_binary_sql/", views.execute_binary_sql),
@@ -17,6 +17,12 @@ def execute_sql(request):
     return render(request, "base.html")
 
 
+def execute_duplicated_sql(request):
+    for _ in range(3):
+        list(User.objects.all())
+    return render(request, "base.html")
+
+
 def execute_binary_sql(request):
     list(Binary.objects.filter(field=b"\x01\x02\x03"))
     return render(request, "base.html")